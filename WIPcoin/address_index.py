@@ -0,0 +1,61 @@
+class AddressIndex:
+    """Indexes where every address occurs in the chain, so the history of an address doesn't need a chain scan.
+
+    Every entry is a (height, kind, position) tuple: the height of the block, 'transaction' or 'chipsaction'
+    and the position of the entry in the block's transactions or chipsactions. The entries of an address are
+    kept in chain order, so appending a block and rolling back the last block only touch the end of the lists.
+
+    Attributes:
+        :entries: The entries of every address (oldest first).
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def _addresses(self, block):
+        for kind, txs in (('transaction', block.transactions), ('chipsaction', block.chipsactions)):
+            for position, tx in enumerate(txs):
+                yield tx.sender, (block.index, kind, position)
+                if tx.recipient != tx.sender:
+                    yield tx.recipient, (block.index, kind, position)
+
+    def apply_block(self, block):
+        """Add the transactions and chipsactions of a block which was appended to the chain.
+
+        Arguments:
+            :block: The block that was appended to the chain.
+        """
+        for address, entry in self._addresses(block):
+            self.entries.setdefault(address, []).append(entry)
+
+    def revert_block(self, block):
+        """Remove the transactions and chipsactions of the last block (which was rolled back)."""
+        for address, entry in self._addresses(block):
+            entries = self.entries.get(address)
+            if entries:
+                entries.pop()
+                if len(entries) == 0:
+                    del self.entries[address]
+
+    def rebuild(self, chain):
+        """Rebuild the whole index from a chain."""
+        self.entries = {}
+        for block in chain:
+            self.apply_block(block)
+
+    def count(self, address):
+        """Return the number of entries of an address."""
+        return len(self.entries.get(address, ()))
+
+    def history(self, address, before=None, limit=100):
+        """Return up to limit entries of an address, newest first, and the cursor of the next (older) page.
+
+        Arguments:
+            :address: The address whose entries should be returned.
+            :before: The cursor of the page (only entries before it are returned, defaults to the newest entry).
+            :limit: The maximum number of entries.
+        """
+        entries = self.entries.get(address, [])
+        end = len(entries) if before is None else min(max(before, 0), len(entries))
+        start = max(end - limit, 0)
+        return entries[start:end][::-1], start if start > 0 else None
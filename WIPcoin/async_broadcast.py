@@ -0,0 +1,194 @@
+import asyncio
+import threading
+from time import time
+
+import aiohttp
+
+from broadcast import PEER_QUEUE_SIZE, PEER_TIMEOUT, PEER_RETRIES, RETRY_BACKOFF, BROADCAST_MESSAGES, BROADCAST_REQUEST_SECONDS
+from codec import BINARY_CONTENT_TYPE
+
+
+class AsyncPeerChannel:
+    """Sends messages to a single peer from a task on the event loop, in the order in which they were queued.
+
+    Attributes:
+        :node: The peer node (host:port).
+        :sent: The number of messages which were delivered.
+        :failed: The number of messages which couldn't be delivered (after all retries).
+        :dropped: The number of messages which were dropped because the queue was full.
+        :last_latency: The duration of the last request in seconds.
+        :avg_latency: The exponential moving average of the request durations in seconds.
+        :binary: Whether the peer accepts binary encoded payloads.
+    """
+
+    def __init__(self, node, session, on_response, queue_size=PEER_QUEUE_SIZE, retries=PEER_RETRIES):
+        self.node = node
+        self.retries = retries
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.last_latency = None
+        self.avg_latency = None
+        self.binary = True
+        self.__session = session
+        self.__on_response = on_response
+        self.__queue = asyncio.Queue(queue_size)
+        self.__task = asyncio.get_running_loop().create_task(self._run())
+
+    def queue_depth(self):
+        """Return the number of messages waiting to be sent."""
+        return self.__queue.qsize()
+
+    def send(self, path, payload, binary=None):
+        """Queue a message (on the event loop), returns False if it had to be dropped because the peer falls behind."""
+        try:
+            self.__queue.put_nowait((path, payload, binary))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            BROADCAST_MESSAGES.inc(path=path, result='dropped')
+            print('Broadcast to {} dropped, queue is full'.format(self.node))
+            return False
+
+    def close(self):
+        """Stop the task (messages which are still queued are discarded)."""
+        self.__task.cancel()
+
+    async def _request(self, url, payload, binary):
+        if binary is not None and self.binary:
+            async with self.__session.post(url, data=binary, headers={'Content-Type': BINARY_CONTENT_TYPE}) as response:
+                if response.status != 415:
+                    return response.status
+            # The peer only understands JSON
+            self.binary = False
+        async with self.__session.post(url, json=payload) as response:
+            return response.status
+
+    async def _post(self, path, payload, binary=None):
+        url = 'http://{}{}'.format(self.node, path)
+        for attempt in range(self.retries + 1):
+            start = time()
+            try:
+                status = await self._request(url, payload, binary)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt < self.retries:
+                    await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+                continue
+            latency = time() - start
+            BROADCAST_REQUEST_SECONDS.observe(latency, path=path)
+            self.last_latency = latency
+            self.avg_latency = latency if self.avg_latency is None else 0.8 * self.avg_latency + 0.2 * latency
+            return status
+        return None
+
+    async def _run(self):
+        while True:
+            path, payload, binary = await self.__queue.get()
+            status = await self._post(path, payload, binary)
+            if status is None:
+                self.failed += 1
+                BROADCAST_MESSAGES.inc(path=path, result='failed')
+                continue
+            self.sent += 1
+            BROADCAST_MESSAGES.inc(path=path, result='sent')
+            if self.__on_response is not None:
+                try:
+                    # The handler may wait for the blockchain's lock, so it mustn't run on the event loop
+                    await asyncio.get_running_loop().run_in_executor(None, self.__on_response, self.node, path, status)
+                except Exception as e:
+                    print('Handling the response of {} failed: {}'.format(self.node, e))
+
+
+class AsyncBroadcaster:
+    """Fans messages out to all peer nodes with asynchronous HTTP requests on an event loop.
+
+    It has the interface of the threaded Broadcaster, so the Blockchain can call it from any thread: the messages
+    are handed over to the event loop and sent by one task per peer over a shared connection pool.
+
+    Attributes:
+        :loop: The event loop which sends the messages.
+        :queue_size: The number of messages which may wait for a single peer.
+        :timeout: The number of seconds we wait for a peer to answer.
+        :retries: How often a message is retried after a connection error or timeout.
+    """
+
+    def __init__(self, loop, on_response=None, queue_size=PEER_QUEUE_SIZE, timeout=PEER_TIMEOUT, retries=PEER_RETRIES):
+        self.loop = loop
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retries = retries
+        self.__on_response = on_response
+        self.__session = None
+        self.__channels = {}
+        self.__lock = threading.Lock()
+        self.__closed = None
+
+    def _channel(self, node):
+        if self.__session is None:
+            self.__session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        with self.__lock:
+            channel = self.__channels.get(node)
+            if channel is None:
+                channel = AsyncPeerChannel(node, self.__session, self.__on_response, self.queue_size, self.retries)
+                self.__channels[node] = channel
+            return channel
+
+    def _send(self, path, payload, nodes, binary):
+        for node in nodes:
+            self._channel(node).send(path, payload, binary)
+
+    def broadcast(self, path, payload, nodes, binary=None):
+        """Queue a message for every given peer node and return immediately (safe to call from any thread).
+
+        Arguments:
+            :path: The path of the endpoint on the peers (e.g. '/broadcast-transaction').
+            :payload: The JSON-serializable body of the request.
+            :nodes: The peer nodes the message is sent to.
+            :binary: The binary encoded body (see the codec module) which is sent to peers that accept it.
+        """
+        self.loop.call_soon_threadsafe(self._send, path, payload, list(nodes), binary)
+
+    def _remove_peer(self, node):
+        with self.__lock:
+            channel = self.__channels.pop(node, None)
+        if channel is not None:
+            channel.close()
+
+    def remove_peer(self, node):
+        """Stop sending messages to a peer node."""
+        self.loop.call_soon_threadsafe(self._remove_peer, node)
+
+    async def _close(self):
+        with self.__lock:
+            channels = list(self.__channels.values())
+            self.__channels = {}
+        for channel in channels:
+            channel.close()
+        if self.__session is not None:
+            await self.__session.close()
+
+    def close(self):
+        """Stop all peer tasks and close the connection pool (safe to call from any thread).
+
+        Returns a concurrent.futures.Future which is done once the connection pool is closed.
+        """
+        if self.__closed is None:
+            self.__closed = asyncio.run_coroutine_threadsafe(self._close(), self.loop)
+        return self.__closed
+
+    def stats(self):
+        """Return the total queue depth and the delivery counters and latencies per peer."""
+        with self.__lock:
+            channels = list(self.__channels.values())
+        return {
+            'queue_depth': sum(channel.queue_depth() for channel in channels),
+            'peers': {channel.node: {
+                'queue_depth': channel.queue_depth(),
+                'sent': channel.sent,
+                'failed': channel.failed,
+                'dropped': channel.dropped,
+                'last_latency': channel.last_latency,
+                'avg_latency': channel.avg_latency,
+                'binary': channel.binary
+            } for channel in channels}
+        }
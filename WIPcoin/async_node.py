@@ -0,0 +1,155 @@
+"""An asyncio node server (aiohttp) with the same routes as node.py, the requests are handled by node_api.
+
+The proof of work runs in its own executor and every other handler (which may verify signatures or wait for the
+lock of the Blockchain) runs in the default executor, so the event loop keeps serving requests while a block is
+mined. Broadcasts to the peers are sent with asynchronous HTTP requests (see async_broadcast).
+
+Usage: python async_node.py -p 5000
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from aiohttp import web
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from wallet import Wallet
+from async_broadcast import AsyncBroadcaster
+from background_miner import MINE_THRESHOLD, MINE_INTERVAL
+from utility.metrics import metrics
+from codec import BINARY_CONTENT_TYPE
+from node_api import MINING_HANDLERS, NodeApi, NodeRequest, RawResponse, REQUEST_SECONDS, ROUTES
+
+routes = web.RouteTableDef()
+# The proof of work gets its own thread, so it never occupies the threads which serve the other requests
+mining_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mining')
+# The broadcasters of the blockchains which were created (the server waits until they're closed when it shuts down)
+broadcasters = []
+# The request handlers of the node (set up when the server starts)
+api = None
+# The threshold and interval of the background miner which is started with the node (None to mine by POST /mine)
+background_mining = None
+
+
+async def send(request, result):
+    """Send the result of a handler (see node_api), streamed content is pulled chunk by chunk in the executor."""
+    if not isinstance(result, RawResponse):
+        body, status = result
+        return web.json_response(body, status=status)
+    if not result.streamed():
+        content = result.content.encode('utf8') if isinstance(result.content, str) else result.content
+        return web.Response(body=content, status=result.status, headers={'Content-Type': result.content_type})
+    response = web.StreamResponse(status=result.status)
+    response.content_type = result.content_type
+    await response.prepare(request)
+    loop = asyncio.get_running_loop()
+    while True:
+        chunk = await loop.run_in_executor(None, next, result.content, None)
+        if chunk is None:
+            break
+        await response.write(chunk)
+    await response.write_eof()
+    return response
+
+
+def add_route(method, path, handler_name):
+    """Serve a route of node_api.ROUTES with the NodeApi handler of the given name."""
+    executor = mining_executor if handler_name in MINING_HANDLERS else None
+
+    async def handle(request):
+        node_request = NodeRequest(request.query, await request.read(), request.content_type == BINARY_CONTENT_TYPE,
+                                   parse_accept_header(request.headers.get('Accept'), MIMEAccept), request.match_info)
+        result = await asyncio.get_running_loop().run_in_executor(executor, getattr(api, handler_name), node_request)
+        return await send(request, result)
+    routes.route(method, path)(handle)
+
+
+@web.middleware
+async def cors(request, handler):
+    response = await handler(request)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+@web.middleware
+async def request_timer(request, handler):
+    if not metrics.enabled:
+        return await handler(request)
+    start = perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else 'unmatched'
+        REQUEST_SECONDS.observe(perf_counter() - start, route=route, method=request.method, status=status)
+
+
+@routes.get('/')
+async def get_node_ui(request):
+    return web.FileResponse('ui/node.html')
+
+
+@routes.get('/network')
+async def get_network_ui(request):
+    return web.FileResponse('ui/network.html')
+
+
+for method, path, handler_name in ROUTES:
+    add_route(method, path, handler_name)
+
+
+async def start_node(app):
+    loop = asyncio.get_running_loop()
+
+    def broadcaster_factory(on_response):
+        # The broadcasters of replaced blockchains were closed before, forget the ones which are done closing
+        broadcasters[:] = [broadcaster for broadcaster in broadcasters if not broadcaster.close().done()]
+        broadcaster = AsyncBroadcaster(loop, on_response)
+        broadcasters.append(broadcaster)
+        return broadcaster
+    api.broadcaster_factory = broadcaster_factory
+    await loop.run_in_executor(None, api.set_up_blockchain)
+    if background_mining is not None:
+        api.start_background_mining(*background_mining)
+
+
+async def stop_node(app):
+    await asyncio.get_running_loop().run_in_executor(None, api.close)
+    for broadcaster in broadcasters:
+        await asyncio.wrap_future(broadcaster.close())
+    mining_executor.shutdown(wait=False)
+
+
+def create_app():
+    """Create the aiohttp application (api has to be set up before it's started)."""
+    app = web.Application(middlewares=[request_timer, cors])
+    app.add_routes(routes)
+    app.on_startup.append(start_node)
+    app.on_cleanup.append(stop_node)
+    return app
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    parser = ArgumentParser()
+    parser.add_argument('-p', '--port', type=int, default=5000)
+    parser.add_argument('--background-mining', action='store_true', help='Mine blocks in a background thread')
+    parser.add_argument('--mine-threshold', type=int, default=MINE_THRESHOLD,
+                        help='The number of open transactions and chipsactions at which a round starts')
+    parser.add_argument('--mine-interval', type=float, default=MINE_INTERVAL,
+                        help='The number of seconds after which a round starts even below the threshold')
+    parser.add_argument('--no-metrics', action='store_true', help='Don\'t record metrics (and disable /metrics)')
+    args = parser.parse_args()
+    metrics.enabled = not args.no_metrics
+    api = NodeApi(Wallet(args.port), args.port)
+    if args.background_mining:
+        background_mining = (args.mine_threshold, args.mine_interval)
+    web.run_app(create_app(), host='0.0.0.0', port=args.port)
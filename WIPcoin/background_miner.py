@@ -0,0 +1,162 @@
+import threading
+from time import time
+
+# The number of open transactions and chipsactions at which a mining round starts
+MINE_THRESHOLD = 1
+# The number of seconds after which a round starts even below the threshold (None to wait for the threshold only)
+MINE_INTERVAL = None
+# The number of seconds a candidate block is mined at least before new transactions make it get rebuilt
+REBUILD_DELAY = 1.0
+
+
+class BackgroundMiner:
+    """Mines blocks in a background thread instead of a blocking /mine request.
+
+    A round starts when the open transactions and chipsactions reach the threshold, when the interval passed since
+    the last round or when it's triggered. The candidate block is rebuilt (at most every rebuild_delay seconds) if new
+    transactions or chipsactions arrive while its proof is searched. A block received from a peer cancels the round
+    (see Blockchain.add_block), the next round is mined on top of the new tip.
+
+    Attributes:
+        :blockchain: The blockchain for which blocks are mined.
+        :threshold: The number of open transactions and chipsactions at which a round starts (0 to disable).
+        :interval: The number of seconds after which a round starts even below the threshold (None to disable).
+        :rebuild_delay: The number of seconds a candidate is mined at least before it's rebuilt.
+        :rounds: The number of started mining rounds.
+        :blocks_mined: The number of blocks which were mined.
+        :rebuilds: The number of rounds which were cancelled to rebuild the candidate.
+        :last_block: The index, hash and number of transactions and chipsactions of the last mined block.
+        :last_result: The result of the last round ('mined', 'cancelled', 'rebuilt' or 'failed').
+    """
+
+    def __init__(self, blockchain, threshold=MINE_THRESHOLD, interval=MINE_INTERVAL, rebuild_delay=REBUILD_DELAY):
+        self.blockchain = blockchain
+        self.threshold = threshold
+        self.interval = interval
+        self.rebuild_delay = rebuild_delay
+        self.rounds = 0
+        self.blocks_mined = 0
+        self.rebuilds = 0
+        self.last_block = None
+        self.last_result = None
+        self.__lock = threading.Lock()
+        self.__wake = threading.Event()
+        self.__stopped = False
+        self.__triggered = False
+        self.__round_started = None
+        self.__last_round = time()
+        self.__rebuild_round = None
+        self.__rebuild_pending = False
+        self.__thread = None
+        blockchain.add_open_listener(self.notify)
+
+    def start(self):
+        """Start the background thread."""
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self._run, name='background-miner', daemon=True)
+            self.__thread.start()
+
+    def stop(self):
+        """Stop the background thread (a running round is cancelled)."""
+        self.__stopped = True
+        self.__wake.set()
+        self.blockchain.cancel_mining()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def trigger(self):
+        """Start a round right away (or right after the running one)."""
+        self.__triggered = True
+        self.__wake.set()
+
+    def notify(self):
+        """Handle a new open transaction or chipsaction (called by the blockchain while it holds its write lock)."""
+        with self.__lock:
+            mining_round = self.rounds if self.__round_started is not None else None
+            if mining_round is None or self.__rebuild_round == mining_round:
+                self.__wake.set()
+                return
+            # Rebuild the candidate at most once per round and not before it was mined for rebuild_delay seconds
+            self.__rebuild_round = mining_round
+            delay = max(self.rebuild_delay - (time() - self.__round_started), 0)
+        timer = threading.Timer(delay, self._rebuild, (mining_round,))
+        timer.daemon = True
+        timer.start()
+
+    def _rebuild(self, mining_round):
+        with self.__lock:
+            if self.rounds != mining_round or self.__round_started is None:
+                return
+            self.__rebuild_pending = True
+        self.blockchain.cancel_mining()
+
+    def _should_mine(self):
+        if self.__triggered or self.__rebuild_pending:
+            return True
+        if self.threshold > 0 and self.blockchain.count_open() >= self.threshold:
+            return True
+        return self.interval is not None and time() - self.__last_round >= self.interval
+
+    def _wait_time(self):
+        if self.interval is None:
+            return None
+        return max(self.interval - (time() - self.__last_round), 0)
+
+    def _run(self):
+        while not self.__stopped:
+            if self.blockchain.resolve_conflicts:
+                # A peer announced a longer chain, mining on our tip would be wasted
+                self.blockchain.resolve()
+            if not self._should_mine():
+                self.__wake.wait(self._wait_time())
+                self.__wake.clear()
+                continue
+            with self.__lock:
+                self.__triggered = False
+                self.__rebuild_pending = False
+                self.rounds += 1
+                self.__round_started = time()
+            block = self.blockchain.mine_block()
+            with self.__lock:
+                self.__round_started = None
+                self.__last_round = time()
+                if block is not None:
+                    self.blocks_mined += 1
+                    self.last_block = {
+                        'index': block.index,
+                        'hash': block.hash,
+                        'transactions': len(block.transactions),
+                        'chipsactions': len(block.chipsactions)
+                    }
+                    self.last_result = 'mined'
+                elif self.__rebuild_pending:
+                    self.rebuilds += 1
+                    self.last_result = 'rebuilt'
+                else:
+                    stats = self.blockchain.get_mining_stats()
+                    self.last_result = 'cancelled' if stats is not None and stats['cancelled'] else 'failed'
+            if block is None and self.blockchain.public_key is None:
+                # Without a wallet nothing can be mined, don't spin until the next trigger
+                self.__wake.wait(self._wait_time())
+                self.__wake.clear()
+
+    def status(self):
+        """Return the state of the miner, its counters and the stats of the last proof of work."""
+        with self.__lock:
+            round_started = self.__round_started
+            status = {
+                'running': self.__thread is not None and not self.__stopped,
+                'mining': round_started is not None,
+                'round_seconds': time() - round_started if round_started is not None else None,
+                'rounds': self.rounds,
+                'blocks_mined': self.blocks_mined,
+                'rebuilds': self.rebuilds,
+                'last_block': self.last_block,
+                'last_result': self.last_result,
+                'threshold': self.threshold,
+                'interval': self.interval
+            }
+        status['open'] = self.blockchain.count_open()
+        status['last_proof_of_work'] = self.blockchain.get_mining_stats()
+        return status
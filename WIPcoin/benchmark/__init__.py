@@ -0,0 +1 @@
+"""Benchmarks for the node (run them from the WIPcoin directory, e.g. python -m benchmark.memory)."""
@@ -0,0 +1,143 @@
+"""Generates valid synthetic chains (signed transactions and chipsactions, real proofs of work) for the benchmarks.
+
+Creating RSA keys is the slowest part of the setup, so the keys of the participants are created once and kept in a
+cache file which later runs reuse. Every private key is imported once and signs all payloads of its participant.
+"""
+
+import binascii
+import hashlib as hl
+import json
+import os
+import random
+
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+
+from block import Block
+from blockchain import MINING_REWARD, reward_transaction
+from chipsaction import Chipsaction
+from miner import search_range
+from transaction import Transaction
+from utility.difficulty import DEFAULT_DIFFICULTY, TARGET_BLOCK_TIME, target_for
+from utility.hash_util import LEGACY_BLOCK_VERSION
+from wallet import Wallet
+
+# The file in which the keys of the participants are cached between runs (it holds private keys, so it's kept in
+# the user's own cache directory and only the user may read it)
+KEY_CACHE_PATH = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                              'wipcoin', 'benchmark-keys.json')
+# The number of nonces searched per call while a proof of work is generated
+_PROOF_CHUNK = 100000
+
+
+def load_wallets(count, path=KEY_CACHE_PATH):
+    """Return count wallets with keys, missing keys are created and added to the cache file.
+
+    Arguments:
+        :count: The number of wallets.
+        :path: The cache file of the keys (None to always create new keys).
+    """
+    keys = []
+    if path is not None:
+        try:
+            with open(path, mode='r') as f:
+                keys = json.load(f)
+        except (IOError, ValueError):
+            keys = []
+    wallets = []
+    for index in range(count):
+        wallet = Wallet('benchmark-{}'.format(index))
+        if index < len(keys):
+            wallet.private_key, wallet.public_key = keys[index]
+        else:
+            wallet.create_keys()
+            keys.append([wallet.private_key, wallet.public_key])
+        wallets.append(wallet)
+    if path is not None and len(keys) > 0:
+        _save_keys(path, keys)
+    return wallets
+
+
+def _save_keys(path, keys):
+    """Write the key cache readable for the current user only (the file is replaced atomically)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    # The mode applies when the file is created, so the keys are never readable for others
+    with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), mode='w') as f:
+        json.dump(keys, f)
+    os.replace(tmp_path, path)
+
+
+def _sign(signer, digest):
+    return binascii.hexlify(signer.sign(digest)).decode('ascii')
+
+
+def find_proof(block):
+    """Return a valid proof of work for the header of a block template (searched in this process)."""
+    prefix_state = hl.sha256(block.header_prefix())
+    target = target_for(block.difficulty)
+    start = 0
+    while True:
+        proof, _ = search_range(prefix_state, target, start, start + _PROOF_CHUNK)
+        if proof is not None:
+            return proof
+        start += _PROOF_CHUNK
+
+
+def generate_chain(height, transactions=10, chipsactions=5, participants=20, places=5, difficulty=DEFAULT_DIFFICULTY,
+                   seed=0, wallets=None):
+    """Generate a valid chain and return (blocks, wallets).
+
+    The first blocks pay their mining reward to the participants in turn, from then on the participants send each
+    other coins and chips. Every amount is unique, so no two transactions share a txid. The timestamps are
+    TARGET_BLOCK_TIME seconds apart, so the difficulty never changes.
+
+    Arguments:
+        :height: The number of blocks after the genesis block.
+        :transactions: The number of signed transactions per block (besides the mining reward).
+        :chipsactions: The number of chipsactions per block.
+        :participants: The number of wallets which send and receive.
+        :places: The number of places the chipsactions are sent to.
+        :difficulty: The difficulty of the proofs of work.
+        :seed: The seed of the random choices.
+        :wallets: The wallets of the participants (loaded with load_wallets by default).
+    """
+    rng = random.Random(seed)
+    if wallets is None:
+        wallets = load_wallets(participants)
+    place_ids = ['place-{}'.format(index) for index in range(places)]
+    balances = {wallet.public_key: 0 for wallet in wallets}
+    signers = {wallet.public_key: PKCS1_v1_5.new(RSA.importKey(binascii.unhexlify(wallet.private_key))) for wallet in wallets}
+    chain = [Block(0, '', [], [], 100, 0, difficulty, LEGACY_BLOCK_VERSION)]
+    counter = 0
+    for index in range(1, height + 1):
+        block_transactions = []
+        block_chipsactions = []
+        for kind, count in (('transaction', transactions), ('chipsaction', chipsactions)):
+            for _ in range(count):
+                sender, recipient = rng.sample(wallets, 2)
+                counter += 1
+                amount = round(0.01 + counter * 1e-6, 6)
+                if balances[sender.public_key] < amount:
+                    continue
+                balances[sender.public_key] -= amount
+                balances[recipient.public_key] += amount
+                # The same signatures as Wallet.sign_transaction and Wallet.sign_chipsaction create
+                signer = signers[sender.public_key]
+                if kind == 'transaction':
+                    digest = Wallet.transaction_digest(Transaction(sender.public_key, recipient.public_key, '', amount))
+                    block_transactions.append(Transaction(sender.public_key, recipient.public_key, _sign(signer, digest), amount))
+                else:
+                    place = rng.choice(place_ids)
+                    message = 'Chips #{}'.format(counter)
+                    digest = Wallet.chipsaction_digest(Chipsaction(sender.public_key, recipient.public_key, place, message, '', amount))
+                    block_chipsactions.append(Chipsaction(sender.public_key, recipient.public_key, place, message, _sign(signer, digest), amount))
+        miner = wallets[index % len(wallets)]
+        balances[miner.public_key] += MINING_REWARD
+        reward = reward_transaction(miner.public_key, index)
+        template = Block(index, chain[-1].hash, block_transactions + [reward], block_chipsactions, 0,
+                         1600000000.0 + index * TARGET_BLOCK_TIME, difficulty)
+        chain.append(Block(index, template.previous_hash, template.transactions, template.chipsactions, find_proof(template),
+                           template.timestamp, difficulty))
+    return chain, wallets
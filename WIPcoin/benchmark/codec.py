@@ -0,0 +1,61 @@
+"""Compares encode/decode throughput and payload size of the binary codec with the JSON path.
+
+Usage: python -m benchmark.codec [--blocks 200] [--transactions 20] [--chipsactions 20] [--participants 50]
+"""
+
+import argparse
+import json
+from time import perf_counter
+
+from block import Block
+from codec import decode_block, encode_block
+from benchmark.memory import generate_records
+
+
+def _time(function, items):
+    start = perf_counter()
+    results = [function(item) for item in items]
+    return perf_counter() - start, results
+
+
+def run(blocks=200, transactions=20, chipsactions=20, participants=50):
+    """Run the benchmark and return the sizes and the blocks per second of both paths."""
+    chain = [Block.from_dict(json.loads(record)) for record in generate_records(blocks, transactions, chipsactions, participants)]
+    json_encode_time, json_payloads = _time(lambda block: json.dumps(block.to_dict()).encode('utf8'), chain)
+    json_decode_time, _ = _time(lambda payload: Block.from_dict(json.loads(payload)), json_payloads)
+    binary_encode_time, binary_payloads = _time(encode_block, chain)
+    binary_decode_time, decoded = _time(decode_block, binary_payloads)
+    # Every block has to survive the round trip unchanged
+    for block, decoded_block in zip(chain, decoded):
+        if decoded_block.to_dict() != block.to_dict():
+            raise ValueError('Block {} changed during the round trip'.format(block.index))
+    json_size = sum(len(payload) for payload in json_payloads)
+    binary_size = sum(len(payload) for payload in binary_payloads)
+    return {
+        'blocks': blocks,
+        'transactions_per_block': transactions,
+        'chipsactions_per_block': chipsactions,
+        'json_bytes_per_block': json_size / blocks,
+        'binary_bytes_per_block': binary_size / blocks,
+        'size_ratio': binary_size / json_size,
+        'json_encode_blocks_per_second': blocks / json_encode_time,
+        'json_decode_blocks_per_second': blocks / json_decode_time,
+        'binary_encode_blocks_per_second': blocks / binary_encode_time,
+        'binary_decode_blocks_per_second': blocks / binary_decode_time
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--blocks', type=int, default=200)
+    parser.add_argument('--transactions', type=int, default=20)
+    parser.add_argument('--chipsactions', type=int, default=20)
+    parser.add_argument('--participants', type=int, default=50)
+    args = parser.parse_args()
+    result = run(args.blocks, args.transactions, args.chipsactions, args.participants)
+    print('Bytes per block:   JSON {:.0f}, binary {:.0f} ({:.2f}x)'.format(
+        result['json_bytes_per_block'], result['binary_bytes_per_block'], result['size_ratio']))
+    print('Encoded blocks/s:  JSON {:.0f}, binary {:.0f}'.format(
+        result['json_encode_blocks_per_second'], result['binary_encode_blocks_per_second']))
+    print('Decoded blocks/s:  JSON {:.0f}, binary {:.0f}'.format(
+        result['json_decode_blocks_per_second'], result['binary_decode_blocks_per_second']))
@@ -0,0 +1,193 @@
+"""Times the hot paths of the node on a synthetic chain and writes the results as JSON.
+
+The results contain the parameters, the environment and the best time of every operation, so runs of different
+commits can be compared (e.g. python -m benchmark.hotpaths --output before.json, then on the next commit
+--baseline before.json prints the speedup of every operation).
+
+Usage: python -m benchmark.hotpaths [--height 200] [--transactions 10] [--chipsactions 5] [--participants 20]
+                                    [--repeat 3] [--output results.json] [--baseline before.json]
+"""
+
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+import platform
+import subprocess
+import tempfile
+from time import perf_counter
+
+from benchmark.chain import generate_chain
+from blockchain import Blockchain
+from codec import decode_block, encode_block
+from miner import Miner
+from utility.hash_util import hash_block
+from utility.merkle import merkle_root
+from utility.verification import Verification
+from verifier import BatchVerifier
+from wallet import Wallet
+
+# The number of proofs of work which are searched per repetition
+POW_ROUNDS = 5
+# The number of signatures which are created and checked per repetition
+SIGNATURES = 200
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(function, count, repeat, setup=None):
+    """Run function repeat times and return the timing of the fastest run.
+
+    Arguments:
+        :function: Performs count operations.
+        :count: The number of operations one call of function performs.
+        :repeat: The number of runs.
+        :setup: An optional function which is called (untimed) before every run.
+    """
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = perf_counter()
+        function()
+        duration = perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return {
+        'count': count,
+        'seconds': best,
+        'per_second': count / best if best > 0 else None,
+        'mean_ms': best / count * 1000 if count > 0 else None
+    }
+
+
+def compare(report, baseline):
+    """Return the speedup (baseline time / new time) of every operation both reports contain."""
+    return {name: baseline['results'][name]['mean_ms'] / result['mean_ms']
+            for name, result in report['results'].items()
+            if name in baseline['results'] and result['mean_ms'] and baseline['results'][name]['mean_ms']}
+
+
+def run(height=200, transactions=10, chipsactions=5, participants=20, repeat=3, workers=1):
+    """Generate a chain, time every hot path on it and return the results."""
+    start = perf_counter()
+    chain, wallets = generate_chain(height, transactions, chipsactions, participants)
+    setup_seconds = perf_counter() - start
+    signed = [tx for block in chain for tx in block.transactions[:-1]][:SIGNATURES]
+    addresses = [wallet.public_key for wallet in wallets]
+    results = {}
+
+    results['hash_block'] = measure(lambda: [hash_block(block) for block in chain], len(chain), repeat)
+    results['merkle_root'] = measure(lambda: [merkle_root([tx.txid for tx in block.transactions] + [tx.txid for tx in block.chipsactions])
+                                              for block in chain], len(chain), repeat)
+    # Every run checks fresh copies, so the memoized hashes of the chain's blocks don't skew the timing
+    copies = []
+
+    def copy_blocks():
+        copies[:] = [decode_block(encode_block(block)) for block in chain[1:]]
+    results['valid_proof'] = measure(lambda: [Verification.valid_proof(block) for block in copies], len(chain) - 1, repeat,
+                                     copy_blocks)
+    miner = Miner(workers)
+    try:
+        # The prefix is changed, so the proofs of the chain aren't found again
+        results['proof_of_work'] = measure(lambda: [miner.mine(b'benchmark-' + chain[index].header_prefix(), chain[index].difficulty)
+                                                    for index in range(1, POW_ROUNDS + 1)], POW_ROUNDS, repeat)
+    finally:
+        miner.close()
+    results['verify_chain'] = measure(lambda: Verification.verify_chain(chain), len(chain), repeat)
+    verifier = BatchVerifier(workers)
+    try:
+        # The timings are meaningless if the generated chain isn't valid
+        if not Verification.verify_chain(chain, verifier=verifier):
+            raise ValueError('The generated chain is invalid')
+        results['verify_chain_signatures'] = measure(lambda: Verification.verify_chain(chain, verifier=verifier), len(chain), repeat,
+                                                     Verification.clear_signature_cache)
+    finally:
+        verifier.close()
+    # Every run gets a new pool, its workers are started by the forkserver and don't inherit our signature cache, so they start
+    # without cached results (verifying the first two blocks starts the workers outside of the measurement)
+    parallel = []
+
+    def new_parallel_verifier():
+        for old_verifier in parallel:
+            old_verifier.close()
+        Verification.clear_signature_cache()
+        parallel[:] = [BatchVerifier(workers)]
+        parallel[0].verify_chain(chain[:2], check_signatures=False)
+    try:
+        results['verify_chain_parallel'] = measure(lambda: parallel[0].verify_chain(chain, check_signatures=False), len(chain), repeat,
+                                                   new_parallel_verifier)
+        results['verify_chain_parallel_signatures'] = measure(lambda: parallel[0].verify_chain(chain), len(chain), repeat,
+                                                              new_parallel_verifier)
+    finally:
+        for old_verifier in parallel:
+            old_verifier.close()
+    sender = wallets[0]
+    results['wallet_sign'] = measure(lambda: [sender.sign_transaction(sender.public_key, 'benchmark', 0.001 * index)
+                                              for index in range(SIGNATURES)], SIGNATURES, repeat)
+    results['wallet_verify'] = measure(lambda: [Wallet.verify_transaction(tx) for tx in signed], len(signed), repeat,
+                                       Verification.clear_signature_cache)
+    results['wallet_verify_cached'] = measure(lambda: [Wallet.verify_transaction(tx) for tx in signed], len(signed), repeat)
+
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    blockchain = Blockchain(addresses[0], 'benchmark', mining_workers=workers, verification_workers=workers)
+    try:
+        blockchain.chain = chain
+        results['get_balance'] = measure(lambda: [blockchain.get_balance(address) for address in addresses] * 10,
+                                         len(addresses) * 10, repeat)
+        results['save_data'] = measure(blockchain.save_data, len(chain), repeat)
+        results['load_data'] = measure(blockchain.load_data, len(chain), repeat)
+    finally:
+        blockchain.close()
+        os.chdir(cwd)
+    return {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'height': height,
+            'transactions_per_block': transactions,
+            'chipsactions_per_block': chipsactions,
+            'participants': participants,
+            'repeat': repeat,
+            'workers': workers
+        },
+        'setup_seconds': setup_seconds,
+        'results': results
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--height', type=int, default=200)
+    parser.add_argument('--transactions', type=int, default=10)
+    parser.add_argument('--chipsactions', type=int, default=5)
+    parser.add_argument('--participants', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=1, help='The number of mining and verification processes')
+    parser.add_argument('--output', help='The file the JSON results are written to (printed if omitted)')
+    parser.add_argument('--baseline', help='The JSON results of an earlier run to compare with')
+    args = parser.parse_args()
+    report = run(args.height, args.transactions, args.chipsactions, args.participants, args.repeat, args.workers)
+    speedups = {}
+    if args.baseline:
+        with open(args.baseline, mode='r') as f:
+            speedups = compare(report, json.load(f))
+        report['speedup'] = speedups
+    for name, result in report['results'].items():
+        line = '{:<24} {:>10.0f}/s {:>10.3f} ms'.format(name, result['per_second'] or 0, result['mean_ms'] or 0)
+        if name in speedups:
+            line += ' {:>6.2f}x'.format(speedups[name])
+        print(line)
+    if args.output:
+        with open(args.output, mode='w') as f:
+            json.dump(report, f, indent=2)
+        print('Results written to {}'.format(args.output))
+    else:
+        print(json.dumps(report, indent=2))
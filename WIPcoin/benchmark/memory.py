@@ -0,0 +1,124 @@
+"""Compares the memory a decoded block takes up with the slotted records and with the former __dict__ objects.
+
+Usage: python -m benchmark.memory [--blocks 200] [--transactions 20] [--chipsactions 20] [--participants 50]
+"""
+
+import argparse
+import json
+import os
+import random
+import tracemalloc
+
+from block import Block
+
+
+class DictTransaction:
+    """The former representation of a transaction (a plain __dict__ object without interned addresses)."""
+    def __init__(self, sender, recipient, signature, amount, txid):
+        self.sender = sender
+        self.recipient = recipient
+        self.amount = amount
+        self.signature = signature
+        self.txid = txid
+
+
+class DictChipsaction:
+    """The former representation of a chipsaction (a plain __dict__ object without interned addresses)."""
+    def __init__(self, sender, recipient, place, message, signature, amount, txid):
+        self.sender = sender
+        self.recipient = recipient
+        self.placeID = place
+        self.message = message
+        self.amount = amount
+        self.signature = signature
+        self.txid = txid
+
+
+class DictBlock:
+    """The former representation of a block (a plain __dict__ object with lists of transactions)."""
+    def __init__(self, index, previous_hash, transactions, chipsactions, proof, time, difficulty):
+        self.index = index
+        self.previous_hash = previous_hash
+        self.timestamp = time
+        self.transactions = transactions
+        self.chipsactions = chipsactions
+        self.proof = proof
+        self.difficulty = difficulty
+
+
+def dict_block_from_dict(block):
+    return DictBlock(block['index'], block['previous_hash'],
+                     [DictTransaction(tx['sender'], tx['recipient'], tx['signature'], tx['amount'], tx['txid'])
+                      for tx in block['transactions']],
+                     [DictChipsaction(tx['sender'], tx['recipient'], tx['placeID'], tx['message'], tx['signature'], tx['amount'], tx['txid'])
+                      for tx in block['chipsactions']],
+                     block['proof'], block['timestamp'], block['difficulty'])
+
+
+def _hex(size):
+    return os.urandom(size).hex()
+
+
+def generate_records(blocks, transactions, chipsactions, participants, seed=0):
+    """Generate the serialized (JSON) records of a synthetic chain.
+
+    The addresses look like the hex-encoded 1024-bit RSA keys of our wallets, the signatures like their signatures.
+    """
+    rng = random.Random(seed)
+    addresses = [_hex(162) for _ in range(participants)]
+    places = [_hex(16) for _ in range(max(participants // 5, 1))]
+    records = []
+    for index in range(blocks):
+        records.append(json.dumps({
+            'index': index,
+            'previous_hash': _hex(32),
+            'timestamp': 1600000000.0 + index,
+            'transactions': [{'sender': rng.choice(addresses), 'recipient': rng.choice(addresses), 'amount': 1.0,
+                              'signature': _hex(128), 'txid': _hex(32)} for _ in range(transactions)],
+            'chipsactions': [{'sender': rng.choice(addresses), 'recipient': rng.choice(addresses), 'placeID': rng.choice(places),
+                              'message': 'Thanks for the great place!', 'amount': 1.0, 'signature': _hex(128), 'txid': _hex(32)}
+                             for _ in range(chipsactions)],
+            'proof': rng.randrange(100000),
+            'difficulty': 256
+        }))
+    return records
+
+
+def measure(records, decode):
+    """Decode all records and return the number of bytes the resulting objects keep allocated."""
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    blocks = [decode(json.loads(record)) for record in records]
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del blocks
+    return used
+
+
+def run(blocks=200, transactions=20, chipsactions=20, participants=50):
+    """Run the benchmark and return the bytes per block of both representations."""
+    records = generate_records(blocks, transactions, chipsactions, participants)
+    before = measure(records, dict_block_from_dict)
+    after = measure(records, Block.from_dict)
+    return {
+        'blocks': blocks,
+        'transactions_per_block': transactions,
+        'chipsactions_per_block': chipsactions,
+        'participants': participants,
+        'bytes_per_block_before': before / blocks,
+        'bytes_per_block_after': after / blocks,
+        'ratio': after / before
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--blocks', type=int, default=200)
+    parser.add_argument('--transactions', type=int, default=20)
+    parser.add_argument('--chipsactions', type=int, default=20)
+    parser.add_argument('--participants', type=int, default=50)
+    args = parser.parse_args()
+    result = run(args.blocks, args.transactions, args.chipsactions, args.participants)
+    print('Bytes per block before: {:.0f}'.format(result['bytes_per_block_before']))
+    print('Bytes per block after:  {:.0f}'.format(result['bytes_per_block_after']))
+    print('After / before:         {:.2f}'.format(result['ratio']))
@@ -0,0 +1,154 @@
+"""Hammers the endpoints of a node from many threads at once and checks the invariants of its state afterwards.
+
+The node runs in this process on a threaded server with its data files in a temporary directory.
+
+Usage: python -m benchmark.stress [--seconds 10] [--readers 8] [--writers 4] [--port 5900]
+"""
+
+import argparse
+from collections import Counter
+import os
+import tempfile
+import threading
+from time import time
+
+import requests
+from werkzeug.serving import make_server
+
+from block import Block
+from ledger import Ledger
+from utility.verification import Verification
+from wallet import Wallet
+from node_api import NodeApi
+import node
+
+
+def _check_chain_response(blocks, problems):
+    """Check that a /chain response is one consistent chain (no blocks of two different chains mixed)."""
+    for height, block in enumerate(blocks):
+        if block.index != height or (height > 0 and block.previous_hash != blocks[height - 1].hash):
+            problems.append('/chain returned an inconsistent chain at height {}'.format(height))
+            return
+
+
+def _mine(url, stop, results, problems):
+    while not stop.is_set():
+        response = requests.post(url + '/mine')
+        results['/mine {}'.format(response.status_code)] += 1
+        if response.status_code != 201:
+            problems.append('/mine answered {}: {}'.format(response.status_code, response.text))
+
+
+def _send(url, stop, results, problems, worker):
+    count = 0
+    while not stop.is_set():
+        count += 1
+        # Unique amounts, so every transaction gets its own txid
+        amount = round(0.001 * count + 0.0001 * worker, 4)
+        response = requests.post(url + '/transaction', json={'recipient': 'stress-{}'.format(worker), 'amount': amount})
+        results['/transaction {}'.format(response.status_code)] += 1
+        # 500 means the funds weren't sufficient (yet), everything else besides 201 is a problem
+        if response.status_code not in (201, 500):
+            problems.append('/transaction answered {}: {}'.format(response.status_code, response.text))
+
+
+def _read(url, public_key, stop, results, problems):
+    paths = ['/chain', '/transactions', '/balance', '/tip', '/address/{}/history'.format(public_key)]
+    count = 0
+    while not stop.is_set():
+        path = paths[count % len(paths)]
+        count += 1
+        response = requests.get(url + path)
+        results['GET {}'.format(path.split('/')[1])] += 1
+        if response.status_code != 200:
+            problems.append('{} answered {}'.format(path, response.status_code))
+        elif path == '/chain':
+            _check_chain_response([Block.from_dict(block) for block in response.json()], problems)
+
+
+def check_invariants(url, blockchain, public_key):
+    """Return the list of invariants the final state of the node violates."""
+    problems = []
+    blocks = [Block.from_dict(block) for block in requests.get(url + '/chain').json()]
+    _check_chain_response(blocks, problems)
+    if not Verification.verify_chain(blocks, blockchain.retarget_interval, blockchain.target_block_time,
+                                     max_transactions=blockchain.max_block_transactions, max_chipsactions=blockchain.max_block_chipsactions):
+        problems.append('The chain is invalid')
+    tip = requests.get(url + '/tip').json()
+    if tip['height'] != len(blocks) - 1 or tip['hash'] != blocks[-1].hash:
+        problems.append('The tip doesn\'t match the chain')
+    if tip['cumulative_work'] != sum(block.difficulty for block in blocks):
+        problems.append('The cumulative work doesn\'t match the chain')
+    open_transactions = blockchain.get_open_transactions()
+    mined_txids = set(tx.txid for block in blocks for tx in block.transactions)
+    if any(tx.txid in mined_txids for tx in open_transactions):
+        problems.append('A mined transaction is still open')
+    funds = requests.get(url + '/balance').json()['funds']
+    scanned = Ledger.scan_balance(public_key, blocks, open_transactions, blockchain.get_open_chipsactions())
+    if abs(funds - scanned) > 1e-9:
+        problems.append('The balance {} doesn\'t match the scanned balance {}'.format(funds, scanned))
+    if funds < -1e-9:
+        problems.append('The balance is negative')
+    entries = sum(1 for block in blocks for tx in block.transactions if public_key in (tx.sender, tx.recipient))
+    history, next_before = blockchain.get_address_history(public_key, limit=entries + 1)
+    if len(history) != entries:
+        problems.append('The address history has {} entries instead of {}'.format(len(history), entries))
+    return problems
+
+
+def run(seconds=10, readers=8, writers=4, port=5900):
+    """Run the stress test and return the request counts and the violated invariants."""
+    os.chdir(tempfile.mkdtemp())
+    wallet = Wallet(port)
+    wallet.create_keys()
+    node.api = NodeApi(wallet, port, mining_workers=1, verification_workers=1)
+    node.api.set_up_blockchain()
+    server = make_server('127.0.0.1', port, node.app, threaded=True)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    url = 'http://127.0.0.1:{}'.format(port)
+    stop = threading.Event()
+    results = Counter()
+    problems = []
+    threads = [threading.Thread(target=_mine, args=(url, stop, results, problems))]
+    threads += [threading.Thread(target=_send, args=(url, stop, results, problems, worker)) for worker in range(writers)]
+    threads += [threading.Thread(target=_read, args=(url, wallet.public_key, stop, results, problems)) for _ in range(readers)]
+    start = time()
+    for thread in threads:
+        thread.start()
+    stop.wait(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    duration = time() - start
+    problems += check_invariants(url, node.api.blockchain, wallet.public_key)
+    server.shutdown()
+    blocks = node.api.blockchain.get_tip()['height'] + 1
+    node.api.close()
+    return {
+        'seconds': duration,
+        'requests': sum(results.values()),
+        'requests_per_second': sum(results.values()) / duration,
+        'results': dict(results),
+        'blocks': blocks,
+        'problems': problems
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=5900)
+    args = parser.parse_args()
+    result = run(args.seconds, args.readers, args.writers, args.port)
+    print('{} requests in {:.1f}s ({:.0f}/s), {} blocks'.format(
+        result['requests'], result['seconds'], result['requests_per_second'], result['blocks']))
+    for key, count in sorted(result['results'].items()):
+        print('  {}: {}'.format(key, count))
+    for problem in result['problems'][:20]:
+        print('PROBLEM: {}'.format(problem))
+    if result['problems']:
+        raise SystemExit(1)
+    print('All invariants hold')
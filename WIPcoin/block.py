@@ -1,24 +1,91 @@
-from time import time
+from time import time as current_time
 
-from utility.printable import Printable
+from transaction import Transaction
+from chipsaction import Chipsaction
+from utility.difficulty import DEFAULT_DIFFICULTY
+from utility.hash_util import BLOCK_VERSION, LEGACY_BLOCK_VERSION, hash_block, header_prefix
+from utility.merkle import merkle_root
+from utility.record import Record
 
-class Block(Printable):
+class Block(Record):
     """A single block of our blockchain.
-    
+
+    Blocks are immutable once they were built, so their Merkle root is calculated once at construction and their
+    hash on first access (see the hash property). The hash only covers the header, which commits to the transactions
+    and chipsactions through the Merkle root.
+
     Attributes:
         :index: The index of this block.
         :previous_hash: The hash of the previous block in the blockchain.
         :timestamp: The timestamp of the block (automatically generated by default).
-        :transactions: A list of transaction which are included in the block.
-        :chipsactions: A list of chipsaction which are included in the block.
+        :transactions: A tuple of transaction which are included in the block.
+        :chipsactions: A tuple of chipsaction which are included in the block.
         :proof: The proof of work number that yielded this block.
+        :difficulty: The difficulty the proof of work of this block had to meet.
+        :version: How the block is hashed (LEGACY_BLOCK_VERSION for blocks which were mined before the Merkle root).
+        :merkle_root: The Merkle root of the txids of the transactions followed by those of the chipsactions.
     """
-    def __init__(self, index, previous_hash, transactions, chipsactions, proof, time=time()):
-        self.index = index
-        self.previous_hash = previous_hash
-        self.timestamp = time
-        self.transactions = transactions
-        self.chipsactions = chipsactions
-        self.proof = proof
+    __slots__ = ('index', 'previous_hash', 'timestamp', 'transactions', 'chipsactions', 'proof', 'difficulty', 'version',
+                 'merkle_root', '_hash')
+
+    def __init__(self, index, previous_hash, transactions, chipsactions, proof, time=None, difficulty=DEFAULT_DIFFICULTY,
+                 version=BLOCK_VERSION):
+        self._set('index', index)
+        self._set('previous_hash', previous_hash)
+        self._set('timestamp', current_time() if time is None else time)
+        self._set('transactions', tuple(transactions))
+        self._set('chipsactions', tuple(chipsactions))
+        self._set('proof', proof)
+        self._set('difficulty', difficulty)
+        self._set('version', version)
+        self._set('merkle_root', merkle_root([tx.txid for tx in self.transactions] + [tx.txid for tx in self.chipsactions]))
+        self._set('_hash', None)
+
+    @property
+    def hash(self):
+        """The hash of the block (calculated on first access)."""
+        if self._hash is None:
+            self._set('_hash', hash_block(self))
+        return self._hash
+
+    def header_prefix(self):
+        """Return the serialized header without the proof (the input of the proof of work, see hash_util.header_prefix)."""
+        return header_prefix(self.index, self.previous_hash, self.merkle_root, self.timestamp, self.difficulty)
+
+    def header(self):
+        """Return the header of the block (everything but its transactions and chipsactions) including its hash."""
+        return {
+            'index': self.index,
+            'previous_hash': self.previous_hash,
+            'timestamp': self.timestamp,
+            'proof': self.proof,
+            'difficulty': self.difficulty,
+            'version': self.version,
+            'merkle_root': self.merkle_root,
+            'hash': self.hash
+        }
+
+    def to_dict(self):
+        """Converts this block (including its transactions and chipsactions) into a JSON-serializable dict."""
+        return {
+            'index': self.index,
+            'previous_hash': self.previous_hash,
+            'timestamp': self.timestamp,
+            'transactions': [tx.to_dict() for tx in self.transactions],
+            'chipsactions': [tx.to_dict() for tx in self.chipsactions],
+            'proof': self.proof,
+            'difficulty': self.difficulty,
+            'version': self.version
+        }
 
+    @classmethod
+    def from_dict(cls, block):
+        """Create a block (including Transaction and Chipsaction objects) from its dict representation.
 
+        Blocks without a version were created before the Merkle root was introduced and are legacy blocks.
+        """
+        return cls(block['index'], block['previous_hash'],
+                   [Transaction.from_dict(tx) for tx in block['transactions']],
+                   [Chipsaction.from_dict(tx) for tx in block['chipsactions']],
+                   block['proof'], block['timestamp'], block.get('difficulty', DEFAULT_DIFFICULTY),
+                   block.get('version', LEGACY_BLOCK_VERSION))
@@ -1,19 +1,74 @@
-from functools import reduce
-import hashlib as hl
-
-import json
-import pickle
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from time import time
 import requests
 
-from utility.hash_util import hash_block
 from utility.verification import Verification
-from block import Block
+from utility.rwlock import ReadWriteLock, read_locked, write_locked
+from utility.metrics import metrics, timed
+from utility.merkle import merkle_branch
+from utility.difficulty import DEFAULT_DIFFICULTY, RETARGET_INTERVAL, TARGET_BLOCK_TIME, expected_difficulty, median_time_past
+from block import Block, LEGACY_BLOCK_VERSION
 from transaction import Transaction
 from chipsaction import Chipsaction
-from wallet import Wallet
+from ledger import Ledger
+from chain_index import ChainIndex
+from address_index import AddressIndex
+from place_index import PlaceIndex
+from tx_index import TxIndex
+from storage import ChainStorage, SplicedChain
+from codec import BINARY_CONTENT_TYPE, decode_blocks, encode_block, encode_chipsaction, encode_transaction
+from miner import Miner
+from verifier import BatchVerifier
+from broadcast import Broadcaster
+from mempool import Mempool, build_block_template, MAX_MEMPOOL_COUNT, MAX_MEMPOOL_BYTES, MAX_MEMPOOL_AGE, MAX_BLOCK_TRANSACTIONS, MAX_BLOCK_CHIPSACTIONS
 
 # The reward we give to miners (for creating a new block)
 MINING_REWARD = 10
+# The number of seconds we wait for a peer while syncing
+SYNC_TIMEOUT = 5
+# The number of blocks we download from a peer per request
+SYNC_BATCH_SIZE = 100
+# The number of peers we query at the same time
+SYNC_MAX_PEER_REQUESTS = 8
+# The number of downloaded blocks from which on they're verified in ranges by the verification processes
+PARALLEL_VERIFICATION_THRESHOLD = 200
+
+# Instrumentation of mining, verification and persistence (exposed by /metrics)
+PROOF_OF_WORK_SECONDS = metrics.histogram('wipcoin_proof_of_work_seconds', 'Duration of the proof of work searches.')
+HASHES = metrics.counter('wipcoin_proof_of_work_hashes_total', 'Number of nonces hashed by the proof of work.')
+BLOCK_TEMPLATE_SECONDS = metrics.histogram('wipcoin_block_template_seconds', 'Duration of building and verifying the template of a mined block.')
+MINING_ROUNDS = metrics.counter('wipcoin_mining_rounds_total', 'Number of mining rounds by result.')
+BLOCKS_RECEIVED = metrics.counter('wipcoin_blocks_received_total', 'Number of blocks received from peers by result.')
+CHAIN_VERIFICATION_SECONDS = metrics.histogram('wipcoin_chain_verification_seconds', 'Duration of verifying the chain of a peer while syncing.')
+PERSISTENCE_SECONDS = metrics.histogram('wipcoin_persistence_seconds', 'Duration of storage operations.')
+
+
+def reward_transaction(recipient, height):
+    """Return the mining reward of the block at a height.
+
+    Rewards aren't signed, the height takes the place of the signature. So every reward has its own txid, even if
+    the same miner mines many blocks.
+
+    Arguments:
+        :recipient: The miner who receives the reward.
+        :height: The height of the block which pays the reward.
+    """
+    return Transaction('MINING', recipient, 'height-{}'.format(height), MINING_REWARD)
+
+
+def valid_tip(tip):
+    """Check whether the tip a peer answered with has a height and a cumulative work we can compare.
+
+    Arguments:
+        :tip: The decoded JSON answer of the peer.
+    """
+    if not isinstance(tip, dict):
+        return False
+    height, cumulative_work = tip.get('height'), tip.get('cumulative_work')
+    if isinstance(height, bool) or not isinstance(height, int):
+        return False
+    return not isinstance(cumulative_work, bool) and isinstance(cumulative_work, (int, float))
 
 print(__name__)
 
@@ -22,119 +77,301 @@ class Blockchain:
     """The Blockchain class manages the chain of blocks as well as open transactions and the node on which it's running.
 
     Attributes:
-        :chain: The list of blocks
+        :chain: A read-only view of the blocks (decoded lazily from the block log)
         :open_transactions: The list of open transactions
         :open_chipsactions: The list of open chipsactions
         :hosting_node: The connected node (which runs the blockchain).
+        :check_ledger: Whether balance lookups should be compared against a full chain scan.
+        :block_cache_size: The number of decoded blocks which are kept in memory.
+        :mining_workers: The number of processes used for the proof of work (defaults to the CPU count).
+        :retarget_interval: The number of blocks after which the difficulty is adjusted.
+        :target_block_time: The number of seconds we want to pass between two blocks.
+        :verification_workers: The number of processes used to verify batches of signatures (defaults to the CPU count).
+        :mempool_max_count: The maximum number of open transactions (and of open chipsactions).
+        :mempool_max_bytes: The maximum serialized size of the open transactions (and of the open chipsactions).
+        :mempool_max_age: The number of seconds after which open transactions and chipsactions are evicted.
+        :max_block_transactions: The maximum number of transactions (without the reward) a mined block contains.
+        :max_block_chipsactions: The maximum number of chipsactions a mined block contains.
+        :lock: The reader/writer lock of the chain, the mempools and the indexes.
+        :broadcaster_factory: Creates the broadcaster from the handler of the peers' answers (defaults to the threaded Broadcaster).
+
+    Requests are handled in several threads: mutations of the chain and the mempools hold the write lock,
+    lookups hold the read lock. The proof of work and the network requests of a sync run without the lock.
     """
 
-    def __init__(self, public_key, node_id):
+    def __init__(self, public_key, node_id, check_ledger=False, block_cache_size=128, mining_workers=None,
+                 retarget_interval=RETARGET_INTERVAL, target_block_time=TARGET_BLOCK_TIME, verification_workers=None,
+                 mempool_max_count=MAX_MEMPOOL_COUNT, mempool_max_bytes=MAX_MEMPOOL_BYTES, mempool_max_age=MAX_MEMPOOL_AGE,
+                 max_block_transactions=MAX_BLOCK_TRANSACTIONS, max_block_chipsactions=MAX_BLOCK_CHIPSACTIONS,
+                 broadcaster_factory=Broadcaster):
         """The constructor of the Blockchain class."""
-        # Our starting block for the blockchain
-        genesis_block = Block(0, '', [], [], 100, 0)
-        # Initializing our (empty) blockchain list
-        self.chain = [genesis_block]
-        # Unhandled transactions
-        self.__open_transactions = []
-        self.__open_chipsactions = []
+        self.lock = ReadWriteLock()
+        # Only one proof of work and one sync run at a time
+        self.__mining_lock = threading.Lock()
+        self.__sync_lock = threading.Lock()
+        # The height up to which the blocks of the running sync were validated (None while not syncing)
+        self.__sync_validated_height = None
+        # Unhandled transactions (keyed by their txid)
+        self.__open_transactions = Mempool(mempool_max_count, mempool_max_bytes, mempool_max_age)
+        self.__open_chipsactions = Mempool(mempool_max_count, mempool_max_bytes, mempool_max_age)
+        self.max_block_transactions = max_block_transactions
+        self.max_block_chipsactions = max_block_chipsactions
         self.public_key = public_key
         self.__peer_nodes = set()
         self.node_id = node_id
         self.resolve_conflicts = False
+        self.check_ledger = check_ledger
+        self.retarget_interval = retarget_interval
+        self.target_block_time = target_block_time
+        self.__ledger = Ledger()
+        self.__index = ChainIndex()
+        self.__addresses = AddressIndex()
+        self.__places = PlaceIndex()
+        self.__txs = TxIndex()
+        self.__storage = ChainStorage(node_id, cache_size=block_cache_size)
+        self.__miner = Miner(mining_workers)
+        self.__verifier = BatchVerifier(verification_workers)
+        self.__broadcaster = broadcaster_factory(self._on_broadcast_response)
+        # Called (without arguments) whenever a transaction or chipsaction was added to the open ones
+        self.__open_listeners = []
         self.load_data()
 
     # This turns the chain attribute into a property with a getter (the method below) and a setter (@chain.setter)
     @property
+    @read_locked
     def chain(self):
-        return self.__chain[:]
+        # The view stays valid without holding the lock: blocks are only appended, a fork switch replaces the log
+        return self.__chain.snapshot()
 
-    # The setter for the chain property
+    # The setter for the chain property (replaces the stored chain)
     @chain.setter
+    @write_locked
     def chain(self, val):
-        self.__chain = val
+        self.__chain = self.__storage.replace_chain(val)
+        self._rebuild_indexes()
 
+    @read_locked
     def get_open_transactions(self):
         """Returns a copy of the open transactions list."""
-        return self.__open_transactions[:]
+        return list(self.__open_transactions.values())
 
+    @read_locked
     def get_open_chipsactions(self):
         """Returns a copy of the open chipsactions list."""
-        return self.__open_chipsactions[:]
+        return list(self.__open_chipsactions.values())
+
+    @read_locked
+    def has_open_transaction(self, txid):
+        """Return True if a transaction or chipsaction with the given txid is open."""
+        return txid in self.__open_transactions or txid in self.__open_chipsactions
+
+    @read_locked
+    def count_open(self):
+        """Return the number of open transactions and chipsactions."""
+        return len(self.__open_transactions) + len(self.__open_chipsactions)
+
+    def add_open_listener(self, listener):
+        """Register a function which is called whenever a transaction or chipsaction was added to the open ones.
+
+        The listener is called while the write lock is held, so it must return quickly and mustn't use the blockchain.
+        """
+        self.__open_listeners.append(listener)
 
+    @write_locked
+    def remove_open_transactions(self, transactions, chipsactions):
+        """Remove transactions and chipsactions (e.g. ones included in a block) from the open ones."""
+        for tx in transactions:
+            self.__open_transactions.pop(tx.txid)
+        for tx in chipsactions:
+            self.__open_chipsactions.pop(tx.txid)
+
+    def _add_open(self, mempool, tx, kind):
+        """Add a transaction or chipsaction to its mempool and journal it (and the entries it evicted).
+
+        Returns False if the entry itself had to be evicted right away.
+        """
+        evicted = mempool.add(tx)
+        self.__ledger.add_pending(tx)
+        self.journal(kind, tx.to_dict())
+        for evicted_tx in evicted:
+            self.__ledger.remove_pending(evicted_tx)
+            self.journal('evict_' + kind, evicted_tx.txid)
+        if tx.txid not in mempool:
+            return False
+        for listener in self.__open_listeners:
+            listener()
+        return True
+
+    @write_locked
+    @timed(PERSISTENCE_SECONDS, operation='load_data')
     def load_data(self):
-        """Initialize blockchain + open transactions + open chipsactions data from a file."""
+        """Initialize blockchain + open transactions + open chipsactions data from the storage."""
+        self.__chain = self.__storage.load_chain()
+        if len(self.__chain) == 0:
+            # Our starting block for the blockchain (a legacy block, so it keeps the hash of earlier versions)
+            genesis_block = Block(0, '', [], [], 100, 0, DEFAULT_DIFFICULTY, LEGACY_BLOCK_VERSION)
+            self.__chain.append(genesis_block)
+        open_transactions, open_chipsactions, self.__peer_nodes = self.__storage.load_journal()
+        self.__open_transactions.clear()
+        self.__open_chipsactions.clear()
+        self._rebuild_indexes()
+        # The journal may still hold entries which made it into a block before we stopped, they aren't open anymore
+        for tx in open_transactions:
+            if self.__txs.locate(tx.txid) is None:
+                self.__open_transactions.add(tx)
+        for tx in open_chipsactions:
+            if self.__txs.locate(tx.txid) is None:
+                self.__open_chipsactions.add(tx)
+        self.__ledger.reset_pending(self.__open_transactions.values(), self.__open_chipsactions.values())
+
+    def _rebuild_indexes(self):
+        """Rebuild the ledger, the chain index, the address index, the place index and the txid index with a single pass over the chain."""
+        self.__ledger.rebuild([], self.__open_transactions.values(), self.__open_chipsactions.values())
+        self.__index.rebuild([])
+        self.__addresses.rebuild([])
+        self.__places.rebuild([])
+        self.__txs.rebuild([])
+        for block in self.__chain:
+            self.__ledger.apply_block(block)
+            self.__index.append(block)
+            self.__addresses.apply_block(block)
+            self.__places.apply_block(block)
+            self.__txs.apply_block(block)
+
+    def _index_block(self, block):
+        """Update the mempool and the indexes for a block which was added to the chain."""
+        # Remove the open transactions and chipsactions which were included in the block
+        self.remove_open_transactions(block.transactions, block.chipsactions)
+        self.__ledger.apply_block(block)
+        self.__ledger.reset_pending(self.__open_transactions.values(), self.__open_chipsactions.values())
+        self.__index.append(block)
+        self.__addresses.apply_block(block)
+        self.__places.apply_block(block)
+        self.__txs.apply_block(block)
+
+    @write_locked
+    def _connect_block(self, block, save_journal=True):
+        """Append a validated block to the chain and update the mempool and the indexes."""
         try:
-            with open('blockchain-{}.txt'.format(self.node_id), mode='r') as f:
-                file_content = f.readlines()
-                blockchain = json.loads(file_content[0][:-1])
-                updated_blockchain = []
-                for block in blockchain:
-                    converted_tx = [Transaction(
-                        tx['sender'], tx['recipient'], tx['signature'], tx['amount']) for tx in block['transactions']]
-                    converted_chip = [Chipsaction(
-                        tx['sender'], tx['recipient'], tx['placeID'], tx['message'], tx['signature'], tx['amount']) for tx in block['chipsactions']]
-                    updated_block = Block(
-                        block['index'], block['previous_hash'], converted_tx, converted_chip, block['proof'], block['timestamp'])
-                    updated_blockchain.append(updated_block)
-                self.chain = updated_blockchain
-
-                open_transactions = json.loads(file_content[1][:-1])
-                # need to convert  the loaded data because Transactions should use OrderedDict
-                updated_transactions = []
-                for tx in open_transactions:
-                    updated_transaction = Transaction(
-                        tx['sender'], tx['recipient'], tx['signature'], tx['amount'])
-                    updated_transactions.append(updated_transaction)
-                self.__open_transactions = updated_transactions
-
-                open_chipsactions = json.loads(file_content[2][:-1])
-                # need to convert  the loaded data because Chipsactions should use OrderedDict
-                updated_chipsactions = []
-                for tx in open_chipsactions:
-                    updated_chipsaction = Chipsaction(
-                        tx['sender'], tx['recipient'], tx['placeID'], tx['message'], tx['signature'], tx['amount'])
-                    updated_chipsactions.append(updated_chipsaction)
-                self.__open_chipsactions = updated_chipsactions
-
-                peer_nodes = json.loads(file_content[3])
-                self.__peer_nodes = set(peer_nodes)
-        except (IOError, IndexError):
-            pass
-        finally:
-            print('Cleanup!')
-
+            with PERSISTENCE_SECONDS.time(operation='append_block'):
+                self.__chain.append(block)
+        except IOError:
+            print('Saving failed!')
+        self._index_block(block)
+        if save_journal:
+            self.save_journal()
+
+    def _disconnect_block(self, block):
+        """Undo the ledger, address index, place index and txid index updates of a block which is rolled back (the caller truncates the chain and the chain index)."""
+        self.__ledger.revert_block(block)
+        self.__addresses.revert_block(block)
+        self.__places.revert_block(block)
+        self.__txs.revert_block(block)
+
+    @write_locked
+    @timed(PERSISTENCE_SECONDS, operation='save_data')
     def save_data(self):
-        """Save blockchain + open transactions and open chipsactions snapshot to a file."""
+        """Save a full snapshot of the blockchain, open transactions, open chipsactions and peers to the storage."""
+        try:
+            self.__chain = self.__storage.replace_chain(self.__chain)
+        except IOError:
+            print('Saving failed!')
+        self.save_journal()
+
+    @write_locked
+    @timed(PERSISTENCE_SECONDS, operation='save_journal')
+    def save_journal(self):
+        """Compact the journal into a snapshot of the open transactions, open chipsactions and peers."""
         try:
-            with open('blockchain-{}.txt'.format(self.node_id), mode='w') as f:
-                saveable_chain = [block.__dict__ for block in [Block(block_el.index, block_el.previous_hash, 
-                [tx.__dict__ for tx in block_el.transactions], 
-                [tx.__dict__ for tx in block_el.chipsactions],
-                    block_el.proof, block_el.timestamp) for block_el in self.__chain]]
-                f.write(json.dumps(saveable_chain))
-                f.write('\n')
-                saveable_tx = [tx.__dict__ for tx in self.__open_transactions]
-                f.write(json.dumps(saveable_tx))
-                f.write('\n')
-                saveable_chip = [tx.__dict__ for tx in self.__open_chipsactions]
-                f.write(json.dumps(saveable_chip))
-                f.write('\n')
-                f.write(json.dumps(list(self.__peer_nodes)))
+            self.__storage.compact(self.__open_transactions.values(), self.__open_chipsactions.values(), self.__peer_nodes)
         except IOError:
             print('Saving failed!')
 
-    def proof_of_work(self):
-        """Generate a proof of work for the open transactions, the hash of the previous block and a random number (which is guessed until it fits)."""
-        last_block = self.__chain[-1]
-        last_hash = hash_block(last_block)
-        proof = 0
-        # Try different PoW numbers and return the first valid one
-        while not Verification.valid_proof(self.__open_transactions, self.__open_chipsactions, last_hash, proof):
-            proof += 1
-        return proof
+    @write_locked
+    @timed(PERSISTENCE_SECONDS, operation='journal')
+    def journal(self, op, data):
+        """Append an operation to the journal and compact it when it grew too long."""
+        try:
+            if self.__storage.journal(op, data):
+                self.save_journal()
+        except IOError:
+            print('Saving failed!')
+
+    def proof_of_work(self, block):
+        """Generate a proof of work for the header of a block template and a random number (which is guessed until it fits).
+
+        Returns None if mining was cancelled because a competing block arrived. The search runs without holding the lock.
+
+        Arguments:
+            :block: The block template whose header is mined (its own proof is ignored).
+        """
+        with self.__mining_lock:
+            with PROOF_OF_WORK_SECONDS.time():
+                proof = self.__miner.mine(block.header_prefix(), block.difficulty)
+            HASHES.inc(self.__miner.last_stats['hashes'])
+            return proof
+
+    @read_locked
+    def next_difficulty(self):
+        """Return the difficulty the next block of the chain has to meet."""
+        return expected_difficulty(self.__chain, len(self.__chain), self.retarget_interval, self.target_block_time)
+
+    def cancel_mining(self):
+        """Abort a running proof of work (e.g. because a competing block arrived)."""
+        self.__miner.cancel()
+
+    def _on_broadcast_response(self, node, path, status_code):
+        """Handle the answer of a peer to a broadcast (called from the broadcast threads)."""
+        if status_code == 400 or status_code == 500:
+            print('Broadcast to {}{} declined, needs resolving'.format(node, path))
+        if path == '/broadcast-block' and status_code == 409:
+            self.resolve_conflicts = True
+
+    @write_locked
+    def close(self):
+        """Shut down the broadcast channels, the worker processes and the block log (the blockchain can't be used afterwards)."""
+        self.__miner.cancel()
+        with self.__mining_lock:
+            self.__miner.close()
+        self.__verifier.close()
+        self.__broadcaster.close()
+        self.__chain.close()
+
+    def get_broadcast_stats(self):
+        """Return the queue depth and per-peer delivery counters and latencies of the broadcasts."""
+        return self.__broadcaster.stats()
+
+    def register_metrics(self):
+        """Point the gauges of /metrics (chain, mempool, peers, mining and caches) at this blockchain."""
+        metrics.gauge('wipcoin_chain_height', 'Height of the last block.', lambda: self.get_tip()['height'])
+        metrics.gauge('wipcoin_chain_cumulative_work', 'Cumulative work of the chain.', lambda: self.get_tip()['cumulative_work'])
+        metrics.gauge('wipcoin_open_entries', 'Number of open transactions and chipsactions.', lambda: {
+            (('kind', 'transaction'),): len(self.get_open_transactions()),
+            (('kind', 'chipsaction'),): len(self.get_open_chipsactions())
+        })
+        metrics.gauge('wipcoin_peers', 'Number of peer nodes.', lambda: len(self.get_peer_nodes()))
+        metrics.gauge('wipcoin_sync_validated_height', 'Height up to which the blocks of the running sync were validated.',
+                      lambda: self.__sync_validated_height)
+        metrics.gauge('wipcoin_broadcast_queue_depth', 'Number of broadcast messages waiting to be sent.',
+                      lambda: self.get_broadcast_stats()['queue_depth'])
+        metrics.gauge('wipcoin_proof_of_work_hash_rate', 'Hashes per second of the last proof of work.',
+                      lambda: (self.get_mining_stats() or {}).get('hash_rate'))
+        metrics.gauge('wipcoin_signature_cache_entries', 'Number of cached signature check results.',
+                      lambda: Verification.signature_cache_stats()['size'])
+        metrics.gauge('wipcoin_signature_cache_lookups', 'Number of signature cache lookups by result.', lambda: {
+            (('result', 'hit'),): Verification.signature_cache_stats()['hits'],
+            (('result', 'miss'),): Verification.signature_cache_stats()['misses']
+        })
+
+    def get_mining_stats(self):
+        """Return the hashes, duration, hash rate and cancel state of the last mining run."""
+        return self.__miner.last_stats
 
     def get_balance(self, sender=None):
-        """Calculate and return the balance for a participant.
+        """Return the balance for a participant from the ledger index.
+
+        Arguments:
+            :sender: The participant (defaults to the hosting node's public key).
         """
         if sender == None:
             if self.public_key == None:
@@ -142,44 +379,86 @@ class Blockchain:
             participant = self.public_key
         else:
             participant = sender
+        if not self.check_ledger:
+            with self.lock.read():
+                return self.__ledger.balance(participant)
+        # The check may rebuild the ledger, so it needs the write lock
+        with self.lock.write():
+            balance = self.__ledger.balance(participant)
+            scanned_balance = Ledger.scan_balance(
+                participant, self.__chain, self.__open_transactions.values(), self.__open_chipsactions.values())
+            if abs(scanned_balance - balance) > 1e-9:
+                print('Ledger is inconsistent, rebuilding')
+                self.__ledger.rebuild(self.__chain, self.__open_transactions.values(), self.__open_chipsactions.values())
+                return scanned_balance
+            return balance
+
+    @read_locked
+    def get_address_history(self, address, before=None, limit=100):
+        """Return a page of the transactions and chipsactions of an address (newest first) and the cursor of the next page.
 
-        # Fetch a list of tx and chip transactions sent (empty lists are returned if the person was NOT the sender)
-        # This fetches sent amounts of transactions that were already included in blocks of the blockchain
-        tx_sender = [[tx.amount for tx in block.transactions
-                      if tx.sender == participant] for block in self.__chain]
-        open_tx_sender = [tx.amount
-                          for tx in self.__open_transactions if tx.sender == participant]
-        tx_sender.append(open_tx_sender)
-        print(tx_sender)
-        amount_sent = reduce(lambda tx_sum, tx_amt: tx_sum + sum(tx_amt)
-                             if len(tx_amt) > 0 else tx_sum + 0, tx_sender, 0)
-
-        tx_sender1 = [[tx.amount for tx in block.chipsactions
-                      if tx.sender == participant] for block in self.__chain]
-        open_tx_sender1 = [tx.amount
-                          for tx in self.__open_chipsactions if tx.sender == participant]
-        tx_sender1.append(open_tx_sender1)
-        print(tx_sender1)
-        amount_sent1 = reduce(lambda tx_sum, tx_amt: tx_sum + sum(tx_amt)
-                             if len(tx_amt) > 0 else tx_sum + 0, tx_sender1, 0)
-
-
-        # This fetches received tx and chip amounts of transactions that were already included in blocks of the blockchain
-        tx_recipient = [[tx.amount for tx in block.transactions
-                         if tx.recipient == participant] for block in self.__chain]
-        amount_received = reduce(lambda tx_sum, tx_amt: tx_sum + sum(tx_amt)
-                                 if len(tx_amt) > 0 else tx_sum + 0, tx_recipient, 0)
-
-        tx_recipient1 = [[tx.amount for tx in block.chipsactions
-                         if tx.recipient == participant] for block in self.__chain]
-        amount_received1 = reduce(lambda tx_sum, tx_amt: tx_sum + sum(tx_amt)
-                                 if len(tx_amt) > 0 else tx_sum + 0, tx_recipient1, 0)
-                                 
-        # Return the total balance
-        total_amount_sent = amount_sent + amount_sent1
-        total_amount_received = amount_received + amount_received1
-        return total_amount_received - total_amount_sent
+        Arguments:
+            :address: The address whose history should be returned.
+            :before: The cursor returned with the previous page (defaults to the newest entry).
+            :limit: The maximum number of entries.
+        """
+        entries, next_before = self.__addresses.history(address, before, limit)
+        history = []
+        for height, kind, position in entries:
+            block = self.__chain[height]
+            tx = block.transactions[position] if kind == 'transaction' else block.chipsactions[position]
+            history.append({'height': height, 'position': position, 'type': kind, 'timestamp': block.timestamp, kind: tx.to_dict()})
+        return history, next_before
+
+    def _chipsaction_entries(self, entries):
+        chipsactions = []
+        for height, position in entries:
+            block = self.__chain[height]
+            chipsactions.append({'height': height, 'position': position, 'timestamp': block.timestamp,
+                                 'chipsaction': block.chipsactions[position].to_dict()})
+        return chipsactions
+
+    def _chips_summary(self, aggregate, latest):
+        if aggregate is None:
+            return {'count': 0, 'total': 0, 'latest': []}
+        return {'count': aggregate.count(), 'total': aggregate.total, 'latest': self._chipsaction_entries(aggregate.latest(latest))}
+
+    @read_locked
+    def get_place_summary(self, place, latest=10):
+        """Return the number and total amount of the chipsactions of a place and its latest chipsactions (newest first).
+
+        Arguments:
+            :place: The placeID (UUID of the beacon).
+            :latest: The number of latest chipsactions which are returned.
+        """
+        return self._chips_summary(self.__places.place(place), latest)
+
+    @read_locked
+    def get_recipient_summary(self, recipient, latest=10):
+        """Return the number and total amount of the chipsactions sent to a recipient (author) and the latest ones.
+
+        Arguments:
+            :recipient: The address of the author.
+            :latest: The number of latest chipsactions which are returned.
+        """
+        return self._chips_summary(self.__places.recipient(recipient), latest)
 
+    @read_locked
+    def get_place_chipsactions(self, place, before=None, limit=100):
+        """Return a page of the chipsactions of a place (newest first) and the cursor of the next page.
+
+        Arguments:
+            :place: The placeID (UUID of the beacon).
+            :before: The cursor returned with the previous page (defaults to the newest chipsaction).
+            :limit: The maximum number of chipsactions.
+        """
+        aggregate = self.__places.place(place)
+        if aggregate is None:
+            return [], None
+        entries, next_before = aggregate.page(before, limit)
+        return self._chipsaction_entries(entries), next_before
+
+    @read_locked
     def get_last_blockchain_value(self):
         """ Returns the last value of the current blockchain. """
         if len(self.__chain) < 1:
@@ -187,6 +466,7 @@ class Blockchain:
         return self.__chain[-1]
 
 
+    @write_locked
     def add_transaction(self, sender, recipient, signature, amount=1.0, is_receiving=False):
         """ 
         Arguments:
@@ -195,23 +475,20 @@ class Blockchain:
             :amount: The amount of coins sent with the transaction (default = 1.0)
         """
         transaction = Transaction(sender, recipient, signature, amount)
+        # Reject transactions we already know
+        if transaction.txid in self.__open_transactions:
+            return False
         if Verification.verify_transaction(transaction, self.get_balance):
-            self.__open_transactions.append(transaction)
-            self.save_data()
+            if not self._add_open(self.__open_transactions, transaction, 'transaction'):
+                return False
             if not is_receiving:
-                for node in self.__peer_nodes:
-                    url = 'http://{}/broadcast-transaction'.format(node)
-                    try:
-                        response = requests.post(url, json={
-                                                 'sender': sender, 'recipient': recipient, 'amount': amount, 'signature': signature})
-                        if response.status_code == 400 or response.status_code == 500:
-                            print('Transaction declined, needs resolving')
-                            return False
-                    except requests.exceptions.ConnectionError:
-                        continue
+                self.__broadcaster.broadcast('/broadcast-transaction', {
+                    'sender': sender, 'recipient': recipient, 'amount': amount, 'signature': signature}, self.__peer_nodes,
+                    encode_transaction(transaction))
             return True
         return False
 
+    @write_locked
     def add_chipsaction(self, sender, recipient, placeID, message, signature, amount=1.0, is_receiving=False):
         """ 
         Arguments:
@@ -222,20 +499,16 @@ class Blockchain:
             :amount: The amount of coins sent with the chipsaction
         """
         chipsaction = Chipsaction(sender, recipient, placeID, message, signature, amount)
+        # Reject chipsactions we already know
+        if chipsaction.txid in self.__open_chipsactions:
+            return False
         if Verification.verify_chipsaction(chipsaction, self.get_balance):
-            self.__open_chipsactions.append(chipsaction)
-            self.save_data()
+            if not self._add_open(self.__open_chipsactions, chipsaction, 'chipsaction'):
+                return False
             if not is_receiving:
-                for node in self.__peer_nodes:
-                    url = 'http://{}/broadcast-chipsaction'.format(node)
-                    try:
-                        response = requests.post(url, json={
-                                                 'sender': sender, 'recipient': recipient, 'placeID': placeID, 'message': message, 'amount': amount, 'signature': signature})
-                        if response.status_code == 400 or response.status_code == 500:
-                            print('Chipsaction declined, needs resolving')
-                            return False
-                    except requests.exceptions.ConnectionError:
-                        continue
+                self.__broadcaster.broadcast('/broadcast-chipsaction', {
+                    'sender': sender, 'recipient': recipient, 'placeID': placeID, 'message': message, 'amount': amount, 'signature': signature}, self.__peer_nodes,
+                    encode_chipsaction(chipsaction))
             return True
         return False
 
@@ -243,120 +516,299 @@ class Blockchain:
         """Create a new block and add open transactions and chipsactions to it."""
         if self.public_key == None:
             return None
-        last_block = self.__chain[-1]
-        hashed_block = hash_block(last_block)
-        proof = self.proof_of_work()
-        reward_transaction = Transaction(
-            'MINING', self.public_key, '', MINING_REWARD)
-
-        copied_transactions = self.__open_transactions[:]
-        for tx in copied_transactions:
-            if not Wallet.verify_transaction(tx):
+        with self.lock.write(), BLOCK_TEMPLATE_SECONDS.time():
+            hashed_block = self.__index.tip_hash()
+            difficulty = self.next_difficulty()
+            # Mine a bounded snapshot of the open transactions, new ones may arrive while the proof is searched
+            copied_transactions, copied_chipsactions = build_block_template(
+                self.__open_transactions.values(), self.__open_chipsactions.values(), self.__ledger.confirmed_balance,
+                self.max_block_transactions, self.max_block_chipsactions)
+            transaction_results, chipsaction_results = self.__verifier.verify(copied_transactions, copied_chipsactions)
+            if not all(transaction_results) or not all(chipsaction_results):
+                # Drop entries with invalid signatures instead of mining them
+                invalid_transactions = [tx for tx, valid in zip(copied_transactions, transaction_results) if not valid]
+                invalid_chipsactions = [tx for tx, valid in zip(copied_chipsactions, chipsaction_results) if not valid]
+                self.remove_open_transactions(invalid_transactions, invalid_chipsactions)
+                self.__ledger.reset_pending(self.__open_transactions.values(), self.__open_chipsactions.values())
+                self.save_journal()
+                copied_transactions = [tx for tx, valid in zip(copied_transactions, transaction_results) if valid]
+                copied_chipsactions = [tx for tx, valid in zip(copied_chipsactions, chipsaction_results) if valid]
+            # The header commits to the reward and the timestamp, so both are fixed before the proof is searched
+            height = len(self.__chain)
+            # Our clock may be behind the timestamps of our peers' blocks, the timestamp has to pass their median anyway
+            timestamp = max(time(), median_time_past(self.__chain, height) + 0.001)
+            template = Block(height, hashed_block, copied_transactions + [reward_transaction(self.public_key, height)],
+                             copied_chipsactions, 0, timestamp, difficulty)
+        proof = self.proof_of_work(template)
+        with self.lock.write():
+            # Give up if mining was cancelled or another block was added in the meantime
+            if proof is None:
+                MINING_ROUNDS.inc(result='cancelled')
                 return None
-        copied_transactions.append(reward_transaction)
-
-        copied_chipsactions = self.__open_chipsactions[:]
-        for tx in copied_chipsactions:
-            if not Wallet.verify_chipsaction(tx):
+            if self.__index.tip_hash() != hashed_block:
+                MINING_ROUNDS.inc(result='stale')
                 return None
-
-        block = Block(len(self.__chain), hashed_block,
-                      copied_transactions, copied_chipsactions, proof)
-        self.__chain.append(block)
-        self.__open_transactions = []
-        self.__open_chipsactions = []
-        self.save_data()
-        for node in self.__peer_nodes:
-            url = 'http://{}/broadcast-block'.format(node)
-            converted_block = block.__dict__.copy()
-            converted_block['transactions'] = [
-                tx.__dict__ for tx in converted_block['transactions']]
-            converted_block['chipsactions'] = [
-                tx.__dict__ for tx in converted_block['chipsactions']]
-            try:
-                response = requests.post(url, json={'block': converted_block})
-                if response.status_code == 400 or response.status_code == 500:
-                    print('Block declined, needs resolving')
-                if response.status_code == 409:
-                    self.resolve_conflicts = True
-            except requests.exceptions.ConnectionError:
-                continue
+            block = Block(template.index, template.previous_hash, template.transactions, template.chipsactions, proof,
+                          template.timestamp, template.difficulty)
+            self._connect_block(block)
+            MINING_ROUNDS.inc(result='mined')
+            self.__broadcaster.broadcast('/broadcast-block', {'block': block.to_dict()}, self.__peer_nodes, encode_block(block))
         return block
 
+    @write_locked
     def add_block(self, block):
-        """Add a block which was received via broadcasting to the local blockchain."""
-        # Create a list of transaction objects
-        transactions = [Transaction(
-            tx['sender'], tx['recipient'], tx['signature'], tx['amount']) for tx in block['transactions']]    
-        chipsactions = [Chipsaction(
-            tx['sender'], tx['recipient'], tx['placeID'], tx['message'], tx['signature'], tx['amount']) for tx in block['chipsactions']]    
-        # Validate the proof of work of the block and store the result (True or False) in a variable
-        proof_is_valid = Verification.valid_proof(
-            transactions[:-1], chipsactions, block['previous_hash'], block['proof'])
+        """Add a block which was received via broadcasting to the local blockchain.
+
+        Arguments:
+            :block: The received Block (decoded from its JSON or binary representation).
+        """
+        # The block has to use the difficulty our chain expects for its height
+        if block.difficulty != self.next_difficulty():
+            BLOCKS_RECEIVED.inc(result='invalid_difficulty')
+            return False
+        # Oversized blocks are rejected before any of their signatures are checked
+        if not Verification.valid_size(block, self.max_block_transactions, self.max_block_chipsactions):
+            BLOCKS_RECEIVED.inc(result='too_large')
+            return False
+        # Blocks can't fall back to an older version than the one of our last block
+        if not Verification.valid_version(block, self.__chain[-1].version):
+            BLOCKS_RECEIVED.inc(result='invalid_version')
+            return False
+        # The timestamps steer the difficulty, so they have to move forward and can't run ahead of our clock
+        if not Verification.valid_timestamp(block, self.__chain, len(self.__chain)):
+            BLOCKS_RECEIVED.inc(result='invalid_timestamp')
+            return False
+        # Validate the proof of work of the block (its header hash) and store the result (True or False) in a variable
+        proof_is_valid = Verification.valid_proof(block)
         # Check if previous_hash stored in the block is equal to the local blockchain's last block's hash and store the result in a block
-        hashes_match = hash_block(self.chain[-1]) == block['previous_hash']
+        hashes_match = self.__index.tip_hash() == block.previous_hash
         if not proof_is_valid or not hashes_match:
+            BLOCKS_RECEIVED.inc(result='invalid_proof' if not proof_is_valid else 'not_on_tip')
             return False
-        # Create a Block object
-        converted_block = Block(
-            block['index'], block['previous_hash'], transactions, chipsactions, block['proof'], block['timestamp'])
-        self.__chain.append(converted_block)
-        stored_transactions = self.__open_transactions[:]
-        stored_chipsactions = self.__open_chipsactions[:]
-        # Check which open transactions were included in the received block and remove them
-        # This could be improved by giving each transaction an ID that would uniquely identify it
-        for itx in block['transactions']:
-            for opentx in stored_transactions:
-                if opentx.sender == itx['sender'] and opentx.recipient == itx['recipient'] and opentx.amount == itx['amount'] and opentx.signature == itx['signature']:
-                    try:
-                        self.__open_transactions.remove(opentx)
-                    except ValueError:
-                        print('Item was already removed')
-
-        for itx in block['chipsactions']:
-            for opentx in stored_chipsactions:
-                if opentx.sender == itx['sender'] and opentx.recipient == itx['recipient'] and opentx.sender == itx['placeID'] and opentx.recipient == itx['message'] and opentx.amount == itx['amount'] and opentx.signature == itx['signature']:
-                    try:
-                        self.__open_chipsactions.remove(opentx)
-                    except ValueError:
-                        print('Item was already removed')
-        self.save_data()
+        # The last transaction is the mining reward which isn't signed
+        if not self.__verifier.verify_all(block.transactions[:-1], block.chipsactions):
+            BLOCKS_RECEIVED.inc(result='invalid_signature')
+            return False
+        # A competing block makes the proof we're currently searching useless
+        self.cancel_mining()
+        self._connect_block(block)
+        BLOCKS_RECEIVED.inc(result='accepted')
         return True
 
-    def resolve(self):
-        """Checks all peer nodes' blockchains and replaces the local one with longer valid ones."""
-        # Initialize the winner chain with the local chain
-        winner_chain = self.chain
-        replace = False
-        for node in self.__peer_nodes:
-            url = 'http://{}/chain'.format(node)
+    @read_locked
+    def get_tip(self):
+        """Return the height, hash and cumulative work of the last block."""
+        return {
+            'height': len(self.__chain) - 1,
+            'hash': self.__index.tip_hash(),
+            'cumulative_work': self.__index.cumulative_work()
+        }
+
+    @read_locked
+    def get_headers(self, start, count):
+        """Return the headers of up to count blocks from the given height on.
+
+        Arguments:
+            :start: The height of the first header.
+            :count: The maximum number of headers.
+        """
+        return [self.__chain[index].header() for index in range(max(start, 0), min(start + count, len(self.__chain)))]
+
+    @read_locked
+    def get_inclusion_proof(self, txid):
+        """Return the Merkle branch which proves that a transaction or chipsaction is part of a block (None if it isn't in the chain).
+
+        A light client checks the branch against the Merkle root of the block header it already verified.
+
+        Arguments:
+            :txid: The txid of the transaction or chipsaction.
+        """
+        entry = self.__txs.locate(txid)
+        if entry is None:
+            return None
+        height, kind, position = entry
+        block = self.__chain[height]
+        txids = [tx.txid for tx in block.transactions] + [tx.txid for tx in block.chipsactions]
+        tx = block.transactions[position] if kind == 'transaction' else block.chipsactions[position]
+        leaf = position if kind == 'transaction' else len(block.transactions) + position
+        return {
+            'txid': txid,
+            'type': kind,
+            kind: tx.to_dict(),
+            'height': height,
+            'header': block.header(),
+            'branch': merkle_branch(txids, leaf),
+            'confirmations': len(self.__chain) - height
+        }
+
+    @read_locked
+    def get_blocks(self, start, count):
+        """Return up to count blocks from the given height on.
+
+        Arguments:
+            :start: The height of the first block.
+            :count: The maximum number of blocks.
+        """
+        return self.__chain[max(start, 0):min(start + count, len(self.__chain))]
+
+    def _peer_get(self, node, path, params=None):
+        response = requests.get('http://{}{}'.format(node, path), params=params, timeout=SYNC_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def _peer_get_blocks(self, node, start, count):
+        """Fetch blocks from a peer, binary encoded if the peer supports it and as JSON otherwise."""
+        response = requests.get('http://{}/blocks'.format(node), params={'from': start, 'count': count},
+                                headers={'Accept': '{}, application/json;q=0.5'.format(BINARY_CONTENT_TYPE)}, timeout=SYNC_TIMEOUT)
+        response.raise_for_status()
+        if response.headers.get('Content-Type', '').startswith(BINARY_CONTENT_TYPE):
+            return decode_blocks(response.content)
+        return [Block.from_dict(block) for block in response.json()]
+
+    def _peer_hash_at(self, node, height):
+        headers = self._peer_get(node, '/headers', {'from': height, 'count': 1})
+        return headers[0]['hash'] if len(headers) > 0 else None
+
+    @read_locked
+    def _hash_at(self, height):
+        return self.__index.hash_at(height)
+
+    def _find_fork_point(self, node, peer_height):
+        """Return the height of the last block our chain shares with a peer's chain."""
+        high = min(self.get_tip()['height'], peer_height)
+        # Usually the peer's chain simply extends ours
+        if self._peer_hash_at(node, high) == self._hash_at(high):
+            return high
+        # Otherwise binary search for the fork (all nodes share the genesis block)
+        low = 0
+        while high - low > 1:
+            middle = (low + high) // 2
+            if self._peer_hash_at(node, middle) == self._hash_at(middle):
+                low = middle
+            else:
+                high = middle
+        return low
+
+    def _download_blocks(self, node, start, end):
+        """Download the blocks from height start up to and including end from a peer."""
+        blocks = []
+        while start + len(blocks) <= end:
+            batch = self._peer_get_blocks(node, start + len(blocks), min(SYNC_BATCH_SIZE, end - start - len(blocks) + 1))
+            if len(batch) == 0:
+                break
+            blocks.extend(batch)
+        return blocks
+
+    def _sync_with(self, node, tip):
+        """Download and validate the blocks a peer has after our common fork point and switch to them if they carry more work.
+
+        Downloading and validating run without the lock (on a snapshot of our chain), only the switch holds the write lock.
+        """
+        fork_height = self._find_fork_point(node, tip['height'])
+        blocks = self._download_blocks(node, fork_height + 1, tip['height'])
+        if len(blocks) == 0:
+            return False
+        candidate = SplicedChain(self.chain, fork_height + 1, blocks)
+        parallel = len(blocks) >= PARALLEL_VERIFICATION_THRESHOLD and self.__verifier.workers > 1
+        self.__sync_validated_height = fork_height
+        try:
+            with CHAIN_VERIFICATION_SECONDS.time(mode='parallel' if parallel else 'serial'):
+                valid = Verification.verify_chain(candidate, self.retarget_interval, self.target_block_time, self.__verifier, fork_height + 1,
+                                                  parallel, self._on_sync_progress, self.max_block_transactions, self.max_block_chipsactions)
+        finally:
+            self.__sync_validated_height = None
+        if not valid:
+            print('Chain of {} is invalid'.format(node))
+            return False
+        with self.lock.write():
+            # Blocks may have been added while we validated, they're part of the work which would be rolled back
+            rolled_back_work = self.__index.cumulative_work() - self.__index.cumulative_work(fork_height)
+            if sum(block.difficulty for block in blocks) <= rolled_back_work:
+                return False
+            self._switch_fork(fork_height, blocks)
+        return True
+
+    def _on_sync_progress(self, height):
+        """Record the height up to which the blocks of the running sync were validated (called by the verification)."""
+        self.__sync_validated_height = height
+
+    @write_locked
+    def _switch_fork(self, fork_height, blocks):
+        """Roll back our blocks after the fork height and connect the given blocks instead.
+
+        Extending the chain appends the blocks. A reorganization swaps in a new block log atomically, so readers
+        which still hold a view of the old chain keep seeing the old blocks.
+        """
+        reorganized = fork_height < len(self.__chain) - 1
+        if not reorganized:
+            for block in blocks:
+                self._connect_block(block, save_journal=False)
+            self.save_journal()
+            return
+        old_chain = self.__chain
+        try:
+            with PERSISTENCE_SECONDS.time(operation='fork_chain'):
+                self.__chain = self.__storage.fork_chain(old_chain, fork_height + 1, blocks)
+        except IOError:
+            print('Saving failed!')
+            return
+        for index in range(len(old_chain) - 1, fork_height, -1):
+            self._disconnect_block(old_chain[index])
+        self.__index.truncate(fork_height + 1)
+        # Our open transactions were created against the old chain, so they're discarded
+        # (their cached signature results aren't needed anymore)
+        Verification.invalidate_signatures(self.__open_transactions.values(), self.__open_chipsactions.values())
+        self.__open_transactions.clear()
+        self.__open_chipsactions.clear()
+        for block in blocks:
+            self._index_block(block)
+        self.save_journal()
+
+    def sync(self):
+        """Sync with the peer node whose chain carries the most cumulative work.
+
+        The tips of all peers are fetched concurrently. For the best peer only the headers needed to find the
+        fork point and the blocks after it are downloaded and validated.
+        """
+        with self.__sync_lock:
+            return self._sync()
+
+    def _sync(self):
+        peers = self.get_peer_nodes()
+        if len(peers) == 0:
+            return False
+
+        def fetch_tip(node):
+            try:
+                tip = self._peer_get(node, '/tip')
+            except (requests.exceptions.RequestException, ValueError):
+                return node, None
+            # Peers whose tip we can't compare are skipped, they can't break the sync for the others
+            if not valid_tip(tip):
+                print('Tip of {} is malformed'.format(node))
+                return node, None
+            return node, tip
+
+        with ThreadPoolExecutor(max_workers=min(len(peers), SYNC_MAX_PEER_REQUESTS)) as executor:
+            tips = [(node, tip) for node, tip in executor.map(fetch_tip, peers) if tip is not None]
+        tips.sort(key=lambda node_tip: node_tip[1]['cumulative_work'], reverse=True)
+        for node, tip in tips:
+            if tip['cumulative_work'] <= self.get_tip()['cumulative_work']:
+                break
             try:
-                # Send a request and store the response
-                response = requests.get(url)
-                # Retrieve the JSON data as a dictionary
-                node_chain = response.json()
-                # Convert the dictionary list to a list of block AND transaction objects
-                node_chain = [Block(block['index'], block['previous_hash'], [Transaction(
-                    tx['sender'], tx['recipient'], tx['signature'], tx['amount']) for tx in block['transactions']],
-                    [Chipsaction(tx['sender'], tx['recipient'], tx['placeID'], tx['message'], tx['signature'], tx['amount']) for tx in block['chipsactions']],
-                                    block['proof'], block['timestamp']) for block in node_chain]
-                node_chain_length = len(node_chain)
-                local_chain_length = len(winner_chain)
-                # Store the received chain as the current winner chain if it's longer AND valid
-                if node_chain_length > local_chain_length and Verification.verify_chain(node_chain):
-                    winner_chain = node_chain
-                    replace = True
-            except requests.exceptions.ConnectionError:
-                continue
+                if self._sync_with(node, tip):
+                    return True
+            except (requests.exceptions.RequestException, ValueError, KeyError, IndexError, TypeError) as e:
+                print('Syncing with {} failed: {}'.format(node, e))
+        return False
+
+    def resolve(self):
+        """Checks all peer nodes' blockchains and switches to the valid one with the most cumulative work."""
+        replace = self.sync()
         self.resolve_conflicts = False
-        # Replace the local chain with the winner chain
-        self.chain = winner_chain
-        if replace:
-            self.__open_transactions = []
-            self.__open_chipsactions = []
-        self.save_data()
         return replace
 
+    @write_locked
     def add_peer_node(self, node):
         """Adds a new node to the peer node set.
 
@@ -364,8 +816,9 @@ class Blockchain:
             :node: The node URL which should be added.
         """
         self.__peer_nodes.add(node)
-        self.save_data()
+        self.journal('add_peer', node)
 
+    @write_locked
     def remove_peer_node(self, node):
         """Removes a node from the peer node set.
 
@@ -373,8 +826,10 @@ class Blockchain:
             :node: The node URL which should be removed.
         """
         self.__peer_nodes.discard(node)
-        self.save_data()
+        self.__broadcaster.remove_peer(node)
+        self.journal('remove_peer', node)
 
+    @read_locked
     def get_peer_nodes(self):
         """Return a list of all connected peer nodes."""
         return list(self.__peer_nodes)
@@ -0,0 +1,195 @@
+import queue
+import threading
+from time import sleep, time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from codec import BINARY_CONTENT_TYPE
+from utility.metrics import metrics
+
+# The number of messages which may wait for a single peer before new ones are dropped
+PEER_QUEUE_SIZE = 1000
+# The number of seconds we wait for a peer to answer
+PEER_TIMEOUT = 5
+# How often a message is retried after a connection error or timeout
+PEER_RETRIES = 2
+# The number of seconds we wait before the first retry (doubled for every further retry)
+RETRY_BACKOFF = 0.5
+
+BROADCAST_REQUEST_SECONDS = metrics.histogram('wipcoin_broadcast_request_seconds', 'Duration of the requests which deliver broadcasts to peers.')
+BROADCAST_MESSAGES = metrics.counter('wipcoin_broadcast_messages_total', 'Number of broadcast messages by result.')
+
+
+class PeerChannel:
+    """Sends messages to a single peer from a background thread, in the order in which they were queued.
+
+    Every peer has its own thread, queue and pooled HTTP session, so a slow peer only delays its own messages.
+    Messages with a binary encoding are sent binary until the peer answers 415 (Unsupported Media Type), from then on
+    the JSON payload is sent instead.
+
+    Attributes:
+        :node: The peer node (host:port).
+        :sent: The number of messages which were delivered.
+        :failed: The number of messages which couldn't be delivered (after all retries).
+        :dropped: The number of messages which were dropped because the queue was full.
+        :last_latency: The duration of the last request in seconds.
+        :avg_latency: The exponential moving average of the request durations in seconds.
+        :binary: Whether the peer accepts binary encoded payloads.
+    """
+
+    def __init__(self, node, on_response, queue_size=PEER_QUEUE_SIZE, timeout=PEER_TIMEOUT, retries=PEER_RETRIES):
+        self.node = node
+        self.timeout = timeout
+        self.retries = retries
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.last_latency = None
+        self.avg_latency = None
+        self.binary = True
+        self.__on_response = on_response
+        self.__closed = False
+        self.__queue = queue.Queue(queue_size)
+        self.__session = requests.Session()
+        self.__session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.__thread = threading.Thread(target=self._run, name='broadcast-{}'.format(node), daemon=True)
+        self.__thread.start()
+
+    def queue_depth(self):
+        """Return the number of messages waiting to be sent."""
+        return self.__queue.qsize()
+
+    def send(self, path, payload, binary=None):
+        """Queue a message, returns False if it had to be dropped because the peer falls behind."""
+        try:
+            self.__queue.put_nowait((path, payload, binary))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            BROADCAST_MESSAGES.inc(path=path, result='dropped')
+            print('Broadcast to {} dropped, queue is full'.format(self.node))
+            return False
+
+    def close(self):
+        """Stop the background thread (messages which are still queued are discarded)."""
+        self.__closed = True
+        try:
+            # Wake the thread up in case it waits for a message
+            self.__queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _post(self, path, payload, binary=None):
+        url = 'http://{}{}'.format(self.node, path)
+        for attempt in range(self.retries + 1):
+            start = time()
+            try:
+                if binary is not None and self.binary:
+                    response = self.__session.post(url, data=binary, headers={'Content-Type': BINARY_CONTENT_TYPE}, timeout=self.timeout)
+                    if response.status_code == 415:
+                        # The peer only understands JSON
+                        self.binary = False
+                        response = self.__session.post(url, json=payload, timeout=self.timeout)
+                else:
+                    response = self.__session.post(url, json=payload, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt < self.retries:
+                    sleep(RETRY_BACKOFF * 2 ** attempt)
+                continue
+            latency = time() - start
+            BROADCAST_REQUEST_SECONDS.observe(latency, path=path)
+            self.last_latency = latency
+            self.avg_latency = latency if self.avg_latency is None else 0.8 * self.avg_latency + 0.2 * latency
+            return response
+        return None
+
+    def _run(self):
+        while True:
+            message = self.__queue.get()
+            if message is None or self.__closed:
+                self.__session.close()
+                return
+            path, payload, binary = message
+            response = self._post(path, payload, binary)
+            if response is None:
+                self.failed += 1
+                BROADCAST_MESSAGES.inc(path=path, result='failed')
+                continue
+            self.sent += 1
+            BROADCAST_MESSAGES.inc(path=path, result='sent')
+            if self.__on_response is not None:
+                try:
+                    self.__on_response(self.node, path, response.status_code)
+                except Exception as e:
+                    print('Handling the response of {} failed: {}'.format(self.node, e))
+
+
+class Broadcaster:
+    """Fans messages out to all peer nodes without blocking the caller.
+
+    Attributes:
+        :queue_size: The number of messages which may wait for a single peer.
+        :timeout: The number of seconds we wait for a peer to answer.
+        :retries: How often a message is retried after a connection error or timeout.
+    """
+
+    def __init__(self, on_response=None, queue_size=PEER_QUEUE_SIZE, timeout=PEER_TIMEOUT, retries=PEER_RETRIES):
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retries = retries
+        self.__on_response = on_response
+        self.__channels = {}
+        self.__lock = threading.Lock()
+
+    def _channel(self, node):
+        with self.__lock:
+            channel = self.__channels.get(node)
+            if channel is None:
+                channel = PeerChannel(node, self.__on_response, self.queue_size, self.timeout, self.retries)
+                self.__channels[node] = channel
+            return channel
+
+    def broadcast(self, path, payload, nodes, binary=None):
+        """Queue a message for every given peer node and return immediately.
+
+        Arguments:
+            :path: The path of the endpoint on the peers (e.g. '/broadcast-transaction').
+            :payload: The JSON-serializable body of the request.
+            :nodes: The peer nodes the message is sent to.
+            :binary: The binary encoded body (see the codec module) which is sent to peers that accept it.
+        """
+        for node in nodes:
+            self._channel(node).send(path, payload, binary)
+
+    def remove_peer(self, node):
+        """Stop sending messages to a peer node."""
+        with self.__lock:
+            channel = self.__channels.pop(node, None)
+        if channel is not None:
+            channel.close()
+
+    def close(self):
+        """Stop the threads of all peers (messages which are still queued are discarded)."""
+        with self.__lock:
+            channels = list(self.__channels.values())
+            self.__channels = {}
+        for channel in channels:
+            channel.close()
+
+    def stats(self):
+        """Return the total queue depth and the delivery counters and latencies per peer."""
+        with self.__lock:
+            channels = list(self.__channels.values())
+        return {
+            'queue_depth': sum(channel.queue_depth() for channel in channels),
+            'peers': {channel.node: {
+                'queue_depth': channel.queue_depth(),
+                'sent': channel.sent,
+                'failed': channel.failed,
+                'dropped': channel.dropped,
+                'last_latency': channel.last_latency,
+                'avg_latency': channel.avg_latency,
+                'binary': channel.binary
+            } for channel in channels}
+        }
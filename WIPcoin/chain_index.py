@@ -0,0 +1,49 @@
+class ChainIndex:
+    """Keeps the hash and the cumulative work of every block by height, so tip and fork checks don't need to hash blocks.
+
+    Attributes:
+        :hashes: The hash of the block at every height.
+        :work: The cumulative work (sum of the difficulties) of the chain up to and including every height.
+    """
+
+    def __init__(self):
+        self.hashes = []
+        self.work = []
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def append(self, block):
+        """Add the next block of the chain.
+
+        Arguments:
+            :block: The block that was appended to the chain.
+        """
+        self.hashes.append(block.hash)
+        self.work.append(self.cumulative_work() + block.difficulty)
+
+    def truncate(self, length):
+        """Drop the entries of the blocks from height length on (after they were rolled back)."""
+        del self.hashes[length:]
+        del self.work[length:]
+
+    def rebuild(self, chain):
+        """Rebuild the whole index from a chain."""
+        self.hashes = []
+        self.work = []
+        for block in chain:
+            self.append(block)
+
+    def hash_at(self, height):
+        """Return the hash of the block at the given height."""
+        return self.hashes[height]
+
+    def tip_hash(self):
+        """Return the hash of the last block."""
+        return self.hashes[-1]
+
+    def cumulative_work(self, height=None):
+        """Return the cumulative work up to and including a height (defaults to the whole chain)."""
+        if len(self.work) == 0:
+            return 0
+        return self.work[-1 if height is None else height]
@@ -1,26 +1,45 @@
-from collections import OrderedDict
-
-from utility.printable import Printable
-
-class Chipsaction(Printable):
-    """ A 2nd type of a transaction which can be added to a block in the blockchain.
-
-    Attributes:
-        :sender: The sender of the chip.
-        :AuthorID: The recipient of the chip.
-        :placeID: The address of the place.
-        :message: The message from the fan.
-        :signature: The signature of the chip.
-        :amount: The amount of coins chip.
-    """
-    def __init__(self, sender, recipient, place, message, signature, amount):
-        self.sender = sender
-        self.recipient = recipient
-        self.placeID = place
-        self.message = message
-        self.amount = amount
-        self.signature = signature
-
-    def to_ordered_dict(self):
-        """Converts this chipsaction into a (hashable) OrderedDict."""
-        return OrderedDict([('sender', self.sender), ('recipinet', self.recipient), ('placeID', self.placeID), ('message', self.message), ('amount', self.amount)])
\ No newline at end of file
+from collections import OrderedDict
+import json
+from sys import intern
+
+from utility.hash_util import hash_string_256
+from utility.record import Record
+
+class Chipsaction(Record):
+    """ A 2nd type of a transaction which can be added to a block in the blockchain.
+
+    Chipsactions are immutable. The addresses and the placeID are interned, so they're shared between chipsactions.
+
+    Attributes:
+        :sender: The sender of the chip.
+        :AuthorID: The recipient of the chip.
+        :placeID: The address of the place.
+        :message: The message from the fan.
+        :signature: The signature of the chip.
+        :amount: The amount of coins chip.
+        :txid: The unique id of the chipsaction (derived from its content).
+    """
+    __slots__ = ('sender', 'recipient', 'placeID', 'message', 'amount', 'signature', 'txid')
+
+    def __init__(self, sender, recipient, place, message, signature, amount):
+        self._set('sender', intern(sender))
+        self._set('recipient', intern(recipient))
+        self._set('placeID', intern(place))
+        self._set('message', message)
+        self._set('amount', amount)
+        self._set('signature', signature)
+        self._set('txid', hash_string_256(json.dumps(['chipsaction', sender, recipient, place, message, amount, signature]).encode()))
+
+    def to_ordered_dict(self):
+        """Converts this chipsaction into a (hashable) OrderedDict."""
+        return OrderedDict([('sender', self.sender), ('recipinet', self.recipient), ('placeID', self.placeID), ('message', self.message), ('amount', self.amount)])
+
+    def to_dict(self):
+        """Converts this chipsaction into a JSON-serializable dict."""
+        return {'sender': self.sender, 'recipient': self.recipient, 'placeID': self.placeID, 'message': self.message,
+                'amount': self.amount, 'signature': self.signature, 'txid': self.txid}
+
+    @classmethod
+    def from_dict(cls, tx):
+        """Create a chipsaction from its dict representation (the txid is derived again)."""
+        return cls(tx['sender'], tx['recipient'], tx['placeID'], tx['message'], tx['signature'], tx['amount'])
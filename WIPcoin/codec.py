@@ -0,0 +1,264 @@
+"""A compact binary codec for blocks, transactions and chipsactions.
+
+Every encoded payload starts with a version byte. Numbers are stored as tagged varints (integers) or
+8-byte doubles (floats), so they decode to exactly the values the hashes were calculated from. Strings
+are length-prefixed and hex strings (keys, signatures and hashes) are stored as their raw bytes.
+"""
+
+import struct
+
+from block import Block, LEGACY_BLOCK_VERSION
+from transaction import Transaction
+from chipsaction import Chipsaction
+
+# The version of the binary format (the first byte of every encoded payload)
+CODEC_VERSION = 2
+# The versions which can be decoded (version 1 payloads predate block versions and contain legacy blocks)
+SUPPORTED_CODEC_VERSIONS = (1, 2)
+# The content type under which nodes exchange binary encoded payloads (JSON is the fallback)
+BINARY_CONTENT_TYPE = 'application/x-wipcoin'
+
+# Tags of the string fields
+_TEXT = 0
+_HEX = 1
+# Tags of the number fields
+_INT = 0
+_FLOAT = 1
+
+_DOUBLE = struct.Struct('>d')
+
+
+def _write_varint(out, value):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _write_number(out, value):
+    if isinstance(value, int):
+        out.append(_INT)
+        # Zigzag encoding keeps small negative numbers small
+        _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+    else:
+        out.append(_FLOAT)
+        out += _DOUBLE.pack(value)
+
+
+def _write_string(out, value):
+    try:
+        raw = bytes.fromhex(value)
+        tag = _HEX if raw.hex() == value else _TEXT
+    except ValueError:
+        tag = _TEXT
+    if tag == _TEXT:
+        raw = value.encode('utf8')
+    out.append(tag)
+    _write_varint(out, len(raw))
+    out += raw
+
+
+class _Reader:
+    """Reads the fields of an encoded payload (raises ValueError if the payload is truncated or malformed)."""
+
+    def __init__(self, data):
+        self.data = bytes(data)
+        self.position = 0
+        self.codec_version = None
+
+    def byte(self):
+        try:
+            value = self.data[self.position]
+        except IndexError:
+            raise ValueError('Payload is truncated')
+        self.position += 1
+        return value
+
+    def raw(self, length):
+        end = self.position + length
+        if end > len(self.data):
+            raise ValueError('Payload is truncated')
+        value = self.data[self.position:end]
+        self.position = end
+        return value
+
+    def varint(self):
+        byte = self.byte()
+        # Most lengths and counts fit into a single byte
+        if byte < 0x80:
+            return byte
+        value = byte & 0x7f
+        shift = 7
+        while True:
+            byte = self.byte()
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def number(self):
+        tag = self.byte()
+        if tag == _INT:
+            value = self.varint()
+            return value // 2 if value % 2 == 0 else -(value + 1) // 2
+        if tag == _FLOAT:
+            return _DOUBLE.unpack(self.raw(_DOUBLE.size))[0]
+        raise ValueError('Unknown number tag {}'.format(tag))
+
+    def string(self):
+        tag = self.byte()
+        raw = self.raw(self.varint())
+        if tag == _HEX:
+            return raw.hex()
+        if tag == _TEXT:
+            return raw.decode('utf8')
+        raise ValueError('Unknown string tag {}'.format(tag))
+
+    def version(self):
+        version = self.byte()
+        if version not in SUPPORTED_CODEC_VERSIONS:
+            raise ValueError('Unsupported codec version {}'.format(version))
+        self.codec_version = version
+
+    def end(self):
+        if self.position != len(self.data):
+            raise ValueError('Payload has trailing data')
+
+
+def _write_transaction(out, tx):
+    _write_string(out, tx.sender)
+    _write_string(out, tx.recipient)
+    _write_number(out, tx.amount)
+    _write_string(out, tx.signature)
+
+
+def _read_transaction(reader):
+    sender = reader.string()
+    recipient = reader.string()
+    amount = reader.number()
+    return Transaction(sender, recipient, reader.string(), amount)
+
+
+def _write_chipsaction(out, tx):
+    _write_string(out, tx.sender)
+    _write_string(out, tx.recipient)
+    _write_string(out, tx.placeID)
+    _write_string(out, tx.message)
+    _write_number(out, tx.amount)
+    _write_string(out, tx.signature)
+
+
+def _read_chipsaction(reader):
+    sender = reader.string()
+    recipient = reader.string()
+    place = reader.string()
+    message = reader.string()
+    amount = reader.number()
+    return Chipsaction(sender, recipient, place, message, reader.string(), amount)
+
+
+def _write_block(out, block):
+    _write_number(out, block.index)
+    _write_string(out, block.previous_hash)
+    _write_number(out, block.timestamp)
+    _write_number(out, block.proof)
+    _write_number(out, block.difficulty)
+    _write_varint(out, block.version)
+    _write_varint(out, len(block.transactions))
+    for tx in block.transactions:
+        _write_transaction(out, tx)
+    _write_varint(out, len(block.chipsactions))
+    for tx in block.chipsactions:
+        _write_chipsaction(out, tx)
+
+
+def _read_block(reader):
+    index = reader.number()
+    previous_hash = reader.string()
+    timestamp = reader.number()
+    proof = reader.number()
+    difficulty = reader.number()
+    version = reader.varint() if reader.codec_version >= 2 else LEGACY_BLOCK_VERSION
+    transactions = [_read_transaction(reader) for _ in range(reader.varint())]
+    chipsactions = [_read_chipsaction(reader) for _ in range(reader.varint())]
+    return Block(index, previous_hash, transactions, chipsactions, proof, timestamp, difficulty, version)
+
+
+def _encode(write, value):
+    out = bytearray([CODEC_VERSION])
+    write(out, value)
+    return bytes(out)
+
+
+def _decode(read, data):
+    reader = _Reader(data)
+    reader.version()
+    value = read(reader)
+    reader.end()
+    return value
+
+
+def encode_transaction(tx):
+    """Encode a transaction into bytes."""
+    return _encode(_write_transaction, tx)
+
+
+def decode_transaction(data):
+    """Decode a transaction which was encoded with encode_transaction."""
+    return _decode(_read_transaction, data)
+
+
+def encode_chipsaction(tx):
+    """Encode a chipsaction into bytes."""
+    return _encode(_write_chipsaction, tx)
+
+
+def decode_chipsaction(data):
+    """Decode a chipsaction which was encoded with encode_chipsaction."""
+    return _decode(_read_chipsaction, data)
+
+
+def encode_block(block):
+    """Encode a block (including its transactions and chipsactions) into bytes."""
+    return _encode(_write_block, block)
+
+
+def decode_block(data):
+    """Decode a block which was encoded with encode_block."""
+    return _decode(_read_block, data)
+
+
+def encode_blocks_header(count):
+    """Return the start of an encoded list of count blocks (followed by the encode_blocks_item of every block)."""
+    out = bytearray([CODEC_VERSION])
+    _write_varint(out, count)
+    return bytes(out)
+
+
+def encode_blocks_item(block):
+    """Return a single length-prefixed block of an encoded list of blocks."""
+    payload = bytearray()
+    _write_block(payload, block)
+    out = bytearray()
+    _write_varint(out, len(payload))
+    return bytes(out + payload)
+
+
+def encode_blocks(blocks):
+    """Encode a list of blocks into bytes (every block is length-prefixed, so the list can be streamed)."""
+    return encode_blocks_header(len(blocks)) + b''.join(encode_blocks_item(block) for block in blocks)
+
+
+def decode_blocks(data):
+    """Decode a list of blocks which was encoded with encode_blocks."""
+    reader = _Reader(data)
+    reader.version()
+    blocks = []
+    for _ in range(reader.varint()):
+        length = reader.varint()
+        end = reader.position + length
+        blocks.append(_read_block(reader))
+        if reader.position != end:
+            raise ValueError('Block length doesn\'t match its content')
+    reader.end()
+    return blocks
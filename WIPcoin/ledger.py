@@ -0,0 +1,89 @@
+from itertools import chain as iter_chain
+
+
+class Ledger:
+    """Keeps a per-address balance index so balances don't need a full chain scan.
+
+    Attributes:
+        :confirmed: The balances that result from the transactions and chipsactions stored in blocks.
+        :pending: The (negative) deltas caused by open transactions and chipsactions of a sender.
+    """
+
+    def __init__(self):
+        self.confirmed = {}
+        self.pending = {}
+
+    def _credit(self, balances, address, amount):
+        balances[address] = balances.get(address, 0) + amount
+
+    def apply_block(self, block):
+        """Add the transactions and chipsactions of a block to the confirmed balances.
+
+        Arguments:
+            :block: The block that was appended to the chain.
+        """
+        for tx in block.transactions + block.chipsactions:
+            self._credit(self.confirmed, tx.sender, -tx.amount)
+            self._credit(self.confirmed, tx.recipient, tx.amount)
+
+    def revert_block(self, block):
+        """Remove the transactions and chipsactions of a block (which was rolled back) from the confirmed balances."""
+        for tx in block.transactions + block.chipsactions:
+            self._credit(self.confirmed, tx.sender, tx.amount)
+            self._credit(self.confirmed, tx.recipient, -tx.amount)
+
+    def add_pending(self, tx):
+        """Reserve the amount of an open transaction or chipsaction on the sender's balance.
+
+        Arguments:
+            :tx: The transaction or chipsaction which was added to the open ones.
+        """
+        self._credit(self.pending, tx.sender, -tx.amount)
+
+    def remove_pending(self, tx):
+        """Release the amount of an open transaction or chipsaction which was removed without being mined."""
+        self._credit(self.pending, tx.sender, tx.amount)
+
+    def reset_pending(self, open_transactions, open_chipsactions):
+        """Recalculate the pending deltas from the remaining open transactions and chipsactions."""
+        self.pending = {}
+        for tx in iter_chain(open_transactions, open_chipsactions):
+            self.add_pending(tx)
+
+    def rebuild(self, chain, open_transactions, open_chipsactions):
+        """Rebuild the whole index from a chain and the open transactions and chipsactions."""
+        self.confirmed = {}
+        for block in chain:
+            self.apply_block(block)
+        self.reset_pending(open_transactions, open_chipsactions)
+
+    def confirmed_balance(self, address):
+        """Return the balance of an address without its pending deltas."""
+        return self.confirmed.get(address, 0)
+
+    def balance(self, address):
+        """Return the balance of an address including its pending deltas."""
+        return self.confirmed.get(address, 0) + self.pending.get(address, 0)
+
+    @staticmethod
+    def scan_balance(participant, chain, open_transactions, open_chipsactions):
+        """Calculate the balance of a participant by scanning the whole chain (used to check the index).
+
+        Arguments:
+            :participant: The address whose balance should be calculated.
+            :chain: The blocks which should be scanned.
+            :open_transactions: The open transactions which should be scanned.
+            :open_chipsactions: The open chipsactions which should be scanned.
+        """
+        amount_sent = 0
+        amount_received = 0
+        for block in chain:
+            for tx in block.transactions + block.chipsactions:
+                if tx.sender == participant:
+                    amount_sent += tx.amount
+                if tx.recipient == participant:
+                    amount_received += tx.amount
+        for tx in iter_chain(open_transactions, open_chipsactions):
+            if tx.sender == participant:
+                amount_sent += tx.amount
+        return amount_received - amount_sent
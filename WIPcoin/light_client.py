@@ -0,0 +1,285 @@
+"""A header-only client which follows the chain of a node and verifies locally that transactions are part of it.
+
+The client downloads and validates the block headers only (hash linkage, proof of work and difficulty) and asks
+the node for the Merkle branch of a transaction (/proof/<txid>), which it checks against the Merkle root of its
+own header. Confirming a payment takes kilobytes instead of the whole chain.
+
+Usage: python light_client.py --node localhost:5000 [--headers headers.json] [--checkpoints checkpoints.json] TXID [TXID ...]
+"""
+
+import json
+
+import requests
+
+from block import Block
+from chipsaction import Chipsaction
+from transaction import Transaction
+from utility.difficulty import DEFAULT_DIFFICULTY, RETARGET_INTERVAL, TARGET_BLOCK_TIME, expected_difficulty, target_for
+from utility.hash_util import LEGACY_BLOCK_VERSION, hash_header, header_prefix
+from utility.merkle import verify_branch
+from utility.record import Record
+from utility.verification import Verification
+
+# The number of seconds we wait for the node
+REQUEST_TIMEOUT = 5
+# The number of headers we download per request (nodes serve at most MAX_HEADERS_PER_REQUEST)
+HEADER_BATCH_SIZE = 2000
+# All chains start with this block, so its hash anchors the header chain
+GENESIS_HASH = Block(0, '', [], [], 100, 0, DEFAULT_DIFFICULTY, LEGACY_BLOCK_VERSION).hash
+
+
+class Header(Record):
+    """The header of a block as the light client keeps it.
+
+    Attributes:
+        :index: The index of the block.
+        :previous_hash: The hash of the previous block in the blockchain.
+        :merkle_root: The Merkle root of the block's transactions and chipsactions (None for headers of old nodes).
+        :timestamp: The timestamp of the block.
+        :proof: The proof of work number of the block.
+        :difficulty: The difficulty the proof of work of the block had to meet.
+        :version: How the block is hashed (see Block).
+        :hash: The hash of the block as the node reported it.
+    """
+    __slots__ = ('index', 'previous_hash', 'merkle_root', 'timestamp', 'proof', 'difficulty', 'version', 'hash')
+
+    def __init__(self, index, previous_hash, merkle_root, timestamp, proof, difficulty, version, hash):
+        self._set('index', index)
+        self._set('previous_hash', previous_hash)
+        self._set('merkle_root', merkle_root)
+        self._set('timestamp', timestamp)
+        self._set('proof', proof)
+        self._set('difficulty', difficulty)
+        self._set('version', version)
+        self._set('hash', hash)
+
+    def valid_hash(self):
+        """Check whether the hash matches the header fields and meets the difficulty's target.
+
+        Legacy blocks are hashed over their transactions, so their headers can't be checked and are never valid by
+        themselves (see LightClient.checkpoints).
+        """
+        if self.version == LEGACY_BLOCK_VERSION:
+            return False
+        if hash_header(header_prefix(self.index, self.previous_hash, self.merkle_root, self.timestamp, self.difficulty), self.proof) != self.hash:
+            return False
+        return Verification.valid_hash(bytes.fromhex(self.hash), target_for(self.difficulty))
+
+    def to_dict(self):
+        """Converts this header into a JSON-serializable dict (the format of Block.header)."""
+        return {
+            'index': self.index,
+            'previous_hash': self.previous_hash,
+            'merkle_root': self.merkle_root,
+            'timestamp': self.timestamp,
+            'proof': self.proof,
+            'difficulty': self.difficulty,
+            'version': self.version,
+            'hash': self.hash
+        }
+
+    @classmethod
+    def from_dict(cls, header):
+        """Create a header from its dict representation (see Block.header)."""
+        return cls(header['index'], header['previous_hash'], header.get('merkle_root'), header['timestamp'], header['proof'],
+                   header.get('difficulty', DEFAULT_DIFFICULTY), header.get('version', LEGACY_BLOCK_VERSION), header['hash'])
+
+
+class LightClient:
+    """Follows the header chain of a node and checks the inclusion proofs of transactions and chipsactions.
+
+    Attributes:
+        :node: The node (host:port) the headers and proofs are fetched from.
+        :headers: The validated headers, starting with the genesis block.
+        :path: The file the headers are kept in between runs (None to keep them in memory only).
+        :retarget_interval: The number of blocks after which the difficulty is adjusted.
+        :target_block_time: The number of seconds we want to pass between two blocks.
+        :checkpoints: The trusted hashes of legacy blocks by height. A legacy header after the genesis block is only
+            accepted if its hash is one of them (e.g. for chains which were migrated from earlier versions).
+    """
+
+    def __init__(self, node, path=None, retarget_interval=RETARGET_INTERVAL, target_block_time=TARGET_BLOCK_TIME,
+                 checkpoints=None):
+        self.node = node
+        self.path = path
+        self.retarget_interval = retarget_interval
+        self.target_block_time = target_block_time
+        self.checkpoints = checkpoints or {}
+        self.headers = []
+        self.load_headers()
+
+    def load_headers(self):
+        """Load the headers which were saved by an earlier run (they're validated again)."""
+        if self.path is None:
+            return
+        try:
+            with open(self.path, mode='r') as f:
+                headers = [Header.from_dict(header) for header in json.load(f)]
+        except (IOError, ValueError, KeyError):
+            return
+        if self.verify_headers(headers):
+            self.headers = headers
+        else:
+            print('Stored headers are invalid, syncing again')
+
+    def save_headers(self):
+        """Save the headers, so the next run only downloads the new ones."""
+        if self.path is None:
+            return
+        try:
+            with open(self.path, mode='w') as f:
+                json.dump([header.to_dict() for header in self.headers], f)
+        except IOError:
+            print('Saving failed!')
+
+    def verify_headers(self, headers, start=0):
+        """Verify a header chain and return True if it's valid, False otherwise.
+
+        Arguments:
+            :headers: The headers starting with the genesis block.
+            :start: The height of the first header that is checked (the headers before are trusted).
+        """
+        if len(headers) == 0 or headers[0].hash != GENESIS_HASH:
+            return False
+        for index in range(max(start, 1), len(headers)):
+            header = headers[index]
+            previous = headers[index - 1]
+            if header.index != index or header.previous_hash != previous.hash:
+                return False
+            if not Verification.valid_version(header, previous.version):
+                return False
+            # Anybody can claim a hash for a legacy header, so only a checkpoint vouches for it
+            if header.version == LEGACY_BLOCK_VERSION:
+                if self.checkpoints.get(index) != header.hash:
+                    return False
+            elif not header.valid_hash():
+                return False
+            if header.difficulty != expected_difficulty(headers, index, self.retarget_interval, self.target_block_time):
+                return False
+        return True
+
+    def _get(self, path, params=None):
+        response = requests.get('http://{}{}'.format(self.node, path), params=params, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def _node_hash_at(self, height):
+        headers = self._get('/headers', {'from': height, 'count': 1})
+        return headers[0]['hash'] if len(headers) > 0 else None
+
+    def _find_fork_point(self, node_height):
+        """Return the height of the last header our chain shares with the node's chain (-1 if we have none)."""
+        high = min(len(self.headers) - 1, node_height)
+        if high < 0 or self._node_hash_at(high) == self.headers[high].hash:
+            return high
+        # All chains share the genesis block
+        low = 0
+        while high - low > 1:
+            middle = (low + high) // 2
+            if self._node_hash_at(middle) == self.headers[middle].hash:
+                low = middle
+            else:
+                high = middle
+        return low
+
+    def sync(self):
+        """Download the headers the node has after our common fork point and switch to them if they carry more work.
+
+        Returns True if our header chain changed.
+        """
+        tip = self._get('/tip')
+        fork_height = self._find_fork_point(tip['height'])
+        new_headers = []
+        while fork_height + 1 + len(new_headers) <= tip['height']:
+            batch = self._get('/headers', {'from': fork_height + 1 + len(new_headers), 'count': HEADER_BATCH_SIZE})
+            if len(batch) == 0:
+                break
+            new_headers.extend(Header.from_dict(header) for header in batch)
+        if len(new_headers) == 0:
+            return False
+        candidate = self.headers[:fork_height + 1] + new_headers
+        if not self.verify_headers(candidate, fork_height + 1):
+            print('Headers of {} are invalid'.format(self.node))
+            return False
+        rolled_back_work = sum(header.difficulty for header in self.headers[fork_height + 1:])
+        if sum(header.difficulty for header in new_headers) <= rolled_back_work:
+            return False
+        self.headers = candidate
+        self.save_headers()
+        return True
+
+    def verify_proof(self, proof):
+        """Check an inclusion proof of the node (see /proof/<txid>) against our own header chain.
+
+        Arguments:
+            :proof: The proof with the transaction or chipsaction, its height, its block header and the Merkle branch.
+        """
+        try:
+            height = proof['height']
+            if height >= len(self.headers):
+                return False
+            header = self.headers[height]
+            # Transactions of legacy blocks aren't covered by the header
+            if header.version == LEGACY_BLOCK_VERSION or proof['header']['hash'] != header.hash:
+                return False
+            # The txid is derived from the content, so the node can't swap the transaction
+            if proof['type'] == 'transaction':
+                tx = Transaction.from_dict(proof['transaction'])
+            elif proof['type'] == 'chipsaction':
+                tx = Chipsaction.from_dict(proof['chipsaction'])
+            else:
+                return False
+            if tx.txid != proof['txid']:
+                return False
+            return verify_branch(tx.txid, proof['branch'], header.merkle_root)
+        except (KeyError, TypeError, ValueError):
+            return False
+
+    def get_proof(self, txid):
+        """Fetch and verify the inclusion proof of a txid, returns None if it isn't part of the node's chain or the proof is invalid.
+
+        Arguments:
+            :txid: The txid of the transaction or chipsaction.
+        """
+        response = requests.get('http://{}/proof/{}'.format(self.node, txid), timeout=REQUEST_TIMEOUT)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        proof = response.json()
+        # The block may be newer than our last header
+        if proof.get('height', 0) >= len(self.headers):
+            self.sync()
+        if not self.verify_proof(proof):
+            print('Proof of {} is invalid'.format(txid))
+            return None
+        return proof
+
+    def confirmations(self, txid):
+        """Return the number of blocks (its own included) which confirm a txid on our header chain (0 if it isn't confirmed).
+
+        Arguments:
+            :txid: The txid of the transaction or chipsaction.
+        """
+        proof = self.get_proof(txid)
+        if proof is None:
+            return 0
+        return len(self.headers) - proof['height']
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    parser = ArgumentParser()
+    parser.add_argument('--node', default='localhost:5000', help='The node (host:port) the headers and proofs are fetched from')
+    parser.add_argument('--headers', help='The file the headers are kept in between runs')
+    parser.add_argument('--checkpoints', help='A JSON file which maps the heights of trusted legacy blocks to their hashes')
+    parser.add_argument('txids', nargs='+')
+    args = parser.parse_args()
+    checkpoints = {}
+    if args.checkpoints is not None:
+        with open(args.checkpoints, mode='r') as f:
+            checkpoints = {int(height): block_hash for height, block_hash in json.load(f).items()}
+    client = LightClient(args.node, args.headers, checkpoints=checkpoints)
+    client.sync()
+    print('Headers: {} (tip {})'.format(len(client.headers), client.headers[-1].hash if client.headers else None))
+    for txid in args.txids:
+        print('{}: {} confirmations'.format(txid, client.confirmations(txid)))
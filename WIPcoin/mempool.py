@@ -0,0 +1,114 @@
+from collections import OrderedDict
+import json
+from time import time
+
+# The maximum number of open transactions (or chipsactions) we keep
+MAX_MEMPOOL_COUNT = 5000
+# The maximum number of bytes (serialized) the open transactions (or chipsactions) may take up
+MAX_MEMPOOL_BYTES = 5 * 1024 * 1024
+# Open transactions (or chipsactions) older than this (in seconds) are evicted, None keeps them forever
+MAX_MEMPOOL_AGE = None
+# The maximum number of transactions (without the mining reward) and chipsactions in a block
+MAX_BLOCK_TRANSACTIONS = 500
+MAX_BLOCK_CHIPSACTIONS = 500
+
+
+class Mempool:
+    """Holds open transactions or chipsactions keyed by txid, in the order in which they arrived.
+
+    There are no fees in our transactions, so the age is the priority: once the pool exceeds its count or
+    byte limit (or entries exceed the maximum age) the oldest entries are evicted first.
+
+    Attributes:
+        :max_count: The maximum number of entries.
+        :max_bytes: The maximum total size of the serialized entries.
+        :max_age: The number of seconds after which an entry is evicted (None disables expiry).
+        :size_bytes: The current total size of the serialized entries.
+    """
+
+    def __init__(self, max_count=MAX_MEMPOOL_COUNT, max_bytes=MAX_MEMPOOL_BYTES, max_age=MAX_MEMPOOL_AGE):
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.size_bytes = 0
+        self.__entries = OrderedDict()
+        # txid -> (arrival time, serialized size)
+        self.__meta = {}
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, txid):
+        return txid in self.__entries
+
+    def values(self):
+        """Return a view of the entries (oldest first)."""
+        return self.__entries.values()
+
+    def add(self, tx, arrival=None):
+        """Add an entry and return the list of entries which had to be evicted to stay within the limits.
+
+        Arguments:
+            :tx: The transaction or chipsaction which should be added.
+            :arrival: The time the entry arrived (defaults to now).
+        """
+        size = len(json.dumps(tx.to_dict()))
+        self.__entries[tx.txid] = tx
+        self.__meta[tx.txid] = (time() if arrival is None else arrival, size)
+        self.size_bytes += size
+        return self.evict()
+
+    def pop(self, txid):
+        """Remove and return an entry (or None if it's not in the pool)."""
+        tx = self.__entries.pop(txid, None)
+        if tx is not None:
+            self.size_bytes -= self.__meta.pop(txid)[1]
+        return tx
+
+    def clear(self):
+        """Remove all entries."""
+        self.__entries.clear()
+        self.__meta.clear()
+        self.size_bytes = 0
+
+    def evict(self):
+        """Evict the oldest entries until the pool is within its limits and return them."""
+        evicted = []
+        expiry = time() - self.max_age if self.max_age is not None else None
+        while len(self.__entries) > 0:
+            oldest = next(iter(self.__entries))
+            too_old = expiry is not None and self.__meta[oldest][0] < expiry
+            if not too_old and len(self.__entries) <= self.max_count and self.size_bytes <= self.max_bytes:
+                break
+            evicted.append(self.pop(oldest))
+        return evicted
+
+
+def build_block_template(transactions, chipsactions, get_confirmed_balance,
+                         max_transactions=MAX_BLOCK_TRANSACTIONS, max_chipsactions=MAX_BLOCK_CHIPSACTIONS):
+    """Pick a bounded subset of open transactions and chipsactions which the senders can afford.
+
+    Entries are taken oldest first. An entry is skipped if its sender's confirmed balance doesn't cover it
+    together with the entries of that sender which were already picked.
+
+    Arguments:
+        :transactions: The open transactions (oldest first).
+        :chipsactions: The open chipsactions (oldest first).
+        :get_confirmed_balance: A function returning the confirmed balance of an address.
+        :max_transactions: The maximum number of transactions in the block.
+        :max_chipsactions: The maximum number of chipsactions in the block.
+    """
+    spent = {}
+
+    def pick(candidates, limit):
+        picked = []
+        for tx in candidates:
+            if len(picked) >= limit:
+                break
+            sender_spent = spent.get(tx.sender, 0) + tx.amount
+            if get_confirmed_balance(tx.sender) >= sender_spent:
+                spent[tx.sender] = sender_spent
+                picked.append(tx)
+        return picked
+
+    return pick(transactions, max_transactions), pick(chipsactions, max_chipsactions)
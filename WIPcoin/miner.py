@@ -0,0 +1,126 @@
+import hashlib as hl
+import multiprocessing
+from time import time
+
+from utility.difficulty import DEFAULT_DIFFICULTY, target_for
+from utility.verification import Verification
+from utility.workers import worker_context
+
+# Worker processes check the cancel event after this many nonces
+CANCEL_CHECK_INTERVAL = 1000
+
+_cancel_event = None
+
+
+def _init_worker(cancel_event):
+    global _cancel_event
+    _cancel_event = cancel_event
+
+
+def search_range(prefix_state, target, start, end, cancel_event=None):
+    """Search the nonces in [start, end) and return (proof or None, number of hashes tried).
+
+    Arguments:
+        :prefix_state: A hashlib sha256 object which already consumed the serialized header prefix.
+        :target: The integer target the hash has to stay below.
+        :start: The first nonce to try.
+        :end: The nonce at which the search stops.
+        :cancel_event: An optional event which aborts the search once it is set.
+    """
+    for proof in range(start, end):
+        if cancel_event is not None and proof % CANCEL_CHECK_INTERVAL == 0 and cancel_event.is_set():
+            return None, proof - start
+        guess = prefix_state.copy()
+        guess.update(str(proof).encode())
+        if Verification.valid_hash(guess.digest(), target):
+            return proof, proof - start + 1
+    return None, end - start
+
+
+def _search_worker(prefix, target, worker, workers, chunk_size, offset):
+    """Search every workers-th chunk of nonces (starting at offset) until a proof is found or mining is cancelled."""
+    prefix_state = hl.sha256(prefix)
+    hashes = 0
+    start = offset + worker * chunk_size
+    while not _cancel_event.is_set():
+        proof, tried = search_range(prefix_state, target, start, start + chunk_size, _cancel_event)
+        hashes += tried
+        if proof is not None:
+            _cancel_event.set()
+            return proof, hashes
+        start += workers * chunk_size
+    return None, hashes
+
+
+class Miner:
+    """Searches for a proof of work by hashing disjoint nonce ranges in a pool of worker processes.
+
+    The block header (everything but the proof) is serialized once and the SHA-256 state
+    of that prefix is copied for every nonce, so only the nonce itself has to be hashed.
+
+    Attributes:
+        :workers: The number of worker processes.
+        :chunk_size: The number of nonces a worker searches before it moves on to its next range.
+        :last_stats: The hashes, duration, hash rate and cancel state of the last mining run.
+    """
+
+    def __init__(self, workers=None, chunk_size=20000):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self.last_stats = None
+        self.__context = worker_context()
+        self.__cancel_event = self.__context.Event()
+        self.__pool = None
+
+    def _get_pool(self):
+        if self.__pool is None:
+            self.__pool = self.__context.Pool(
+                self.workers, initializer=_init_worker, initargs=(self.__cancel_event,))
+        return self.__pool
+
+    def cancel(self):
+        """Abort a running mining run (e.g. because a competing block arrived)."""
+        self.__cancel_event.set()
+
+    def close(self):
+        """Shut down the worker processes."""
+        if self.__pool is not None:
+            self.__pool.terminate()
+            self.__pool = None
+
+    def mine(self, prefix, difficulty=DEFAULT_DIFFICULTY):
+        """Return a proof of work for the given header or None if mining was cancelled.
+
+        Arguments:
+            :prefix: The serialized header of the block without its proof (see Block.header_prefix).
+            :difficulty: The difficulty the proof has to meet.
+        """
+        self.__cancel_event.clear()
+        target = target_for(difficulty)
+        start_time = time()
+        # Easy puzzles are usually solved before a worker pool pays off, so try the first chunk locally
+        proof, hashes = search_range(hl.sha256(prefix), target, 0, self.chunk_size, self.__cancel_event)
+        if proof is None and self.workers > 1 and not self.__cancel_event.is_set():
+            pool = self._get_pool()
+            results = [pool.apply_async(_search_worker, (prefix, target, worker, self.workers, self.chunk_size, self.chunk_size))
+                       for worker in range(self.workers)]
+            for result in results:
+                found, tried = result.get()
+                hashes += tried
+                if found is not None and (proof is None or found < proof):
+                    proof = found
+        elif proof is None and not self.__cancel_event.is_set():
+            start = self.chunk_size
+            prefix_state = hl.sha256(prefix)
+            while proof is None and not self.__cancel_event.is_set():
+                proof, tried = search_range(prefix_state, target, start, start + self.chunk_size, self.__cancel_event)
+                hashes += tried
+                start += self.chunk_size
+        duration = time() - start_time
+        self.last_stats = {
+            'hashes': hashes,
+            'seconds': duration,
+            'hash_rate': hashes / duration if duration > 0 else 0,
+            'cancelled': proof is None
+        }
+        return proof
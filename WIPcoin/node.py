@@ -1,368 +1,85 @@
-from flask import Flask, jsonify, request, send_from_directory
+"""A threaded node server (Flask), the requests are handled by node_api.
+
+Usage: python node.py -p 5000
+"""
+
+from time import perf_counter
+
+from flask import Flask, Response, g, jsonify, request, send_from_directory
 from flask_cors import CORS
 
 from wallet import Wallet
-from blockchain import Blockchain
+from background_miner import MINE_THRESHOLD, MINE_INTERVAL
+from utility.metrics import metrics
+from codec import BINARY_CONTENT_TYPE
+from node_api import NodeApi, NodeRequest, RawResponse, REQUEST_SECONDS, ROUTES
 
 app = Flask(__name__)
 CORS(app)
+# The request handlers of the node (set up before the server is started)
+api = None
 
 
-@app.route('/', methods=['GET'])
-def get_node_ui():
-    return send_from_directory('ui', 'node.html')
-
-
-@app.route('/network', methods=['GET'])
-def get_network_ui():
-    return send_from_directory('ui', 'network.html')
-
-
-@app.route('/wallet', methods=['POST'])
-def create_keys():
-    wallet.create_keys()
-    if wallet.save_keys():
-        global blockchain
-        blockchain = Blockchain(wallet.public_key, port)
-        response = {
-            'public_key': wallet.public_key,
-            'private_key': wallet.private_key,
-            'funds': blockchain.get_balance()
-        }
-        return jsonify(response), 201
-    else:
-        response = {
-            'message': 'Saving the keys failed.'
-        }
-        return jsonify(response), 500
-
-
-@app.route('/wallet', methods=['GET'])
-def load_keys():
-    if wallet.load_keys():
-        global blockchain
-        blockchain = Blockchain(wallet.public_key, port)
-        response = {
-            'public_key': wallet.public_key,
-            'private_key': wallet.private_key,
-            'funds': blockchain.get_balance()
-        }
-        return jsonify(response), 201
-    else:
-        response = {
-            'message': 'Loading the keys failed.'
-        }
-        return jsonify(response), 500
-
-
-@app.route('/balance', methods=['GET'])
-def get_balance():
-    balance = blockchain.get_balance()
-    if balance != None:
-        response = {
-            'message': 'Fetched balance successfully.',
-            'funds': balance
-        }
-        return jsonify(response), 200
-    else:
-        response = {
-            'messsage': 'Loading balance failed.',
-            'wallet_set_up': wallet.public_key != None
-        }
-        return jsonify(response), 500
-
+def to_response(result):
+    """Convert the result of a handler (see node_api) into a Flask response."""
+    if isinstance(result, RawResponse):
+        return Response(result.content, status=result.status, content_type=result.content_type)
+    body, status = result
+    return jsonify(body), status
 
-@app.route('/broadcast-transaction', methods=['POST'])
-def broadcast_transaction():
-    values = request.get_json()
-    if not values:
-        response = {'message': 'No data found.'}
-        return jsonify(response), 400
-    required = ['sender', 'recipient', 'signature', 'amount']
-    if not all(key in values for key in required):
-        response = {'message': 'Some data is missing.'}
-        return jsonify(response), 400
-    success = blockchain.add_transaction(
-        values['sender'], values['recipient'], values['signature'], values['amount'], is_receiving=True)
-    if success:
-        response = {
-            'message': 'Successfully added transaction.',
-            'transaction': {
-                'sender': values['sender'],
-                'recipient': values['recipient'],
-                'amount': values['amount'],
-                'signature': values['signature']
-            }
-        }
-        return jsonify(response), 201
-    else:
-        response = {
-            'message': 'Creating a transaction failed.'
-        }
-        return jsonify(response), 500
 
-@app.route('/broadcast-chipsaction', methods=['POST'])
-def broadcast_chipsaction():
-    values = request.get_json()
-    if not values:
-        response = {'message': 'No data found.'}
-        return jsonify(response), 400
-    required = ['sender', 'recipient', 'placeID', 'message', 'signature', 'amount']
-    if not all(key in values for key in required):
-        response = {'message': 'Some data is missing.'}
-        return jsonify(response), 400
-    success = blockchain.add_chipsaction(
-        values['sender'], values['recipient'], values['placeID'], values['message'], values['signature'], values['amount'], is_receiving=True)
-    if success:
-        response = {
-            'message': 'Successfully added chipsaction.',
-            'chipsaction': {
-                'sender': values['sender'],
-                'recipient': values['recipient'],
-                'placeID': values['placeID'],
-                'message': values['message'],
-                'amount': values['amount'],
-                'signature': values['signature']
-            }
-        }
-        return jsonify(response), 201
-    else:
-        response = {
-            'message': 'Creating a chipsaction failed.'
-        }
-        return jsonify(response), 500
+def add_route(method, path, handler_name):
+    """Serve a route of node_api.ROUTES with the NodeApi handler of the given name."""
+    def handle(**params):
+        node_request = NodeRequest(request.args, request.get_data(), request.mimetype == BINARY_CONTENT_TYPE,
+                                   request.accept_mimetypes, params)
+        return to_response(getattr(api, handler_name)(node_request))
+    app.add_url_rule(path.replace('{', '<').replace('}', '>'), endpoint=handler_name, view_func=handle, methods=[method])
 
 
-@app.route('/broadcast-block', methods=['POST'])
-def broadcast_block():
-    values = request.get_json()
-    if not values:
-        response = {'message': 'No data found.'}
-        return jsonify(response), 400
-    if 'block' not in values:
-        response = {'message': 'Some data is missing.'}
-        return jsonify(response), 400
-    block = values['block']
-    if block['index'] == blockchain.chain[-1].index + 1:
-        if blockchain.add_block(block):
-            response = {'message': 'Block added'}
-            return jsonify(response), 201
-        else:
-            response = {'message': 'Block seems invalid.'}
-            return jsonify(response), 409
-    elif block['index'] > blockchain.chain[-1].index:
-        response = {'message': 'Blockchain seems to differ from local blockchain.'}
-        blockchain.resolve_conflicts = True
-        return jsonify(response), 200
-    else: 
-        response = {'message': 'Blockchain seems to be shorter, block not added'}
-        return jsonify(response), 409
+@app.before_request
+def start_request_timer():
+    if metrics.enabled:
+        g.request_start = perf_counter()
 
 
-@app.route('/transaction', methods=['POST'])
-def add_transaction():
-    if wallet.public_key == None:
-        response = {
-            'message': 'No wallet set up.'
-        }
-        return jsonify(response), 400
-    values = request.get_json()
-    if not values:
-        response = {
-            'message': 'No data found.'
-        }
-        return jsonify(response), 400
-    required_fields = ['recipient', 'amount']
-    if not all(field in values for field in required_fields):
-        response = {
-            'message': 'Required data is missing.'
-        }
-        return jsonify(response), 400
-    recipient = values['recipient']
-    amount = values['amount']
-    signature = wallet.sign_transaction(wallet.public_key, recipient, amount)
-    success = blockchain.add_transaction(
-        wallet.public_key, recipient, signature, amount)
-    if success:
-        response = {
-            'message': 'Successfully added transaction.',
-            'transaction': {
-                'sender': wallet.public_key,
-                'recipient': recipient,
-                'amount': amount,
-                'signature': signature
-            },
-            'funds': blockchain.get_balance()
-        }
-        return jsonify(response), 201
-    else:
-        response = {
-            'message': 'Creating a transaction failed.'
-        }
-        return jsonify(response), 500
+@app.after_request
+def observe_request_duration(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.observe(perf_counter() - start, route=route, method=request.method, status=response.status_code)
+    return response
 
 
-@app.route('/chipsaction', methods=['POST'])
-def add_chipsaction():
-    if wallet.public_key == None:
-        response = {
-            'message': 'No wallet set up.'
-        }
-        return jsonify(response), 400
-    values = request.get_json()
-    if not values:
-        response = {
-            'message': 'No data found.'
-        }
-        return jsonify(response), 400
-    required_fields = ['recipient', 'placeID', 'message', 'amount']
-    if not all(field in values for field in required_fields):
-        response = {
-            'message': 'Required data is missing.'
-        }
-        return jsonify(response), 400
-    recipient = values['recipient']
-    placeID = values['placeID']
-    message = values['message']
-    amount = values['amount']
-    signature = wallet.sign_chipsaction(wallet.public_key, recipient, placeID, message, amount)
-    success = blockchain.add_chipsaction(
-        wallet.public_key, recipient, placeID, message, signature, amount)
-    if success:
-        response = {
-            'message': 'Successfully added transaction.',
-            'transaction': {
-                'sender': wallet.public_key,
-                'recipient': recipient,
-                'placeID': placeID,
-                'message': message,
-                'amount': amount,
-                'signature': signature
-            },
-            'funds': blockchain.get_balance()
-        }
-        return jsonify(response), 201
-    else:
-        response = {
-            'message': 'Creating a chipsaction failed.'
-        }
-        return jsonify(response), 500
-
-
-@app.route('/mine', methods=['POST'])
-def mine():
-    if blockchain.resolve_conflicts:
-        response = {'message': 'Resolve conflicts first, block not added!'}
-        return jsonify(response), 409
-    block = blockchain.mine_block()
-    if block != None:
-        dict_block = block.__dict__.copy()
-        dict_block['transactions'] = [
-            tx.__dict__ for tx in dict_block['transactions']]
-        dict_block['chipsactions'] = [
-            tx.__dict__ for tx in dict_block['chipsactions']]
-        response = {
-            'message': 'Block added successfully.',
-            'block': dict_block,
-            'funds': blockchain.get_balance()
-        }
-        return jsonify(response), 201
-    else:
-        response = {
-            'message': 'Adding a block failed.',
-            'wallet_set_up': wallet.public_key != None
-        }
-        return jsonify(response), 500
-
-
-@app.route('/resolve-conflicts', methods=['POST'])
-def resolve_conflicts():
-    replaced = blockchain.resolve()
-    if replaced:
-        response = {'message': 'Chain was replaced!'}
-    else:
-        response = {'message': 'Local chain kept!'}
-    return jsonify(response), 200
-
-
-@app.route('/transactions', methods=['GET'])
-def get_open_transaction():
-    transactions = blockchain.get_open_transactions()
-    dict_transactions = [tx.__dict__ for tx in transactions]
-    return jsonify(dict_transactions), 200
-
-@app.route('/chipsactions', methods=['GET'])
-def get_open_chipsaction():
-    chipsactions = blockchain.get_open_chipsactions()
-    dict_chipsactions = [tx.__dict__ for tx in chipsactions]
-    return jsonify(dict_chipsactions), 200
-
-
-@app.route('/chain', methods=['GET'])
-def get_chain():
-    chain_snapshot = blockchain.chain
-    dict_chain = [block.__dict__.copy() for block in chain_snapshot]
-    for dict_block in dict_chain:
-        dict_block['transactions'] = [
-            tx.__dict__ for tx in dict_block['transactions']]
-    for dict_block in dict_chain:
-        dict_block['chipsactions'] = [
-            tx.__dict__ for tx in dict_block['chipsactions']]
-    return jsonify(dict_chain), 200
-
-
-@app.route('/node', methods=['POST'])
-def add_node():
-    values = request.get_json()
-    if not values:
-        response = {
-            'message': 'No data attached.'
-        }
-        return jsonify(response), 400
-    if 'node' not in values:
-        response = {
-            'message': 'No node data found.'
-        }
-        return jsonify(response), 400
-    node = values['node']
-    blockchain.add_peer_node(node)
-    response = {
-        'message': 'Node added successfully.',
-        'all_nodes': blockchain.get_peer_nodes()
-    }
-    return jsonify(response), 201
+@app.route('/', methods=['GET'])
+def get_node_ui():
+    return send_from_directory('ui', 'node.html')
 
 
-@app.route('/node/<node_url>', methods=['DELETE'])
-def remove_node(node_url):
-    if node_url == '' or node_url == None:
-        response = {
-            'message': 'No node found.'
-        }
-        return jsonify(response), 400
-    blockchain.remove_peer_node(node_url)
-    response = {
-        'message': 'Node removed',
-        'all_nodes': blockchain.get_peer_nodes()
-    }
-    return jsonify(response), 200
+@app.route('/network', methods=['GET'])
+def get_network_ui():
+    return send_from_directory('ui', 'network.html')
 
 
-@app.route('/nodes', methods=['GET'])
-def get_nodes():
-    nodes = blockchain.get_peer_nodes()
-    response = {
-        'all_nodes': nodes
-    }
-    return jsonify(response), 200
+for method, path, handler_name in ROUTES:
+    add_route(method, path, handler_name)
 
 
 if __name__ == '__main__':
     from argparse import ArgumentParser
     parser = ArgumentParser()
     parser.add_argument('-p', '--port', type=int, default=5000)
+    parser.add_argument('--background-mining', action='store_true', help='Mine blocks in a background thread')
+    parser.add_argument('--mine-threshold', type=int, default=MINE_THRESHOLD,
+                        help='The number of open transactions and chipsactions at which a round starts')
+    parser.add_argument('--mine-interval', type=float, default=MINE_INTERVAL,
+                        help='The number of seconds after which a round starts even below the threshold')
+    parser.add_argument('--no-metrics', action='store_true', help='Don\'t record metrics (and disable /metrics)')
     args = parser.parse_args()
-    port = args.port
-    wallet = Wallet(port)
-    blockchain = Blockchain(wallet.public_key, port)
-    app.run(host='0.0.0.0', port=port)
+    metrics.enabled = not args.no_metrics
+    api = NodeApi(Wallet(args.port), args.port)
+    api.set_up_blockchain()
+    if args.background_mining:
+        api.start_background_mining(args.mine_threshold, args.mine_interval)
+    app.run(host='0.0.0.0', port=args.port, threaded=True)
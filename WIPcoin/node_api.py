@@ -0,0 +1,641 @@
+"""Handles the requests of a node independently of the web server which serves them.
+
+node.py (Flask, threaded) and async_node.py (aiohttp) are thin adapters: they turn their requests into a NodeRequest,
+call the handler of the route (see ROUTES) and turn its result into a response. A handler returns a
+(JSON-serializable body, status) tuple or a RawResponse for binary, text and streamed bodies. Handlers may block
+(e.g. while a block is mined or the blockchain's lock is held), the asyncio adapter runs them in executors.
+"""
+
+import json
+
+from background_miner import BackgroundMiner
+from blockchain import Blockchain
+from block import Block
+from broadcast import Broadcaster
+from chipsaction import Chipsaction
+from codec import BINARY_CONTENT_TYPE, decode_block, decode_chipsaction, decode_transaction, encode_blocks, encode_blocks_header, encode_blocks_item
+from transaction import Transaction
+from utility.metrics import metrics
+
+# The maximum number of headers and blocks a peer can fetch with one request
+MAX_HEADERS_PER_REQUEST = 2000
+MAX_BLOCKS_PER_REQUEST = 100
+# The maximum number of blocks in one page of /chain
+MAX_CHAIN_PAGE_SIZE = 100
+# The maximum number of entries in one page of an address history
+MAX_HISTORY_PAGE_SIZE = 100
+# The number of latest chipsactions a place or author summary contains by default (and at most)
+DEFAULT_LATEST_CHIPSACTIONS = 10
+MAX_LATEST_CHIPSACTIONS = 100
+# The number of blocks which are encoded at once while the chain is streamed
+STREAM_CHUNK_SIZE = 100
+
+REQUEST_SECONDS = metrics.histogram('wipcoin_http_request_duration_seconds', 'Duration of the HTTP requests per route (until the response starts).')
+
+# The routes of a node as (method, path, name of the NodeApi handler), path parameters are written as {name}
+ROUTES = [
+    ('GET', '/metrics', 'get_metrics'),
+    ('POST', '/wallet', 'create_keys'),
+    ('GET', '/wallet', 'load_keys'),
+    ('GET', '/balance', 'get_balance'),
+    ('POST', '/broadcast-transaction', 'broadcast_transaction'),
+    ('POST', '/broadcast-chipsaction', 'broadcast_chipsaction'),
+    ('POST', '/broadcast-block', 'broadcast_block'),
+    ('POST', '/transaction', 'add_transaction'),
+    ('POST', '/chipsaction', 'add_chipsaction'),
+    ('POST', '/mine', 'mine'),
+    ('GET', '/mining-status', 'get_mining_status'),
+    ('POST', '/resolve-conflicts', 'resolve_conflicts'),
+    ('GET', '/transactions', 'get_open_transactions'),
+    ('GET', '/chipsactions', 'get_open_chipsactions'),
+    ('GET', '/chain', 'get_chain'),
+    ('GET', '/tip', 'get_tip'),
+    ('GET', '/headers', 'get_headers'),
+    ('GET', '/proof/{txid}', 'get_inclusion_proof'),
+    ('GET', '/blocks', 'get_blocks'),
+    ('GET', '/address/{address}/history', 'get_address_history'),
+    ('GET', '/places/authors/{recipient}', 'get_author'),
+    ('GET', '/places/{place}', 'get_place'),
+    ('GET', '/places/{place}/chipsactions', 'get_place_chipsactions'),
+    ('POST', '/node', 'add_node'),
+    ('DELETE', '/node/{node_url}', 'remove_node'),
+    ('GET', '/broadcast-stats', 'get_broadcast_stats'),
+    ('GET', '/nodes', 'get_nodes')
+]
+# The handlers which mine (the asyncio adapter runs them in their own executor)
+MINING_HANDLERS = {'mine'}
+
+
+class NodeRequest:
+    """The parts of an HTTP request the handlers use.
+
+    Attributes:
+        :query: The query parameters (a mapping of names to strings).
+        :body: The raw body (bytes).
+        :binary: Whether the body is binary encoded (see the codec module) instead of JSON.
+        :accept: The parsed Accept header (a werkzeug MIMEAccept).
+        :params: The path parameters of the route.
+    """
+
+    def __init__(self, query, body, binary, accept, params):
+        self.query = query
+        self.body = body
+        self.binary = binary
+        self.accept = accept
+        self.params = params
+
+    def query_int(self, name, default=None):
+        """Return a query parameter as an int, or the default if it's missing or no number."""
+        try:
+            return int(self.query[name])
+        except (KeyError, ValueError):
+            return default
+
+    def values(self, decode=None):
+        """Return the values of the body as a dict, or None if there are none or they're malformed.
+
+        Arguments:
+            :decode: The codec function which decodes a binary body (binary bodies aren't accepted without it).
+        """
+        if self.binary:
+            if decode is None:
+                return None
+            try:
+                return decode(self.body).to_dict()
+            except ValueError:
+                return None
+        try:
+            return json.loads(self.body) if self.body else None
+        except ValueError:
+            return None
+
+    def accepts_binary(self):
+        """Return True if the client prefers binary encoded responses over JSON."""
+        return self.accept.best_match(['application/json', BINARY_CONTENT_TYPE]) == BINARY_CONTENT_TYPE
+
+
+class RawResponse:
+    """A response whose body isn't JSON.
+
+    Attributes:
+        :content: The body as bytes or str, or an iterator of chunks which are streamed.
+        :content_type: The Content-Type header of the response.
+        :status: The status code.
+    """
+
+    def __init__(self, content, content_type, status=200):
+        self.content = content
+        self.content_type = content_type
+        self.status = status
+
+    def streamed(self):
+        """Return True if the content is an iterator of chunks."""
+        return not isinstance(self.content, (bytes, str))
+
+
+def encode_binary_chunk(chain_snapshot, start, end):
+    return b''.join(encode_blocks_item(block) for block in chain_snapshot.iter_range(start, end))
+
+
+def encode_ndjson_chunk(chain_snapshot, start, end):
+    return ''.join(json.dumps(block.to_dict()) + '\n' for block in chain_snapshot.iter_range(start, end)).encode('utf8')
+
+
+def encode_json_chunk(chain_snapshot, start, end):
+    return ''.join((',' if index > 0 else '') + json.dumps(block.to_dict())
+                   for index, block in enumerate(chain_snapshot.iter_range(start, end), start)).encode('utf8')
+
+
+def stream_chain(chain_snapshot, encode_chunk, head=b'', tail=b''):
+    """Yield the blocks of a chain view encoded chunk by chunk, so they're encoded while they're sent.
+
+    Arguments:
+        :chain_snapshot: The chain view whose blocks are sent.
+        :encode_chunk: Encodes the blocks from start to end of the view into bytes.
+        :head: The bytes which are sent before the blocks.
+        :tail: The bytes which are sent after the blocks.
+    """
+    if head:
+        yield head
+    for start in range(0, len(chain_snapshot), STREAM_CHUNK_SIZE):
+        yield encode_chunk(chain_snapshot, start, min(start + STREAM_CHUNK_SIZE, len(chain_snapshot)))
+    if tail:
+        yield tail
+
+
+class NodeApi:
+    """The request handlers of a node, they operate on its wallet and the blockchain of that wallet.
+
+    Attributes:
+        :wallet: The wallet of the node.
+        :port: The port of the node (it identifies the node's data files).
+        :blockchain: The blockchain of the current wallet (replaced when another wallet is created or loaded).
+        :miner: The background miner (None if blocks are only mined by POST /mine).
+        :broadcaster_factory: Creates the broadcaster of a blockchain (see Blockchain).
+        :blockchain_options: Further keyword arguments of the Blockchain (e.g. the number of mining workers).
+    """
+
+    def __init__(self, wallet, port, broadcaster_factory=Broadcaster, **blockchain_options):
+        self.wallet = wallet
+        self.port = port
+        self.blockchain = None
+        self.miner = None
+        self.broadcaster_factory = broadcaster_factory
+        self.blockchain_options = blockchain_options
+
+    def set_up_blockchain(self):
+        """Create the blockchain of the current wallet (the background miner is moved over to it).
+
+        The previous blockchain is closed first, it uses the same files.
+        """
+        if self.miner is not None:
+            self.miner.stop()
+        if self.blockchain is not None:
+            self.blockchain.close()
+        self.blockchain = Blockchain(self.wallet.public_key, self.port, broadcaster_factory=self.broadcaster_factory,
+                                     **self.blockchain_options)
+        self.blockchain.register_metrics()
+        if self.miner is not None:
+            self.miner = BackgroundMiner(self.blockchain, self.miner.threshold, self.miner.interval, self.miner.rebuild_delay)
+            self.miner.start()
+
+    def start_background_mining(self, threshold, interval):
+        """Mine blocks in a background thread from now on (see BackgroundMiner)."""
+        self.miner = BackgroundMiner(self.blockchain, threshold, interval)
+        self.miner.start()
+
+    def close(self):
+        """Stop the background miner and close the blockchain."""
+        if self.miner is not None:
+            self.miner.stop()
+        if self.blockchain is not None:
+            self.blockchain.close()
+
+    def get_metrics(self, request):
+        if not metrics.enabled:
+            response = {'message': 'Metrics are disabled.'}
+            return response, 404
+        return RawResponse(metrics.render(), 'text/plain; version=0.0.4; charset=utf-8')
+
+    def _wallet_response(self):
+        self.set_up_blockchain()
+        response = {
+            'public_key': self.wallet.public_key,
+            'private_key': self.wallet.private_key,
+            'funds': self.blockchain.get_balance()
+        }
+        return response, 201
+
+    def create_keys(self, request):
+        self.wallet.create_keys()
+        if self.wallet.save_keys():
+            return self._wallet_response()
+        response = {
+            'message': 'Saving the keys failed.'
+        }
+        return response, 500
+
+    def load_keys(self, request):
+        if self.wallet.load_keys():
+            return self._wallet_response()
+        response = {
+            'message': 'Loading the keys failed.'
+        }
+        return response, 500
+
+    def get_balance(self, request):
+        balance = self.blockchain.get_balance()
+        if balance != None:
+            response = {
+                'message': 'Fetched balance successfully.',
+                'funds': balance
+            }
+            return response, 200
+        response = {
+            'messsage': 'Loading balance failed.',
+            'wallet_set_up': self.wallet.public_key != None
+        }
+        return response, 500
+
+    def broadcast_transaction(self, request):
+        values = request.values(decode_transaction)
+        if not values:
+            response = {'message': 'No data found.'}
+            return response, 400
+        required = ['sender', 'recipient', 'signature', 'amount']
+        if not all(key in values for key in required):
+            response = {'message': 'Some data is missing.'}
+            return response, 400
+        txid = Transaction(values['sender'], values['recipient'], values['signature'], values['amount']).txid
+        if self.blockchain.has_open_transaction(txid):
+            response = {'message': 'Transaction is already known.', 'txid': txid}
+            return response, 200
+        success = self.blockchain.add_transaction(
+            values['sender'], values['recipient'], values['signature'], values['amount'], is_receiving=True)
+        if success:
+            response = {
+                'message': 'Successfully added transaction.',
+                'transaction': {
+                    'sender': values['sender'],
+                    'recipient': values['recipient'],
+                    'amount': values['amount'],
+                    'signature': values['signature']
+                }
+            }
+            return response, 201
+        response = {
+            'message': 'Creating a transaction failed.'
+        }
+        return response, 500
+
+    def broadcast_chipsaction(self, request):
+        values = request.values(decode_chipsaction)
+        if not values:
+            response = {'message': 'No data found.'}
+            return response, 400
+        required = ['sender', 'recipient', 'placeID', 'message', 'signature', 'amount']
+        if not all(key in values for key in required):
+            response = {'message': 'Some data is missing.'}
+            return response, 400
+        txid = Chipsaction(values['sender'], values['recipient'], values['placeID'], values['message'], values['signature'], values['amount']).txid
+        if self.blockchain.has_open_transaction(txid):
+            response = {'message': 'Chipsaction is already known.', 'txid': txid}
+            return response, 200
+        success = self.blockchain.add_chipsaction(
+            values['sender'], values['recipient'], values['placeID'], values['message'], values['signature'], values['amount'], is_receiving=True)
+        if success:
+            response = {
+                'message': 'Successfully added chipsaction.',
+                'chipsaction': {
+                    'sender': values['sender'],
+                    'recipient': values['recipient'],
+                    'placeID': values['placeID'],
+                    'message': values['message'],
+                    'amount': values['amount'],
+                    'signature': values['signature']
+                }
+            }
+            return response, 201
+        response = {
+            'message': 'Creating a chipsaction failed.'
+        }
+        return response, 500
+
+    def broadcast_block(self, request):
+        if request.binary:
+            try:
+                block = decode_block(request.body)
+            except ValueError:
+                response = {'message': 'Block can\'t be decoded.'}
+                return response, 400
+        else:
+            values = request.values()
+            if not values:
+                response = {'message': 'No data found.'}
+                return response, 400
+            if 'block' not in values:
+                response = {'message': 'Some data is missing.'}
+                return response, 400
+            try:
+                block = Block.from_dict(values['block'])
+            except KeyError as e:
+                response = {'message': 'Block is missing the field {}.'.format(e)}
+                return response, 400
+            except (TypeError, ValueError, AttributeError):
+                response = {'message': 'Block is malformed.'}
+                return response, 400
+        if not isinstance(block.index, int):
+            response = {'message': 'Block is malformed.'}
+            return response, 400
+        height = self.blockchain.get_tip()['height']
+        if block.index == height + 1:
+            if self.blockchain.add_block(block):
+                response = {'message': 'Block added'}
+                return response, 201
+            response = {'message': 'Block seems invalid.'}
+            return response, 409
+        elif block.index > height:
+            # Our tip is behind, a block mined on top of it would be wasted
+            self.blockchain.cancel_mining()
+            response = {'message': 'Blockchain seems to differ from local blockchain.'}
+            self.blockchain.resolve_conflicts = True
+            return response, 200
+        response = {'message': 'Blockchain seems to be shorter, block not added'}
+        return response, 409
+
+    def add_transaction(self, request):
+        if self.wallet.public_key == None:
+            response = {
+                'message': 'No wallet set up.'
+            }
+            return response, 400
+        values = request.values()
+        if not values:
+            response = {
+                'message': 'No data found.'
+            }
+            return response, 400
+        required_fields = ['recipient', 'amount']
+        if not all(field in values for field in required_fields):
+            response = {
+                'message': 'Required data is missing.'
+            }
+            return response, 400
+        recipient = values['recipient']
+        amount = values['amount']
+        signature = self.wallet.sign_transaction(self.wallet.public_key, recipient, amount)
+        success = self.blockchain.add_transaction(
+            self.wallet.public_key, recipient, signature, amount)
+        if success:
+            response = {
+                'message': 'Successfully added transaction.',
+                'transaction': {
+                    'sender': self.wallet.public_key,
+                    'recipient': recipient,
+                    'amount': amount,
+                    'signature': signature
+                },
+                'funds': self.blockchain.get_balance()
+            }
+            return response, 201
+        response = {
+            'message': 'Creating a transaction failed.'
+        }
+        return response, 500
+
+    def add_chipsaction(self, request):
+        if self.wallet.public_key == None:
+            response = {
+                'message': 'No wallet set up.'
+            }
+            return response, 400
+        values = request.values()
+        if not values:
+            response = {
+                'message': 'No data found.'
+            }
+            return response, 400
+        required_fields = ['recipient', 'placeID', 'message', 'amount']
+        if not all(field in values for field in required_fields):
+            response = {
+                'message': 'Required data is missing.'
+            }
+            return response, 400
+        recipient = values['recipient']
+        placeID = values['placeID']
+        message = values['message']
+        amount = values['amount']
+        signature = self.wallet.sign_chipsaction(self.wallet.public_key, recipient, placeID, message, amount)
+        success = self.blockchain.add_chipsaction(
+            self.wallet.public_key, recipient, placeID, message, signature, amount)
+        if success:
+            response = {
+                'message': 'Successfully added transaction.',
+                'transaction': {
+                    'sender': self.wallet.public_key,
+                    'recipient': recipient,
+                    'placeID': placeID,
+                    'message': message,
+                    'amount': amount,
+                    'signature': signature
+                },
+                'funds': self.blockchain.get_balance()
+            }
+            return response, 201
+        response = {
+            'message': 'Creating a chipsaction failed.'
+        }
+        return response, 500
+
+    def mine(self, request):
+        if self.miner is not None:
+            # Don't hold the connection open for a whole round, the progress is published by /mining-status
+            self.miner.trigger()
+            response = {
+                'message': 'Mining runs in the background.',
+                'status': self.miner.status()
+            }
+            return response, 202
+        if self.blockchain.resolve_conflicts:
+            response = {'message': 'Resolve conflicts first, block not added!'}
+            return response, 409
+        block = self.blockchain.mine_block()
+        if block != None:
+            response = {
+                'message': 'Block added successfully.',
+                'block': block.to_dict(),
+                'funds': self.blockchain.get_balance(),
+                'hash_rate': self.blockchain.get_mining_stats()['hash_rate']
+            }
+            return response, 201
+        mining_stats = self.blockchain.get_mining_stats()
+        if mining_stats != None and mining_stats['cancelled']:
+            response = {
+                'message': 'Mining was cancelled, a competing block arrived.',
+                'hash_rate': mining_stats['hash_rate']
+            }
+            return response, 409
+        response = {
+            'message': 'Adding a block failed.',
+            'wallet_set_up': self.wallet.public_key != None
+        }
+        return response, 500
+
+    def get_mining_status(self, request):
+        if self.miner is None:
+            response = {
+                'running': False,
+                'last_proof_of_work': self.blockchain.get_mining_stats()
+            }
+            return response, 200
+        return self.miner.status(), 200
+
+    def resolve_conflicts(self, request):
+        replaced = self.blockchain.resolve()
+        if replaced:
+            response = {'message': 'Chain was replaced!'}
+        else:
+            response = {'message': 'Local chain kept!'}
+        return response, 200
+
+    def get_open_transactions(self, request):
+        transactions = self.blockchain.get_open_transactions()
+        return [tx.to_dict() for tx in transactions], 200
+
+    def get_open_chipsactions(self, request):
+        chipsactions = self.blockchain.get_open_chipsactions()
+        return [tx.to_dict() for tx in chipsactions], 200
+
+    def get_chain(self, request):
+        chain_snapshot = self.blockchain.chain
+        # Paginated: /chain?from=<height>&limit=<count>, follow next_from until it's None
+        if 'from' in request.query or 'limit' in request.query:
+            start = max(request.query_int('from', 0), 0)
+            limit = min(max(request.query_int('limit', MAX_CHAIN_PAGE_SIZE), 1), MAX_CHAIN_PAGE_SIZE)
+            end = min(start + limit, len(chain_snapshot))
+            response = {
+                'blocks': [block.to_dict() for block in chain_snapshot.iter_range(start, end)],
+                'next_from': end if end < len(chain_snapshot) else None,
+                'length': len(chain_snapshot)
+            }
+            return response, 200
+        # Streamed binary: the blocks are encoded one by one (see codec.encode_blocks)
+        if request.accepts_binary():
+            return RawResponse(stream_chain(chain_snapshot, encode_binary_chunk, encode_blocks_header(len(chain_snapshot))),
+                               BINARY_CONTENT_TYPE)
+        # Streamed: one JSON encoded block per line
+        if request.query.get('format') == 'ndjson' or request.accept.best == 'application/x-ndjson':
+            return RawResponse(stream_chain(chain_snapshot, encode_ndjson_chunk), 'application/x-ndjson')
+        # Without parameters the whole chain is returned as a JSON list, it's encoded chunk by chunk while it's sent
+        return RawResponse(stream_chain(chain_snapshot, encode_json_chunk, b'[', b']'), 'application/json')
+
+    def get_tip(self, request):
+        return self.blockchain.get_tip(), 200
+
+    def get_headers(self, request):
+        start = request.query_int('from', 0)
+        count = min(request.query_int('count', MAX_HEADERS_PER_REQUEST), MAX_HEADERS_PER_REQUEST)
+        return self.blockchain.get_headers(start, count), 200
+
+    def get_inclusion_proof(self, request):
+        txid = request.params['txid']
+        # Light clients verify the branch against the Merkle root of a header they validated themselves
+        proof = self.blockchain.get_inclusion_proof(txid)
+        if proof is None:
+            response = {
+                'message': 'Transaction is not part of the chain.',
+                'txid': txid,
+                'pending': self.blockchain.has_open_transaction(txid)
+            }
+            return response, 404
+        return proof, 200
+
+    def get_blocks(self, request):
+        start = request.query_int('from', 0)
+        count = min(request.query_int('count', MAX_BLOCKS_PER_REQUEST), MAX_BLOCKS_PER_REQUEST)
+        blocks = self.blockchain.get_blocks(start, count)
+        if request.accepts_binary():
+            return RawResponse(encode_blocks(blocks), BINARY_CONTENT_TYPE)
+        return [block.to_dict() for block in blocks], 200
+
+    def get_address_history(self, request):
+        address = request.params['address']
+        # Newest first, follow next_before until it's None
+        before = request.query_int('before')
+        limit = min(max(request.query_int('limit', MAX_HISTORY_PAGE_SIZE), 1), MAX_HISTORY_PAGE_SIZE)
+        history, next_before = self.blockchain.get_address_history(address, before, limit)
+        response = {
+            'address': address,
+            'history': history,
+            'next_before': next_before
+        }
+        return response, 200
+
+    def get_author(self, request):
+        recipient = request.params['recipient']
+        latest = min(max(request.query_int('latest', DEFAULT_LATEST_CHIPSACTIONS), 0), MAX_LATEST_CHIPSACTIONS)
+        response = self.blockchain.get_recipient_summary(recipient, latest)
+        response['recipient'] = recipient
+        return response, 200
+
+    def get_place(self, request):
+        place = request.params['place']
+        latest = min(max(request.query_int('latest', DEFAULT_LATEST_CHIPSACTIONS), 0), MAX_LATEST_CHIPSACTIONS)
+        response = self.blockchain.get_place_summary(place, latest)
+        response['placeID'] = place
+        return response, 200
+
+    def get_place_chipsactions(self, request):
+        place = request.params['place']
+        # Newest first, follow next_before until it's None
+        before = request.query_int('before')
+        limit = min(max(request.query_int('limit', MAX_HISTORY_PAGE_SIZE), 1), MAX_HISTORY_PAGE_SIZE)
+        chipsactions, next_before = self.blockchain.get_place_chipsactions(place, before, limit)
+        response = {
+            'placeID': place,
+            'chipsactions': chipsactions,
+            'next_before': next_before
+        }
+        return response, 200
+
+    def add_node(self, request):
+        values = request.values()
+        if not values:
+            response = {
+                'message': 'No data attached.'
+            }
+            return response, 400
+        if 'node' not in values:
+            response = {
+                'message': 'No node data found.'
+            }
+            return response, 400
+        self.blockchain.add_peer_node(values['node'])
+        response = {
+            'message': 'Node added successfully.',
+            'all_nodes': self.blockchain.get_peer_nodes()
+        }
+        return response, 201
+
+    def remove_node(self, request):
+        node_url = request.params.get('node_url')
+        if node_url == '' or node_url == None:
+            response = {
+                'message': 'No node found.'
+            }
+            return response, 400
+        self.blockchain.remove_peer_node(node_url)
+        response = {
+            'message': 'Node removed',
+            'all_nodes': self.blockchain.get_peer_nodes()
+        }
+        return response, 200
+
+    def get_broadcast_stats(self, request):
+        return self.blockchain.get_broadcast_stats(), 200
+
+    def get_nodes(self, request):
+        response = {
+            'all_nodes': self.blockchain.get_peer_nodes()
+        }
+        return response, 200
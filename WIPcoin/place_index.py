@@ -0,0 +1,82 @@
+class ChipsAggregate:
+    """The running aggregates of the chipsactions of a single place or recipient.
+
+    Attributes:
+        :entries: The (height, position) of every chipsaction in chain order.
+        :total: The total amount of the chipsactions.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.total = 0
+
+    def count(self):
+        """Return the number of chipsactions."""
+        return len(self.entries)
+
+    def latest(self, count):
+        """Return the (height, position) of the latest chipsactions, newest first."""
+        return self.entries[-count:][::-1] if count > 0 else []
+
+    def page(self, before=None, limit=100):
+        """Return up to limit entries before the cursor (newest first) and the cursor of the next (older) page."""
+        end = len(self.entries) if before is None else min(max(before, 0), len(self.entries))
+        start = max(end - limit, 0)
+        return self.entries[start:end][::-1], start if start > 0 else None
+
+
+class PlaceIndex:
+    """Keeps running aggregates of the chipsactions per placeID and per recipient (author).
+
+    Chipsactions of a block are appended to the aggregates when the block is added and removed from the end
+    again when it's rolled back, so lookups don't depend on the length of the chain.
+
+    Attributes:
+        :places: The ChipsAggregate of every placeID.
+        :recipients: The ChipsAggregate of every recipient.
+    """
+
+    def __init__(self):
+        self.places = {}
+        self.recipients = {}
+
+    def apply_block(self, block):
+        """Add the chipsactions of a block which was appended to the chain.
+
+        Arguments:
+            :block: The block that was appended to the chain.
+        """
+        for position, tx in enumerate(block.chipsactions):
+            for aggregates, key in ((self.places, tx.placeID), (self.recipients, tx.recipient)):
+                aggregate = aggregates.get(key)
+                if aggregate is None:
+                    aggregate = aggregates[key] = ChipsAggregate()
+                aggregate.entries.append((block.index, position))
+                aggregate.total += tx.amount
+
+    def revert_block(self, block):
+        """Remove the chipsactions of the last block (which was rolled back)."""
+        for tx in reversed(block.chipsactions):
+            for aggregates, key in ((self.places, tx.placeID), (self.recipients, tx.recipient)):
+                aggregate = aggregates.get(key)
+                if aggregate is None:
+                    continue
+                aggregate.entries.pop()
+                aggregate.total -= tx.amount
+                if len(aggregate.entries) == 0:
+                    del aggregates[key]
+
+    def rebuild(self, chain):
+        """Rebuild the whole index from a chain."""
+        self.places = {}
+        self.recipients = {}
+        for block in chain:
+            self.apply_block(block)
+
+    def place(self, place):
+        """Return the ChipsAggregate of a placeID (or None if no chipsaction was sent to it)."""
+        return self.places.get(place)
+
+    def recipient(self, recipient):
+        """Return the ChipsAggregate of a recipient (or None if no chipsaction was sent to it)."""
+        return self.recipients.get(recipient)
@@ -0,0 +1,417 @@
+from array import array
+from collections import OrderedDict
+from collections.abc import Sequence
+import json
+from itertools import chain as iter_chain
+import mmap
+import os
+import struct
+import threading
+
+from block import Block
+from transaction import Transaction
+from chipsaction import Chipsaction
+from codec import decode_block, encode_block
+
+# The length prefix of every record in the block log
+_RECORD_LENGTH = struct.Struct('>I')
+
+
+def _read_records(path):
+    """Read the JSON records of a log file and cut off a partially written (torn) last record.
+
+    Arguments:
+        :path: The path of the log file.
+    """
+    records = []
+    if not os.path.exists(path):
+        return records
+    valid_size = 0
+    with open(path, mode='rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                records.append(json.loads(line.decode('utf8')))
+            except ValueError:
+                break
+            valid_size += len(line)
+    if valid_size != os.path.getsize(path):
+        print('Recovering {}: dropping incomplete record'.format(path))
+        with open(path, mode='r+b') as f:
+            f.truncate(valid_size)
+    return records
+
+
+def _write_atomically(path, chunks, sync=True):
+    """Atomically replace a file with the given chunks of bytes."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, mode='wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
+        if sync:
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _replace_file(path, records, sync=True):
+    """Atomically replace a log file with the given JSON records."""
+    _write_atomically(path, ((json.dumps(record) + '\n').encode('utf8') for record in records), sync)
+
+
+def _block_record(block):
+    """Return the block log record of a block (the binary encoded block with a length prefix)."""
+    payload = encode_block(block)
+    return _RECORD_LENGTH.pack(len(payload)) + payload
+
+
+class BlockLog(Sequence):
+    """A lazy sequence of blocks backed by a memory-mapped block log.
+
+    Every block is stored as a length-prefixed record in the binary format of the codec module. Only the byte offset of every block is kept in memory. Blocks are decoded when they are accessed
+    and the most recently used ones (including the tip) are kept in an LRU cache.
+    The log is safe to use from several threads (decoding and appending are serialized by an internal lock).
+
+    Attributes:
+        :path: The path of the block log.
+        :cache_size: The number of decoded blocks which are kept in memory.
+        :sync: Whether appended blocks are flushed to disk with fsync.
+    """
+
+    def __init__(self, path, cache_size=128, sync=True):
+        self.path = path
+        self.cache_size = cache_size
+        self.sync = sync
+        self.__file = open(path, mode='a+b')
+        self.__map = None
+        self.__offsets = array('q')
+        self.__size = 0
+        self.__cache = OrderedDict()
+        self.__lock = threading.RLock()
+        self._build_index()
+
+    def _remap(self):
+        if self.__map is not None:
+            self.__map.close()
+        self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _build_index(self):
+        """Collect the offset of every record and cut off a partially written (torn) last record."""
+        file_size = os.fstat(self.__file.fileno()).st_size
+        if file_size == 0:
+            return
+        self._remap()
+        position = 0
+        while position + _RECORD_LENGTH.size <= file_size:
+            end = position + _RECORD_LENGTH.size + _RECORD_LENGTH.unpack_from(self.__map, position)[0]
+            if end > file_size:
+                break
+            self.__offsets.append(position)
+            position = end
+        self.__size = position
+        if len(self.__offsets) > 0:
+            try:
+                self._decode(len(self.__offsets) - 1)
+            except ValueError:
+                position = self.__offsets.pop()
+        if position != file_size:
+            print('Recovering {}: dropping incomplete record'.format(self.path))
+            self.__map.close()
+            self.__map = None
+            self.__file.truncate(position)
+            self.__size = position
+
+    def _decode(self, index):
+        start = self.__offsets[index]
+        end = self.__offsets[index + 1] if index + 1 < len(self.__offsets) else self.__size
+        if self.__map is None or len(self.__map) < end:
+            self._remap()
+        return decode_block(self.__map[start + _RECORD_LENGTH.size:end])
+
+    def __len__(self):
+        return len(self.__offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('block index out of range')
+        with self.__lock:
+            block = self.__cache.get(index)
+            if block is not None:
+                self.__cache.move_to_end(index)
+                return block
+            block = self._decode(index)
+            self._remember(index, block)
+            return block
+
+    def __iter__(self):
+        return self.iter_range(0, len(self))
+
+    def iter_range(self, start, end):
+        """Yield the blocks from height start up to (excluding) end.
+
+        Scans (e.g. rebuilding an index or streaming the chain) decode blocks without flushing the cache.
+        """
+        for index in range(start, end):
+            with self.__lock:
+                block = self.__cache.get(index)
+                if block is None:
+                    block = self._decode(index)
+            yield block
+
+    def raw_prefix(self, length, chunk_size=1024 * 1024):
+        """Yield the raw records of the first length blocks in chunks of bytes (used to copy them into a new log)."""
+        with self.__lock:
+            end = self.__offsets[length] if length < len(self.__offsets) else self.__size
+        for position in range(0, end, chunk_size):
+            with self.__lock:
+                if self.__map is None or len(self.__map) < end:
+                    self._remap()
+                chunk = self.__map[position:min(position + chunk_size, end)]
+            yield chunk
+
+    def _remember(self, index, block):
+        self.__cache[index] = block
+        if len(self.__cache) > self.cache_size:
+            self.__cache.popitem(last=False)
+
+    def append(self, block):
+        """Append a block as a single record to the log."""
+        record = _block_record(block)
+        with self.__lock:
+            self.__file.seek(0, os.SEEK_END)
+            self.__file.write(record)
+            self.__file.flush()
+            if self.sync:
+                os.fsync(self.__file.fileno())
+            self.__offsets.append(self.__size)
+            self.__size += len(record)
+            self._remember(len(self.__offsets) - 1, block)
+
+    def truncate(self, length):
+        """Remove all blocks from the given height on (used when blocks are rolled back)."""
+        with self.__lock:
+            if length >= len(self):
+                return
+            position = self.__offsets[length]
+            if self.__map is not None:
+                self.__map.close()
+                self.__map = None
+            self.__file.truncate(position)
+            if self.sync:
+                os.fsync(self.__file.fileno())
+            del self.__offsets[length:]
+            self.__size = position
+            for index in [index for index in self.__cache if index >= length]:
+                del self.__cache[index]
+
+    def close(self):
+        """Unmap and close the block log file."""
+        with self.__lock:
+            if self.__map is not None:
+                self.__map.close()
+                self.__map = None
+            self.__file.close()
+
+    def snapshot(self):
+        """Return a read-only view of the blocks which are currently in the log."""
+        return ChainView(self, len(self))
+
+
+class ChainView(Sequence):
+    """A read-only, fixed-length view of a BlockLog (blocks appended later are not part of it)."""
+
+    def __init__(self, log, length):
+        self.log = log
+        self.__length = length
+
+    def __len__(self):
+        return self.__length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('block index out of range')
+        return self.log[index]
+
+    def __iter__(self):
+        return self.log.iter_range(0, self.__length)
+
+    def iter_range(self, start, end):
+        """Yield the blocks of the view from height start up to (excluding) end."""
+        return self.log.iter_range(max(start, 0), min(end, self.__length))
+
+
+class SplicedChain(Sequence):
+    """A read-only sequence of the first blocks of a chain followed by a list of other blocks (e.g. a peer's fork)."""
+
+    def __init__(self, base, base_length, blocks):
+        self.base = base
+        self.base_length = base_length
+        self.blocks = blocks
+
+    def __len__(self):
+        return self.base_length + len(self.blocks)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('block index out of range')
+        if index < self.base_length:
+            return self.base[index]
+        return self.blocks[index - self.base_length]
+
+
+class ChainStorage:
+    """Stores the blockchain in an append-only block log plus a journal for open transactions, chipsactions and peers.
+
+    Every block is one record in the block log, so adding a block only appends to the file.
+    Changes of the open transactions, chipsactions and peer nodes are appended to the journal,
+    which is compacted into a single snapshot record once it grows too long.
+
+    Attributes:
+        :block_path: The path of the (binary) block log.
+        :journal_path: The path of the journal.
+        :json_block_path: The path of the JSON block log of earlier versions which gets migrated once.
+        :legacy_path: The path of the old single-file storage which gets migrated once.
+        :compact_after: The number of journal records after which the journal is compacted.
+        :cache_size: The number of decoded blocks the block log keeps in memory.
+        :sync: Whether writes are flushed to disk with fsync.
+    """
+
+    def __init__(self, node_id, compact_after=500, cache_size=128, sync=True):
+        self.block_path = 'blocks-{}.dat'.format(node_id)
+        self.json_block_path = 'blocks-{}.log'.format(node_id)
+        self.journal_path = 'journal-{}.log'.format(node_id)
+        self.legacy_path = 'blockchain-{}.txt'.format(node_id)
+        self.compact_after = compact_after
+        self.cache_size = cache_size
+        self.sync = sync
+        self.__journal_length = 0
+
+    def _append(self, path, record):
+        with open(path, mode='a') as f:
+            f.write(json.dumps(record))
+            f.write('\n')
+            f.flush()
+            if self.sync:
+                os.fsync(f.fileno())
+
+    def load_chain(self):
+        """Recover and open the block log as a lazy BlockLog."""
+        self.migrate_legacy()
+        self.migrate_json_log()
+        return BlockLog(self.block_path, self.cache_size, self.sync)
+
+    def load_journal(self):
+        """Recover the journal and return (open transactions, open chipsactions, peer nodes)."""
+        open_transactions = OrderedDict()
+        open_chipsactions = OrderedDict()
+        peer_nodes = set()
+        records = _read_records(self.journal_path)
+        for record in records:
+            op = record['op']
+            if op == 'snapshot':
+                open_transactions = OrderedDict((tx.txid, tx) for tx in map(Transaction.from_dict, record['transactions']))
+                open_chipsactions = OrderedDict((tx.txid, tx) for tx in map(Chipsaction.from_dict, record['chipsactions']))
+                peer_nodes = set(record['peer_nodes'])
+            elif op == 'transaction':
+                tx = Transaction.from_dict(record['data'])
+                open_transactions[tx.txid] = tx
+            elif op == 'chipsaction':
+                tx = Chipsaction.from_dict(record['data'])
+                open_chipsactions[tx.txid] = tx
+            elif op == 'evict_transaction':
+                open_transactions.pop(record['data'], None)
+            elif op == 'evict_chipsaction':
+                open_chipsactions.pop(record['data'], None)
+            elif op == 'add_peer':
+                peer_nodes.add(record['data'])
+            elif op == 'remove_peer':
+                peer_nodes.discard(record['data'])
+        self.__journal_length = len(records)
+        return list(open_transactions.values()), list(open_chipsactions.values()), peer_nodes
+
+    def replace_chain(self, chain):
+        """Atomically rewrite the block log (used when the chain is replaced) and return the new BlockLog."""
+        _write_atomically(self.block_path, (_block_record(block) for block in chain), self.sync)
+        return BlockLog(self.block_path, self.cache_size, self.sync)
+
+    def fork_chain(self, log, length, blocks):
+        """Atomically replace the block log with the first length blocks of log followed by blocks and return the new BlockLog.
+
+        The records of the shared blocks are copied as they are. The old log file is only unlinked, so the old
+        BlockLog (and every view of it which readers still hold) keeps returning the blocks of the old chain.
+
+        Arguments:
+            :log: The current BlockLog.
+            :length: The number of blocks which are kept.
+            :blocks: The blocks which follow them.
+        """
+        _write_atomically(self.block_path, iter_chain(log.raw_prefix(length), (_block_record(block) for block in blocks)), self.sync)
+        return BlockLog(self.block_path, self.cache_size, self.sync)
+
+    def journal(self, op, data):
+        """Append an operation to the journal.
+
+        Arguments:
+            :op: The operation ('transaction', 'chipsaction', 'evict_transaction', 'evict_chipsaction', 'add_peer' or 'remove_peer').
+            :data: The JSON-serializable payload of the operation.
+        """
+        self._append(self.journal_path, {'op': op, 'data': data})
+        self.__journal_length += 1
+        return self.__journal_length >= self.compact_after
+
+    def compact(self, open_transactions, open_chipsactions, peer_nodes):
+        """Replace the journal with a single snapshot of the open transactions, chipsactions and peers."""
+        snapshot = {
+            'op': 'snapshot',
+            'transactions': [tx.to_dict() for tx in open_transactions],
+            'chipsactions': [tx.to_dict() for tx in open_chipsactions],
+            'peer_nodes': list(peer_nodes)
+        }
+        _replace_file(self.journal_path, [snapshot], self.sync)
+        self.__journal_length = 1
+
+    def migrate_legacy(self):
+        """Convert an old blockchain-<port>.txt file into the block log and journal (only done once)."""
+        if not os.path.exists(self.legacy_path) or os.path.exists(self.block_path) or os.path.exists(self.json_block_path):
+            return False
+        try:
+            with open(self.legacy_path, mode='r') as f:
+                file_content = f.readlines()
+            blockchain = json.loads(file_content[0][:-1])
+            open_transactions = json.loads(file_content[1][:-1])
+            open_chipsactions = json.loads(file_content[2][:-1])
+            peer_nodes = json.loads(file_content[3])
+        except (IOError, IndexError, ValueError):
+            print('Migrating {} failed!'.format(self.legacy_path))
+            return False
+        _replace_file(self.journal_path, [{
+            'op': 'snapshot',
+            'transactions': open_transactions,
+            'chipsactions': open_chipsactions,
+            'peer_nodes': peer_nodes
+        }], self.sync)
+        _write_atomically(self.block_path, (_block_record(Block.from_dict(block)) for block in blockchain), self.sync)
+        os.replace(self.legacy_path, self.legacy_path + '.migrated')
+        return True
+
+    def migrate_json_log(self):
+        """Convert the JSON block log (blocks-<port>.log) of earlier versions into the binary block log (only done once)."""
+        if not os.path.exists(self.json_block_path) or os.path.exists(self.block_path):
+            return False
+        blocks = (Block.from_dict(record) for record in _read_records(self.json_block_path))
+        _write_atomically(self.block_path, (_block_record(block) for block in blocks), self.sync)
+        os.replace(self.json_block_path, self.json_block_path + '.migrated')
+        return True
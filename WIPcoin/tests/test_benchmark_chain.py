@@ -0,0 +1,21 @@
+import os
+import stat
+import tempfile
+
+import pytest
+
+from benchmark.chain import KEY_CACHE_PATH, load_wallets
+
+
+def test_key_cache_is_not_in_the_shared_temp_directory():
+    assert not KEY_CACHE_PATH.startswith(tempfile.gettempdir())
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='needs POSIX file modes')
+def test_key_cache_is_private(tmp_path):
+    path = tmp_path / 'cache' / 'keys.json'
+    wallets = load_wallets(2, str(path))
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(path.parent).st_mode) == 0o700
+    # Later runs reuse the cached keys
+    assert [wallet.private_key for wallet in load_wallets(2, str(path))] == [wallet.private_key for wallet in wallets]
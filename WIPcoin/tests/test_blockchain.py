@@ -0,0 +1,115 @@
+from time import time
+
+import pytest
+
+from benchmark.chain import find_proof
+from block import Block
+from blockchain import Blockchain, reward_transaction
+from transaction import Transaction
+from utility.difficulty import MAX_FUTURE_BLOCK_TIME
+from utility.hash_util import hash_block
+from wallet import Wallet
+
+
+def test_rewards_of_the_same_miner_have_their_own_proofs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    blockchain = Blockchain('miner', 5000, mining_workers=1, verification_workers=1)
+    try:
+        blocks = [blockchain.mine_block() for _ in range(3)]
+        rewards = [block.transactions[-1] for block in blocks]
+        assert len({reward.txid for reward in rewards}) == len(rewards)
+        for block, reward in zip(blocks, rewards):
+            assert blockchain.get_inclusion_proof(reward.txid)['height'] == block.index
+    finally:
+        blockchain.close()
+
+
+@pytest.mark.parametrize('offset', [-3600, MAX_FUTURE_BLOCK_TIME + 3600])
+def test_blocks_with_a_timestamp_out_of_bounds_are_rejected(tmp_path, monkeypatch, offset):
+    monkeypatch.chdir(tmp_path)
+    blockchain = Blockchain('miner', 5000, mining_workers=1, verification_workers=1)
+    try:
+        for _ in range(3):
+            blockchain.mine_block()
+        chain = blockchain.chain
+        height = len(chain)
+
+        def received_block(timestamp):
+            template = Block(height, hash_block(chain[-1]), [reward_transaction('peer', height)], [], 0, timestamp,
+                             blockchain.next_difficulty())
+            return Block(height, template.previous_hash, template.transactions, [], find_proof(template), timestamp,
+                         template.difficulty)
+
+        assert not blockchain.add_block(received_block(time() + offset))
+        assert len(blockchain.chain) == height
+        assert blockchain.add_block(received_block(time()))
+    finally:
+        blockchain.close()
+
+
+def test_peers_with_malformed_answers_are_skipped_while_syncing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    blockchain = Blockchain('miner', 5000, mining_workers=1, verification_workers=1)
+    tips = {
+        'localhost:5001': [],
+        'localhost:5002': {'height': 5},
+        'localhost:5003': {'height': 5, 'cumulative_work': 'a lot'},
+        'localhost:5004': {'height': 5, 'cumulative_work': 10 ** 9},
+    }
+
+    def peer_get(node, path, *args, **kwargs):
+        # Only the tip is well-formed, every other answer of the last peer is garbage
+        return tips[node] if path == '/tip' else [None]
+
+    monkeypatch.setattr(blockchain, '_peer_get', peer_get)
+    try:
+        for node in tips:
+            blockchain.add_peer_node(node)
+        assert not blockchain.sync()
+        assert len(blockchain.chain) == 1
+    finally:
+        blockchain.close()
+
+
+def test_journal_entries_which_were_mined_are_not_reopened(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    wallet = Wallet(5000)
+    wallet.create_keys()
+    blockchain = Blockchain(wallet.public_key, 5000, mining_workers=1, verification_workers=1)
+    try:
+        blockchain.mine_block()
+        signature = wallet.sign_transaction(wallet.public_key, 'recipient', 3)
+        assert blockchain.add_transaction(wallet.public_key, 'recipient', signature, 3)
+        tx = blockchain.get_open_transactions()[0]
+        blockchain.mine_block()
+        # A stop right after the block was stored leaves the transaction in the journal
+        blockchain.journal('transaction', tx.to_dict())
+        balance = blockchain.get_balance()
+    finally:
+        blockchain.close()
+    blockchain = Blockchain(wallet.public_key, 5000, mining_workers=1, verification_workers=1)
+    try:
+        assert blockchain.get_open_transactions() == []
+        assert blockchain.get_balance() == balance
+    finally:
+        blockchain.close()
+
+
+@pytest.mark.parametrize('max_block_transactions, accepted', [(1, False), (2, True)])
+def test_oversized_blocks_are_rejected(tmp_path, monkeypatch, max_block_transactions, accepted):
+    monkeypatch.chdir(tmp_path)
+    wallet = Wallet(5000)
+    wallet.create_keys()
+    blockchain = Blockchain('miner', 5000, mining_workers=1, verification_workers=1, max_block_transactions=max_block_transactions)
+    try:
+        chain = blockchain.chain
+        transactions = [Transaction(wallet.public_key, 'recipient', wallet.sign_transaction(wallet.public_key, 'recipient', amount), amount)
+                        for amount in (1, 2)]
+        template = Block(1, hash_block(chain[-1]), transactions + [reward_transaction('peer', 1)], [], 0, time(),
+                         blockchain.next_difficulty())
+        block = Block(1, template.previous_hash, template.transactions, [], find_proof(template), template.timestamp,
+                      template.difficulty)
+        assert blockchain.add_block(block) == accepted
+        assert len(blockchain.chain) == (2 if accepted else 1)
+    finally:
+        blockchain.close()
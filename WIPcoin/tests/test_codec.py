@@ -0,0 +1,94 @@
+import pytest
+
+from block import Block, LEGACY_BLOCK_VERSION
+from chipsaction import Chipsaction
+from codec import (_write_number, _write_string, _write_varint, decode_block, decode_blocks, decode_chipsaction,
+                   decode_transaction, encode_block, encode_blocks, encode_chipsaction, encode_transaction)
+from transaction import Transaction
+
+SENDER = 'ab' * 32
+SIGNATURE = 'cd' * 64
+
+
+def _block(version=LEGACY_BLOCK_VERSION):
+    transactions = [Transaction(SENDER, 'recipient', SIGNATURE, 2.5), Transaction('MINING', SENDER, 'height-3', 10)]
+    chipsactions = [Chipsaction(SENDER, 'recipient', 'place', 'Hello', SIGNATURE, 1)]
+    return Block(3, 'ef' * 32, transactions, chipsactions, 42, 1600000000.5, 256, version)
+
+
+def _version_1_payload(block):
+    """Encode a block the way nodes did before blocks had versions (without the version field)."""
+    out = bytearray([1])
+    _write_number(out, block.index)
+    _write_string(out, block.previous_hash)
+    _write_number(out, block.timestamp)
+    _write_number(out, block.proof)
+    _write_number(out, block.difficulty)
+    _write_varint(out, len(block.transactions))
+    for tx in block.transactions:
+        _write_string(out, tx.sender)
+        _write_string(out, tx.recipient)
+        _write_number(out, tx.amount)
+        _write_string(out, tx.signature)
+    _write_varint(out, len(block.chipsactions))
+    for tx in block.chipsactions:
+        _write_string(out, tx.sender)
+        _write_string(out, tx.recipient)
+        _write_string(out, tx.placeID)
+        _write_string(out, tx.message)
+        _write_number(out, tx.amount)
+        _write_string(out, tx.signature)
+    return bytes(out)
+
+
+@pytest.mark.parametrize('amount', [0, 5, -5, 2 ** 70, 0.1, 2.5, -0.5, 1e300])
+def test_amounts_keep_their_value_and_type(amount):
+    decoded = decode_transaction(encode_transaction(Transaction(SENDER, 'recipient', SIGNATURE, amount)))
+    assert decoded.amount == amount
+    assert type(decoded.amount) is type(amount)
+
+
+@pytest.mark.parametrize('value', ['', 'ab' * 32, 'ABCD', 'abc', 'MINING', 'height-3', 'Grüße'])
+def test_strings_are_decoded_unchanged(value):
+    decoded = decode_chipsaction(encode_chipsaction(Chipsaction(value, value, value, value, value, 1)))
+    assert (decoded.sender, decoded.recipient, decoded.placeID, decoded.message, decoded.signature) == (value,) * 5
+
+
+def test_hex_strings_are_stored_as_raw_bytes():
+    payload = encode_transaction(Transaction(SENDER, 'recipient', SIGNATURE, 1))
+    assert bytes.fromhex(SIGNATURE) in payload
+    assert SIGNATURE.encode('utf8') not in payload
+    assert b'recipient' in payload
+
+
+@pytest.mark.parametrize('version', [LEGACY_BLOCK_VERSION, 2])
+def test_blocks_survive_the_round_trip(version):
+    block = _block(version)
+    assert decode_block(encode_block(block)).to_dict() == block.to_dict()
+    assert [decoded.to_dict() for decoded in decode_blocks(encode_blocks([block, block]))] == [block.to_dict()] * 2
+
+
+def test_version_1_payloads_decode_to_legacy_blocks():
+    block = _block()
+    decoded = decode_block(_version_1_payload(block))
+    assert decoded.version == LEGACY_BLOCK_VERSION
+    assert decoded.to_dict() == block.to_dict()
+
+
+def test_unsupported_versions_are_rejected():
+    with pytest.raises(ValueError):
+        decode_block(bytes([99]) + encode_block(_block())[1:])
+
+
+@pytest.mark.parametrize('decode, payload', [
+    (decode_block, encode_block(_block())),
+    (decode_blocks, encode_blocks([_block(), _block()])),
+    (decode_transaction, encode_transaction(Transaction(SENDER, 'recipient', SIGNATURE, 0.1))),
+    (decode_chipsaction, encode_chipsaction(Chipsaction(SENDER, 'recipient', 'place', 'Hello', SIGNATURE, 1)))
+])
+def test_truncated_and_padded_payloads_are_rejected(decode, payload):
+    for length in range(len(payload)):
+        with pytest.raises(ValueError):
+            decode(payload[:length])
+    with pytest.raises(ValueError):
+        decode(payload + b'\x00')
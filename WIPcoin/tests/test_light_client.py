@@ -0,0 +1,45 @@
+from block import Block
+from light_client import GENESIS_HASH, LightClient
+from utility.difficulty import DEFAULT_DIFFICULTY
+from utility.hash_util import LEGACY_BLOCK_VERSION
+
+
+def _forged_legacy_headers(height):
+    """Return the headers of a chain whose blocks after the genesis block are legacy blocks with made up hashes."""
+    headers = [Block(0, '', [], [], 100, 0, DEFAULT_DIFFICULTY, LEGACY_BLOCK_VERSION).header()]
+    for index in range(1, height + 1):
+        headers.append({'index': index, 'previous_hash': headers[-1]['hash'], 'merkle_root': None, 'timestamp': index,
+                        'proof': 0, 'difficulty': DEFAULT_DIFFICULTY, 'version': LEGACY_BLOCK_VERSION,
+                        'hash': '{:064x}'.format(index)})
+    return headers
+
+
+def _client(headers, **options):
+    """Return a light client whose node serves the given headers."""
+    client = LightClient('peer', **options)
+
+    def get(path, params=None):
+        if path == '/tip':
+            return {'height': len(headers) - 1, 'hash': headers[-1]['hash']}
+        return headers[params['from']:params['from'] + params['count']]
+    client._get = get
+    return client
+
+
+def test_forged_legacy_headers_are_rejected():
+    headers = _forged_legacy_headers(5)
+    assert headers[0]['hash'] == GENESIS_HASH
+    client = _client(headers)
+    assert not client.sync()
+    assert client.headers == []
+
+
+def test_legacy_headers_are_accepted_at_checkpoints():
+    headers = _forged_legacy_headers(5)
+    client = _client(headers, checkpoints={header['index']: header['hash'] for header in headers[1:]})
+    assert client.sync()
+    assert [header.hash for header in client.headers] == [header['hash'] for header in headers]
+    # A legacy header beyond the checkpoints isn't trusted
+    client = _client(headers + _forged_legacy_headers(6)[6:],
+                     checkpoints={header['index']: header['hash'] for header in headers[1:]})
+    assert not client.sync()
@@ -0,0 +1,41 @@
+import json
+
+from block import Block
+from blockchain import Blockchain, MINING_REWARD
+from utility.difficulty import DEFAULT_DIFFICULTY, RETARGET_INTERVAL
+from utility.hash_util import LEGACY_BLOCK_VERSION
+from utility.verification import Verification
+
+
+def _baseline_chain(height):
+    """Return the blocks of a chain in the oldest storage format: no difficulty and one shared timestamp."""
+    timestamp = 1500000000.0
+    blocks = [Block(0, '', [], [], 100, 0, DEFAULT_DIFFICULTY, LEGACY_BLOCK_VERSION)]
+    for index in range(1, height + 1):
+        previous_hash = blocks[-1].hash
+        proof = 0
+        while not Verification.valid_legacy_proof([], [], previous_hash, proof, DEFAULT_DIFFICULTY):
+            proof += 1
+        reward = {'sender': 'MINING', 'recipient': 'baseline-miner', 'signature': '', 'amount': MINING_REWARD}
+        blocks.append(Block.from_dict({'index': index, 'previous_hash': previous_hash, 'timestamp': timestamp,
+                                       'transactions': [reward], 'chipsactions': [], 'proof': proof}))
+    records = []
+    for block in blocks:
+        record = block.to_dict()
+        del record['difficulty'], record['version']
+        records.append(record)
+    return records
+
+
+def test_migrated_baseline_chain_stays_valid(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    height = 2 * RETARGET_INTERVAL + 3
+    with open('blockchain-5000.txt', mode='w') as f:
+        f.write(json.dumps(_baseline_chain(height)) + '\n[]\n[]\n[]')
+    blockchain = Blockchain('miner', 5000, mining_workers=1, verification_workers=1)
+    try:
+        assert len(blockchain.chain) == height + 1
+        assert Verification.verify_chain(blockchain.chain, blockchain.retarget_interval, blockchain.target_block_time)
+        assert blockchain.next_difficulty() == DEFAULT_DIFFICULTY
+    finally:
+        blockchain.close()
@@ -0,0 +1,56 @@
+import json
+import os
+
+import pytest
+
+from node_api import NodeApi, NodeRequest
+from wallet import Wallet
+
+
+def _api():
+    wallet = Wallet(5000)
+    wallet.create_keys()
+    api = NodeApi(wallet, 5000, mining_workers=1, verification_workers=1)
+    api.set_up_blockchain()
+    return api
+
+
+def _open_files():
+    return len(os.listdir('/proc/self/fd'))
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='needs /proc to count the open files')
+def test_replaced_blockchains_are_closed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    api = _api()
+    try:
+        # Reloaded once, so the genesis block is on disk and the block log is memory-mapped
+        api.set_up_blockchain()
+        open_files = _open_files()
+        for _ in range(5):
+            api.set_up_blockchain()
+        assert _open_files() == open_files
+        assert len(api.blockchain.chain) == 1
+    finally:
+        api.close()
+
+
+@pytest.mark.parametrize('body, binary', [
+    (json.dumps({'block': {'index': 1}}).encode(), False),
+    (json.dumps({'block': {'index': '1', 'previous_hash': '', 'transactions': [], 'chipsactions': [], 'proof': 0,
+                           'timestamp': 0}}).encode(), False),
+    (json.dumps({'block': {'index': 1, 'previous_hash': '', 'transactions': [{'amount': 1}], 'chipsactions': [],
+                           'proof': 0, 'timestamp': 0}}).encode(), False),
+    (json.dumps({'block': [1, 2]}).encode(), False),
+    (json.dumps(['block']).encode(), False),
+    (b'\x02\xff', True)
+])
+def test_malformed_blocks_are_rejected(tmp_path, monkeypatch, body, binary):
+    monkeypatch.chdir(tmp_path)
+    api = _api()
+    try:
+        response, status = api.broadcast_block(NodeRequest({}, body, binary, None, {}))
+        assert status == 400
+        assert response['message']
+    finally:
+        api.close()
@@ -0,0 +1,30 @@
+import socket
+import threading
+
+import node
+from benchmark import stress
+
+# The number of seconds the stress test may take (including the invariant checks) before it counts as stuck
+TIMEOUT = 120
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_invariants_hold_under_concurrent_load(tmp_path, monkeypatch):
+    # The stress test changes the working directory and replaces the node's API, both are restored afterwards
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(node, 'api', node.api)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(stress.run(seconds=2, readers=2, writers=2, port=_free_port())),
+                              daemon=True)
+    thread.start()
+    thread.join(TIMEOUT)
+    assert not thread.is_alive(), 'the stress test is stuck'
+    result = results[0]
+    assert result['problems'] == []
+    assert result['requests'] > 0
+    assert result['blocks'] > 1
@@ -0,0 +1,119 @@
+import threading
+from time import time
+
+import pytest
+
+from benchmark.chain import find_proof, generate_chain
+from block import Block
+from transaction import Transaction
+from utility.difficulty import MAX_FUTURE_BLOCK_TIME
+from utility.verification import Verification
+from verifier import BatchVerifier
+from wallet import Wallet
+
+# The number of seconds a verification may take before it counts as deadlocked
+TIMEOUT = 60
+
+
+def _wallet():
+    wallet = Wallet('test')
+    wallet.create_keys()
+    return wallet
+
+
+def _signed_transactions(count):
+    wallet = _wallet()
+    transactions = []
+    for amount in range(1, count + 1):
+        signature = wallet.sign_transaction(wallet.public_key, 'recipient', amount)
+        transactions.append(Transaction(wallet.public_key, 'recipient', signature, amount))
+    return transactions
+
+
+def _run_with_timeout(function):
+    """Run a function in a thread and return its result, or fail if it doesn't finish in time."""
+    results = []
+    thread = threading.Thread(target=lambda: results.append(function()), daemon=True)
+    thread.start()
+    thread.join(TIMEOUT)
+    assert not thread.is_alive(), 'the verification is stuck'
+    return results[0]
+
+
+def test_workers_started_while_signature_cache_is_locked():
+    transactions = _signed_transactions(8)
+    verifier = BatchVerifier(2, parallel_threshold=1, chunk_size=2)
+    lock = Wallet.signature_cache._SignatureCache__lock
+    try:
+        # The workers are started while the lock is held, as if another request thread was using the cache
+        with lock:
+            verifier._get_pool()
+        Wallet.signature_cache.clear()
+        transaction_results, _ = _run_with_timeout(lambda: verifier.verify(transactions, []))
+        assert transaction_results == [True] * len(transactions)
+    finally:
+        verifier.close()
+
+
+def test_chain_verified_in_parallel_while_signature_cache_is_locked():
+    chain, _ = generate_chain(8, transactions=2, chipsactions=1, participants=2, wallets=[_wallet(), _wallet()])
+    verifier = BatchVerifier(2, chain_chunk_size=2)
+    locked = threading.Event()
+    release = threading.Event()
+
+    def hold_lock():
+        with Wallet.signature_cache._SignatureCache__lock:
+            locked.set()
+            release.wait()
+    holder = threading.Thread(target=hold_lock, daemon=True)
+    holder.start()
+    locked.wait()
+    try:
+        # Another thread holds the lock during the whole verification, the workers have caches of their own
+        assert _run_with_timeout(lambda: verifier.verify_chain(chain))
+    finally:
+        release.set()
+        holder.join()
+        verifier.close()
+
+
+@pytest.mark.parametrize('parallel', [False, True])
+def test_chain_with_a_wrong_index_is_invalid(parallel):
+    chain, _ = generate_chain(8, transactions=1, chipsactions=0, participants=2, wallets=[_wallet(), _wallet()])
+    block = chain[5]
+    template = Block(99, block.previous_hash, block.transactions, block.chipsactions, 0, block.timestamp, block.difficulty)
+    chain[5] = Block(99, block.previous_hash, block.transactions, block.chipsactions, find_proof(template), block.timestamp,
+                     block.difficulty)
+    verifier = BatchVerifier(2, chain_chunk_size=2)
+    try:
+        assert not Verification.verify_chain(chain, verifier=verifier, parallel=parallel)
+    finally:
+        verifier.close()
+
+
+@pytest.mark.parametrize('parallel', [False, True])
+@pytest.mark.parametrize('timestamp', [lambda chain: chain[1].timestamp, lambda chain: time() + MAX_FUTURE_BLOCK_TIME + 3600])
+def test_chain_with_a_timestamp_out_of_bounds_is_invalid(parallel, timestamp):
+    chain, _ = generate_chain(8, transactions=1, chipsactions=0, participants=2, wallets=[_wallet(), _wallet()])
+    block = chain[-1]
+    template = Block(block.index, block.previous_hash, block.transactions, block.chipsactions, 0, timestamp(chain),
+                     block.difficulty)
+    chain[-1] = Block(block.index, block.previous_hash, block.transactions, block.chipsactions, find_proof(template),
+                      template.timestamp, block.difficulty)
+    verifier = BatchVerifier(2, chain_chunk_size=2)
+    try:
+        assert not Verification.verify_chain(chain, verifier=verifier, parallel=parallel)
+    finally:
+        verifier.close()
+
+
+@pytest.mark.parametrize('parallel', [False, True])
+def test_chain_with_an_oversized_block_is_invalid(parallel):
+    chain, _ = generate_chain(6, transactions=2, chipsactions=1, participants=2, wallets=[_wallet(), _wallet()])
+    verifier = BatchVerifier(2, chain_chunk_size=2)
+    try:
+        assert Verification.verify_chain(chain, verifier=verifier, parallel=parallel, max_transactions=2, max_chipsactions=1)
+        assert not Verification.verify_chain(chain, verifier=verifier, parallel=parallel, max_transactions=1)
+        assert not Verification.verify_chain(chain, verifier=verifier, parallel=parallel, max_chipsactions=0)
+    finally:
+        verifier.close()
@@ -1,22 +1,40 @@
 from collections import OrderedDict
+import json
+from sys import intern
 
-from utility.printable import Printable
+from utility.hash_util import hash_string_256
+from utility.record import Record
 
-class Transaction(Printable):
+class Transaction(Record):
     """A transaction which can be added to a block in the blockchain.
 
+    Transactions are immutable. The addresses are interned, so all transactions of a participant share one key string.
+
     Attributes:
         :sender: The sender of the coins.
         :recipient: The recipient of the coins.
         :signature: The signature of the transaction.
         :amount: The amount of coins sent.
+        :txid: The unique id of the transaction (derived from its content).
     """
+    __slots__ = ('sender', 'recipient', 'amount', 'signature', 'txid')
+
     def __init__(self, sender, recipient, signature, amount):
-        self.sender = sender
-        self.recipient = recipient
-        self.amount = amount
-        self.signature = signature
+        self._set('sender', intern(sender))
+        self._set('recipient', intern(recipient))
+        self._set('amount', amount)
+        self._set('signature', signature)
+        self._set('txid', hash_string_256(json.dumps(['transaction', sender, recipient, amount, signature]).encode()))
 
     def to_ordered_dict(self):
         """Converts this transaction into a (hashable) OrderedDict."""
         return OrderedDict([('sender', self.sender), ('recipient', self.recipient), ('amount', self.amount)])
+
+    def to_dict(self):
+        """Converts this transaction into a JSON-serializable dict."""
+        return {'sender': self.sender, 'recipient': self.recipient, 'amount': self.amount, 'signature': self.signature, 'txid': self.txid}
+
+    @classmethod
+    def from_dict(cls, tx):
+        """Create a transaction from its dict representation (the txid is derived again)."""
+        return cls(tx['sender'], tx['recipient'], tx['signature'], tx['amount'])
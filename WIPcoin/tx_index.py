@@ -0,0 +1,47 @@
+class TxIndex:
+    """Indexes in which block every transaction and chipsaction is included, so inclusion proofs don't need a chain scan.
+
+    Every entry is a (height, kind, position) tuple like the ones of the AddressIndex. Mining rewards of older
+    versions didn't contain their height, the ones of the same miner share a txid. So a txid maps to a list of
+    entries in chain order.
+
+    Attributes:
+        :entries: The entries of every txid (oldest first).
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def _txids(self, block):
+        for kind, txs in (('transaction', block.transactions), ('chipsaction', block.chipsactions)):
+            for position, tx in enumerate(txs):
+                yield tx.txid, (block.index, kind, position)
+
+    def apply_block(self, block):
+        """Add the transactions and chipsactions of a block which was appended to the chain.
+
+        Arguments:
+            :block: The block that was appended to the chain.
+        """
+        for txid, entry in self._txids(block):
+            self.entries.setdefault(txid, []).append(entry)
+
+    def revert_block(self, block):
+        """Remove the transactions and chipsactions of the last block (which was rolled back)."""
+        for txid, entry in self._txids(block):
+            entries = self.entries.get(txid)
+            if entries:
+                entries.pop()
+                if len(entries) == 0:
+                    del self.entries[txid]
+
+    def rebuild(self, chain):
+        """Rebuild the whole index from a chain."""
+        self.entries = {}
+        for block in chain:
+            self.apply_block(block)
+
+    def locate(self, txid):
+        """Return the (height, kind, position) of the oldest block which includes a txid or None if it isn't in the chain."""
+        entries = self.entries.get(txid)
+        return entries[0] if entries else None
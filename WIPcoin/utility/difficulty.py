@@ -0,0 +1,73 @@
+"""Provides the proof of work target and difficulty retargeting helpers."""
+
+from utility.hash_util import LEGACY_BLOCK_VERSION
+
+# The largest possible sha256 value, a hash has to be below MAX_TARGET // difficulty to be valid
+MAX_TARGET = 2 ** 256
+# A difficulty of 256 requires (on average) the same work as two leading 0s in the hex digest
+DEFAULT_DIFFICULTY = 256
+# The number of blocks after which the difficulty is adjusted
+RETARGET_INTERVAL = 10
+# The number of seconds we want to pass between two blocks
+TARGET_BLOCK_TIME = 10
+# The difficulty changes at most by this factor per retarget
+MAX_ADJUSTMENT = 4
+# A block's timestamp has to be later than the median timestamp of this many blocks before it
+MEDIAN_TIME_SPAN = 11
+# The number of seconds a block's timestamp may be ahead of our clock
+MAX_FUTURE_BLOCK_TIME = 120
+
+
+def target_for(difficulty):
+    """Return the integer target a proof of work hash has to stay below.
+
+    Arguments:
+        :difficulty: The difficulty of the block.
+    """
+    return MAX_TARGET // difficulty
+
+
+def expected_difficulty(chain, height, retarget_interval=RETARGET_INTERVAL, target_block_time=TARGET_BLOCK_TIME):
+    """Return the difficulty the block at a given height has to use.
+
+    The difficulty is inherited from the previous block and adjusted every retarget_interval blocks,
+    so that the timestamps of the last interval move towards target_block_time seconds per block.
+    Windows which contain legacy blocks keep the previous difficulty: blocks migrated from the oldest storage format
+    all share one timestamp, so their timestamps don't measure anything.
+
+    Arguments:
+        :chain: The blocks preceding (at least) the given height.
+        :height: The index of the block whose difficulty is calculated.
+        :retarget_interval: The number of blocks after which the difficulty is adjusted.
+        :target_block_time: The number of seconds we want to pass between two blocks.
+    """
+    if height < 1:
+        return DEFAULT_DIFFICULTY
+    previous_difficulty = chain[height - 1].difficulty
+    # The genesis block has no meaningful timestamp, so it's never part of a retarget window
+    if height % retarget_interval != 0 or height - retarget_interval < 1:
+        return previous_difficulty
+    # Versions never decrease along the chain, so the window contains a legacy block if its first block is one
+    if chain[height - retarget_interval].version == LEGACY_BLOCK_VERSION:
+        return previous_difficulty
+    actual_time = chain[height - 1].timestamp - chain[height - retarget_interval].timestamp
+    expected_time = target_block_time * (retarget_interval - 1)
+    difficulty = int(previous_difficulty * expected_time / max(actual_time, 1e-3))
+    difficulty = min(max(difficulty, previous_difficulty // MAX_ADJUSTMENT), previous_difficulty * MAX_ADJUSTMENT)
+    return max(difficulty, 1)
+
+
+def median_time_past(chain, height, span=MEDIAN_TIME_SPAN):
+    """Return the median timestamp of the (up to span) blocks before a given height.
+
+    Retargeting measures the time between the timestamps, so they have to move forward: a block's timestamp has to
+    be later than this median. A single block's timestamp may still be off (clocks of miners differ), but it can't
+    drag the timestamps of the chain back.
+
+    Arguments:
+        :chain: The blocks preceding (at least) the given height.
+        :height: The index of the block whose timestamp is checked.
+        :span: The number of blocks the median is taken from.
+    """
+    timestamps = sorted(chain[index].timestamp for index in range(max(height - span, 0), height))
+    return timestamps[len(timestamps) // 2]
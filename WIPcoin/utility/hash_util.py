@@ -1,6 +1,11 @@
 import hashlib as hl
 import json
 
+# Blocks of this version are hashed over their whole content (the chains which were mined before blocks had a Merkle root)
+LEGACY_BLOCK_VERSION = 1
+# Blocks of this version are hashed over their fixed-size header, which commits to the content through the Merkle root
+BLOCK_VERSION = 2
+
 
 def hash_string_256(string):
     """Create a SHA256 hash for a given input string.
@@ -11,13 +16,49 @@ def hash_string_256(string):
     return hl.sha256(string).hexdigest()
 
 
+def header_prefix(index, previous_hash, merkle_root, timestamp, difficulty):
+    """Serialize the fields of a block header which precede the proof.
+
+    The proof is appended to this prefix, so the proof of work hashes the prefix only once per mining run.
+
+    Arguments:
+        :index: The index of the block.
+        :previous_hash: The hash of the previous block.
+        :merkle_root: The Merkle root of the block's transactions and chipsactions.
+        :timestamp: The timestamp of the block.
+        :difficulty: The difficulty the proof of work of the block has to meet.
+    """
+    return json.dumps([index, previous_hash, merkle_root, timestamp, difficulty]).encode()
+
+
+def hash_header(prefix, proof):
+    """Hash a serialized header prefix (see header_prefix) together with its proof.
+
+    Arguments:
+        :prefix: The serialized header without the proof.
+        :proof: The proof of work number of the block.
+    """
+    return hash_string_256(prefix + str(proof).encode())
+
+
 def hash_block(block):
     """Hashes a block and returns a string representation of it.
 
+    Only the header is hashed, the transactions and chipsactions are covered by the Merkle root.
+    Legacy blocks are still hashed over their whole content, so the chains mined before keep their hashes.
+
     Arguments:
         :block: The block that should be hashed.
     """
-    hashable_block = block.__dict__.copy()
-    hashable_block['transactions'] = [tx.to_ordered_dict() for tx in hashable_block['transactions']]
-    hashable_block['chipsactions'] = [tx.to_ordered_dict() for tx in hashable_block['chipsactions']]
+    if block.version != LEGACY_BLOCK_VERSION:
+        return hash_header(block.header_prefix(), block.proof)
+    # The difficulty isn't part of the hash (it's derived from the chain and checked separately), which keeps existing chains valid
+    hashable_block = {
+        'index': block.index,
+        'previous_hash': block.previous_hash,
+        'timestamp': block.timestamp,
+        'transactions': [tx.to_ordered_dict() for tx in block.transactions],
+        'chipsactions': [tx.to_ordered_dict() for tx in block.chipsactions],
+        'proof': block.proof
+    }
     return hash_string_256(json.dumps(hashable_block, sort_keys=True).encode())
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""Provides the Merkle tree over the transactions and chipsactions of a block."""
+
+import hashlib as hl
+
+# Leaves and inner nodes are hashed with different prefixes, so an inner node can't pass for a leaf
+_LEAF_PREFIX = b'\x00'
+_NODE_PREFIX = b'\x01'
+
+
+def leaf_hash(txid):
+    """Return the hash (bytes) of the leaf of a transaction or chipsaction.
+
+    Arguments:
+        :txid: The txid (hex string) of the transaction or chipsaction.
+    """
+    return hl.sha256(_LEAF_PREFIX + bytes.fromhex(txid)).digest()
+
+
+def node_hash(left, right):
+    """Return the hash (bytes) of an inner node from the hashes of its two children."""
+    return hl.sha256(_NODE_PREFIX + left + right).digest()
+
+
+def _next_level(level):
+    paired = [node_hash(level[index], level[index + 1]) for index in range(0, len(level) - 1, 2)]
+    if len(level) % 2 == 1:
+        paired.append(level[-1])
+    return paired
+
+
+def merkle_root(txids):
+    """Return the Merkle root (hex string) of a list of txids.
+
+    Pairs of nodes are hashed level by level. The last node of a level with an odd number of nodes moves up
+    unchanged (it isn't paired with a copy of itself, so two different lists can't share a root).
+
+    Arguments:
+        :txids: The txids of the transactions followed by the txids of the chipsactions of a block.
+    """
+    level = [leaf_hash(txid) for txid in txids]
+    if len(level) == 0:
+        return hl.sha256(b'').hexdigest()
+    while len(level) > 1:
+        level = _next_level(level)
+    return level[0].hex()
+
+
+def merkle_branch(txids, position):
+    """Return the Merkle branch which proves that the txid at a position is part of the Merkle root of txids.
+
+    The branch lists the sibling of every node on the path from the leaf to the root as a dict with its 'hash'
+    and its 'side' ('left' or 'right'). Levels on which the node moves up unchanged have no entry.
+
+    Arguments:
+        :txids: The txids of the transactions followed by the txids of the chipsactions of a block.
+        :position: The position of the txid which should be proven.
+    """
+    level = [leaf_hash(txid) for txid in txids]
+    branch = []
+    while len(level) > 1:
+        sibling = position ^ 1
+        if sibling < len(level):
+            branch.append({'hash': level[sibling].hex(), 'side': 'left' if sibling < position else 'right'})
+        level = _next_level(level)
+        position //= 2
+    return branch
+
+
+def verify_branch(txid, branch, root):
+    """Check whether a Merkle branch (see merkle_branch) leads from a txid to a Merkle root.
+
+    Arguments:
+        :txid: The txid whose inclusion is checked.
+        :branch: The siblings on the path from the leaf to the root.
+        :root: The Merkle root (hex string) of the block header.
+    """
+    try:
+        node = leaf_hash(txid)
+        for step in branch:
+            sibling = bytes.fromhex(step['hash'])
+            if step['side'] == 'left':
+                node = node_hash(sibling, node)
+            elif step['side'] == 'right':
+                node = node_hash(node, sibling)
+            else:
+                return False
+    except (ValueError, TypeError, KeyError):
+        return False
+    return node.hex() == root
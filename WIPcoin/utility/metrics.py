@@ -0,0 +1,221 @@
+"""Provides counters, gauges and latency histograms which are exposed in the Prometheus text format (see /metrics)."""
+
+from bisect import bisect_left
+from functools import wraps
+import threading
+from time import perf_counter
+
+# The upper bounds (in seconds) of the buckets of the latency histograms
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if len(pairs) == 0:
+        return ''
+    escaped = ['{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for name, value in pairs]
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, help):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+
+    def header(self):
+        return ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.kind)]
+
+
+class Counter(_Metric):
+    """A value which only goes up (e.g. the number of hashes tried), optionally split up by labels."""
+    kind = 'counter'
+
+    def __init__(self, registry, name, help):
+        super().__init__(registry, name, help)
+        self.__values = {}
+
+    def inc(self, amount=1, **labels):
+        """Add amount to the counter of the given labels (does nothing while the metrics are disabled)."""
+        if not self.registry.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self.__values[key] = self.__values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = list(self.__values.items())
+        return ['{}{} {}'.format(self.name, _format_labels(key), _format_value(value)) for key, value in values]
+
+
+class Histogram(_Metric):
+    """Counts observations (e.g. durations in seconds) in cumulative buckets, optionally split up by labels.
+
+    Attributes:
+        :buckets: The upper bounds of the buckets.
+    """
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help)
+        self.buckets = tuple(buckets)
+        # Per label key: [count per bucket (+Inf last), sum, count]
+        self.__values = {}
+
+    def observe(self, value, **labels):
+        """Record an observation for the given labels (does nothing while the metrics are disabled)."""
+        if not self.registry.enabled:
+            return
+        key = _label_key(labels)
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self.__values.get(key)
+            if entry is None:
+                entry = [[0] * (len(self.buckets) + 1), 0, 0]
+                self.__values[key] = entry
+            entry[0][bucket] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels):
+        """Return a context manager which observes the duration of its with block."""
+        return _Timer(self, labels)
+
+    def render(self):
+        with self._lock:
+            values = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in self.__values.items()]
+        lines = []
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append('{}_bucket{} {}'.format(self.name, _format_labels(key, [('le', _format_value(bound))]), cumulative))
+            lines.append('{}_sum{} {}'.format(self.name, _format_labels(key), _format_value(total)))
+            lines.append('{}_count{} {}'.format(self.name, _format_labels(key), count))
+        return lines
+
+
+class Gauge(_Metric):
+    """A value which is read when the metrics are rendered (e.g. the chain height).
+
+    The function returns a number, or a dict which maps label dicts (as tuples of (name, value) pairs) to numbers.
+    """
+    kind = 'gauge'
+
+    def __init__(self, registry, name, help, function=None):
+        super().__init__(registry, name, help)
+        self.function = function
+
+    def render(self):
+        if self.function is None:
+            return []
+        value = self.function()
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return ['{}{} {}'.format(self.name, _format_labels(key), _format_value(number)) for key, number in value.items()]
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = perf_counter() if self.histogram.registry.enabled else None
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.start is not None:
+            self.histogram.observe(perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Metrics:
+    """The registry of all metrics of the node.
+
+    While the metrics are disabled, counters and histograms return right away (a single attribute check),
+    so the instrumentation can stay in the hot paths.
+
+    Attributes:
+        :enabled: Whether observations are recorded.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.__metrics = {}
+        self.__lock = threading.Lock()
+
+    def _register(self, metric_class, name, *args):
+        with self.__lock:
+            metric = self.__metrics.get(name)
+            if metric is None:
+                metric = metric_class(self, name, *args)
+                self.__metrics[name] = metric
+            return metric
+
+    def counter(self, name, help):
+        """Return the counter with the given name (created on first use)."""
+        return self._register(Counter, name, help)
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        """Return the histogram with the given name (created on first use)."""
+        return self._register(Histogram, name, help, buckets)
+
+    def gauge(self, name, help, function=None):
+        """Return the gauge with the given name (created on first use), function replaces its current function."""
+        metric = self._register(Gauge, name, help)
+        if function is not None:
+            metric.function = function
+        return metric
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        with self.__lock:
+            registered = sorted(self.__metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in registered:
+            try:
+                samples = metric.render()
+            except Exception as e:
+                print('Collecting metric {} failed: {}'.format(metric.name, e))
+                continue
+            lines.extend(metric.header())
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+def timed(histogram, **labels):
+    """Observe the duration of every call of the decorated function in a histogram."""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not histogram.registry.enabled:
+                return function(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+
+# The metrics of this process
+metrics = Metrics()
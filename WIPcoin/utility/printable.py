@@ -1,4 +1,6 @@
 class Printable:
-    """A base class which implements printing functionality."""
+    """A base class which implements printing functionality (based on the to_dict codec of the subclass)."""
+    __slots__ = ()
+
     def __repr__(self):
-        return str(self.__dict__)
+        return str(self.to_dict())
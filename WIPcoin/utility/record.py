@@ -0,0 +1,26 @@
+from utility.printable import Printable
+
+
+class Record(Printable):
+    """A base class for immutable records which keep their fields in __slots__ instead of a per-instance __dict__.
+
+    Subclasses list their fields in __slots__ and assign them once in their constructor with _set.
+    """
+    __slots__ = ()
+
+    def _set(self, name, value):
+        object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('{} is immutable'.format(type(self).__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError('{} is immutable'.format(type(self).__name__))
+
+    # Pickling (e.g. for the verification workers) restores the slots without going through __setattr__
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in type(self).__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            self._set(name, value)
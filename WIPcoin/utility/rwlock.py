@@ -0,0 +1,103 @@
+"""Provides a reader/writer lock for the state of the blockchain."""
+
+from contextlib import contextmanager
+from functools import wraps
+import threading
+
+
+class ReadWriteLock:
+    """A lock which is held by any number of readers or by a single writer.
+
+    Waiting writers are preferred over new readers, so a steady stream of reads can't starve the writer.
+    The writer may take the write lock again and take read locks (e.g. a mutation which looks up a balance),
+    readers may take the read lock again. Upgrading a read lock to the write lock isn't possible.
+    """
+
+    def __init__(self):
+        self.__condition = threading.Condition(threading.Lock())
+        self.__readers = 0
+        self.__writer = None
+        self.__write_depth = 0
+        self.__waiting_writers = 0
+        # The read depth of every thread and whether the thread is counted as a reader
+        self.__local = threading.local()
+
+    def acquire_read(self):
+        depth = getattr(self.__local, 'depth', 0)
+        if depth > 0 or self.__writer == threading.get_ident():
+            if depth == 0:
+                self.__local.counted = False
+            self.__local.depth = depth + 1
+            return
+        with self.__condition:
+            while self.__writer is not None or self.__waiting_writers > 0:
+                self.__condition.wait()
+            self.__readers += 1
+        self.__local.counted = True
+        self.__local.depth = 1
+
+    def release_read(self):
+        self.__local.depth -= 1
+        if self.__local.depth == 0 and self.__local.counted:
+            with self.__condition:
+                self.__readers -= 1
+                if self.__readers == 0:
+                    self.__condition.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        if self.__writer == me:
+            self.__write_depth += 1
+            return
+        if getattr(self.__local, 'depth', 0) > 0:
+            raise RuntimeError('A read lock can\'t be upgraded to the write lock')
+        with self.__condition:
+            self.__waiting_writers += 1
+            while self.__writer is not None or self.__readers > 0:
+                self.__condition.wait()
+            self.__waiting_writers -= 1
+            self.__writer = me
+            self.__write_depth = 1
+
+    def release_write(self):
+        self.__write_depth -= 1
+        if self.__write_depth == 0:
+            with self.__condition:
+                self.__writer = None
+                self.__condition.notify_all()
+
+    @contextmanager
+    def read(self):
+        """Hold the read lock within a with block."""
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        """Hold the write lock within a with block."""
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+def read_locked(method):
+    """Run a method while holding the read lock of its object (self.lock)."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock.read():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def write_locked(method):
+    """Run a method while holding the write lock of its object (self.lock)."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock.write():
+            return method(self, *args, **kwargs)
+    return wrapper
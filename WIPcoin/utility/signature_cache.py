@@ -0,0 +1,56 @@
+"""Provides a cache for the results of signature checks."""
+
+from collections import OrderedDict
+import threading
+
+
+class SignatureCache:
+    """A bounded LRU of signature check results keyed by (payload digest, signature).
+
+    Attributes:
+        :max_size: The number of results which are kept.
+        :hits: The number of lookups which were answered from the cache.
+        :misses: The number of lookups which required a real signature check.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__results = OrderedDict()
+        # Requests are handled in several threads which share the cache
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached result for a (payload digest, signature) pair or None if it's unknown."""
+        with self.__lock:
+            result = self.__results.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.__results.move_to_end(key)
+            return result
+
+    def put(self, key, result):
+        """Store the result of a signature check."""
+        with self.__lock:
+            self.__results[key] = result
+            self.__results.move_to_end(key)
+            if len(self.__results) > self.max_size:
+                self.__results.popitem(last=False)
+
+    def invalidate(self, key):
+        """Forget the result for a single (payload digest, signature) pair."""
+        with self.__lock:
+            self.__results.pop(key, None)
+
+    def clear(self):
+        """Forget all results (e.g. after a chain reorganization)."""
+        with self.__lock:
+            self.__results.clear()
+
+    def stats(self):
+        """Return the size and the hit/miss counters of the cache."""
+        with self.__lock:
+            return {'size': len(self.__results), 'hits': self.hits, 'misses': self.misses}
@@ -1,39 +1,153 @@
 """Provides verification helper methods."""
 
-from utility.hash_util import hash_string_256, hash_block
+import hashlib as hl
+from time import time
+
+from utility.difficulty import (DEFAULT_DIFFICULTY, MAX_FUTURE_BLOCK_TIME, RETARGET_INTERVAL, TARGET_BLOCK_TIME, expected_difficulty,
+                                median_time_past, target_for)
+from utility.hash_util import BLOCK_VERSION, LEGACY_BLOCK_VERSION
+from mempool import MAX_BLOCK_CHIPSACTIONS, MAX_BLOCK_TRANSACTIONS
 from wallet import Wallet
 
 class Verification:
     """A helper class which offer various static and class-based verification and validation methods."""
     @staticmethod
-    def valid_proof(transactions, chipsactions, last_hash, proof):
-        """Validate a proof of work number and see if it solves the puzzle algorithm (two leading 0s)
+    def proof_prefix(transactions, chipsactions, last_hash):
+        """Serialize the part of the proof of work input of a legacy block which doesn't depend on the proof number.
+
+        Arguments:
+            :transactions: The transactions of the block for which the proof is created.
+            :chipsactions: The chipsactions of the block for which the proof is created.
+            :last_hash: The previous block's hash which will be stored in the current block.
+        """
+        return (str([tx.to_ordered_dict() for tx in transactions]) + str([tx.to_ordered_dict() for tx in chipsactions]) + str(last_hash)).encode()
+
+    @staticmethod
+    def valid_hash(digest, target):
+        """Check whether a proof of work hash solves the puzzle algorithm (the hash as a number is below the target).
+
+        Arguments:
+            :digest: The raw sha256 digest (bytes) of the proof of work input.
+            :target: The integer target of the block's difficulty (see utility.difficulty.target_for).
+        """
+        return int.from_bytes(digest, 'big') < target
+
+    @classmethod
+    def valid_proof(cls, block):
+        """Validate the proof of work of a block: the hash of its header has to be below the difficulty's target.
+
+        The header commits to the transactions and chipsactions through the Merkle root, so they aren't serialized again.
+
+        Arguments:
+            :block: The block whose proof is checked.
+        """
+        if block.version == LEGACY_BLOCK_VERSION:
+            # The last transaction is the mining reward which was added after the proof was found
+            return cls.valid_legacy_proof(block.transactions[:-1], block.chipsactions, block.previous_hash, block.proof, block.difficulty)
+        return cls.valid_hash(bytes.fromhex(block.hash), target_for(block.difficulty))
+
+    @staticmethod
+    def valid_version(block, previous_version):
+        """Check whether a block has a known version which isn't older than the one of the block before it."""
+        return block.version in (LEGACY_BLOCK_VERSION, BLOCK_VERSION) and block.version >= previous_version
+
+    @staticmethod
+    def valid_size(block, max_transactions=MAX_BLOCK_TRANSACTIONS, max_chipsactions=MAX_BLOCK_CHIPSACTIONS):
+        """Check whether a block stays within the limits of transactions and chipsactions a block may contain.
+
+        Arguments:
+            :block: The block which should be checked.
+            :max_transactions: The maximum number of transactions (without the reward, the last transaction).
+            :max_chipsactions: The maximum number of chipsactions.
+        """
+        return len(block.transactions) - 1 <= max_transactions and len(block.chipsactions) <= max_chipsactions
+
+    @staticmethod
+    def valid_timestamp(block, chain, height, now=None):
+        """Check whether the timestamp of a block is later than the median of the blocks before it and not too far ahead of our clock.
+
+        Legacy blocks are exempt: blocks migrated from the oldest storage format all share one timestamp.
+
+        Arguments:
+            :block: The block whose timestamp is checked.
+            :chain: The blocks preceding (at least) the block's height.
+            :height: The height of the block.
+            :now: The current time (defaults to our clock).
+        """
+        if block.version == LEGACY_BLOCK_VERSION:
+            return True
+        if block.timestamp > (time() if now is None else now) + MAX_FUTURE_BLOCK_TIME:
+            return False
+        return block.timestamp > median_time_past(chain, height)
+
+    @classmethod
+    def valid_legacy_proof(cls, transactions, chipsactions, last_hash, proof, difficulty=DEFAULT_DIFFICULTY):
+        """Validate the proof of work number of a legacy block and see if it solves the puzzle algorithm (hash below the difficulty's target)
 
         Arguments:
             :transactions: The transactions of the block for which the proof is created.
             :last_hash: The previous block's hash which will be stored in the current block.
             :proof: The proof number we're testing.
+            :difficulty: The difficulty the proof has to meet.
         """
         # Create a string with all the hash inputs
-        guess = (str([tx.to_ordered_dict() for tx in transactions]) + str([tx.to_ordered_dict() for tx in chipsactions]) + str(last_hash) + str(proof)).encode()
+        guess = cls.proof_prefix(transactions, chipsactions, last_hash) + str(proof).encode()
         # Hash the string
         # IMPORTANT: This is NOT the same hash as will be stored in the previous_hash. It's a not a block's hash. It's only used for the proof-of-work algorithm.
-        guess_hash = hash_string_256(guess)
-        # Only a hash (which is based on the above inputs) which starts with two 0s is treated as valid
-        # This condition is of course defined by you. You could also require 10 leading 0s - this would take significantly longer (and this allows you to control the speed at which new blocks can be added)
-        return guess_hash[0:2] == '00'
-        
+        guess_hash = hl.sha256(guess).digest()
+        # Only a hash (which is based on the above inputs) which is below the target is treated as valid
+        # Raising the difficulty lowers the target, so it takes significantly longer to find a proof (this allows you to control the speed at which new blocks can be added)
+        return cls.valid_hash(guess_hash, target_for(difficulty))
+
     @classmethod
-    def verify_chain(cls, blockchain):
-        """ Verify the current blockchain and return True if it's valid, False otherwise."""
-        for (index, block) in enumerate(blockchain):
-            if index == 0:
-                continue
-            if block.previous_hash != hash_block(blockchain[index - 1]):
+    def verify_chain(cls, blockchain, retarget_interval=RETARGET_INTERVAL, target_block_time=TARGET_BLOCK_TIME, verifier=None, start=1,
+                     parallel=False, progress=None, max_transactions=MAX_BLOCK_TRANSACTIONS, max_chipsactions=MAX_BLOCK_CHIPSACTIONS):
+        """ Verify the current blockchain and return True if it's valid, False otherwise.
+
+        Arguments:
+            :blockchain: The blocks that should be verified.
+            :start: The height of the first block that is checked (the blocks before are trusted).
+            :retarget_interval: The number of blocks after which the difficulty is adjusted.
+            :target_block_time: The number of seconds we want to pass between two blocks.
+            :verifier: An optional BatchVerifier which additionally checks all signatures of the chain.
+            :parallel: Whether the chain is split into ranges which the verifier's worker processes check (see BatchVerifier.verify_chain).
+            :progress: An optional function which is called with the height up to which the chain was validated.
+            :max_transactions: The maximum number of transactions (without the reward) a block may contain.
+            :max_chipsactions: The maximum number of chipsactions a block may contain.
+        """
+        if parallel and verifier != None:
+            return verifier.verify_chain(blockchain, start, retarget_interval, target_block_time, progress=progress,
+                                         max_transactions=max_transactions, max_chipsactions=max_chipsactions)
+        # Every header is hashed once, its hash is compared with the previous_hash of the next block and the target
+        previous = blockchain[max(start, 1) - 1]
+        previous_hash = previous.hash
+        previous_version = previous.version
+        for index in range(max(start, 1), len(blockchain)):
+            block = blockchain[index]
+            if block.index != index or block.previous_hash != previous_hash:
+                return False
+            if not cls.valid_version(block, previous_version):
+                print('Block version is invalid')
+                return False
+            previous_hash = block.hash
+            previous_version = block.version
+            if not cls.valid_size(block, max_transactions, max_chipsactions):
+                print('Block is too large')
                 return False
-            if not cls.valid_proof(block.transactions[:-1], block.chipsactions, block.previous_hash, block.proof):
+            if block.difficulty != expected_difficulty(blockchain, index, retarget_interval, target_block_time):
+                print('Difficulty is invalid')
+                return False
+            if not cls.valid_timestamp(block, blockchain, index):
+                print('Timestamp is invalid')
+                return False
+            if not cls.valid_proof(block):
                 print('Proof of work is invalid')
                 return False
+        if verifier != None and not verifier.verify_blocks(blockchain[max(start, 1):]):
+            print('Signatures are invalid')
+            return False
+        if progress is not None and len(blockchain) > max(start, 1):
+            progress(len(blockchain) - 1)
         return True
 
     @staticmethod
@@ -70,4 +184,22 @@ class Verification:
     @classmethod
     def verify_chipsactions(cls, open_chipsactions, get_balance):
         """Verifies all open chipsactions."""
-        return all([cls.verify_chipsaction(tx, get_balance, False) for tx in open_chipsactions])
\ No newline at end of file
+        return all([cls.verify_chipsaction(tx, get_balance, False) for tx in open_chipsactions])
+
+    @staticmethod
+    def signature_cache_stats():
+        """Return the size and hit/miss counters of the signature cache."""
+        return Wallet.signature_cache.stats()
+
+    @staticmethod
+    def invalidate_signatures(transactions, chipsactions):
+        """Drop the cached signature results of transactions and chipsactions (e.g. ones discarded by a chain reorganization)."""
+        for tx in transactions:
+            Wallet.signature_cache.invalidate((Wallet.transaction_digest(tx).digest(), tx.signature))
+        for tx in chipsactions:
+            Wallet.signature_cache.invalidate((Wallet.chipsaction_digest(tx).digest(), tx.signature))
+
+    @staticmethod
+    def clear_signature_cache():
+        """Drop all cached signature results."""
+        Wallet.signature_cache.clear()
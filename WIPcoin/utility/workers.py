@@ -0,0 +1,15 @@
+"""Provides the multiprocessing context the worker pools are started with."""
+
+import multiprocessing
+
+
+def worker_context():
+    """Return the multiprocessing context of the mining and verification pools.
+
+    The pools are created lazily, when the server and broadcast threads are already running. A forked worker
+    inherits the locks those threads hold at that moment (e.g. the lock of Wallet.signature_cache) and nobody
+    ever releases them in the worker. So the workers are started by a fork server instead (or spawned where
+    there is none), they begin with a fresh interpreter.
+    """
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(method)
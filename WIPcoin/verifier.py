@@ -0,0 +1,228 @@
+import multiprocessing
+
+from wallet import Wallet
+from mempool import MAX_BLOCK_CHIPSACTIONS, MAX_BLOCK_TRANSACTIONS
+from utility.difficulty import RETARGET_INTERVAL, TARGET_BLOCK_TIME, expected_difficulty
+from utility.metrics import metrics
+from utility.verification import Verification
+from utility.workers import worker_context
+
+# The number of blocks a worker verifies per task when a whole chain is verified in parallel
+CHAIN_CHUNK_SIZE = 50
+
+BATCH_VERIFICATION_SECONDS = metrics.histogram('wipcoin_batch_verification_seconds', 'Duration of verifying batches of signatures.')
+BATCH_SIGNATURES = metrics.counter('wipcoin_batch_signatures_total', 'Number of signatures verified in batches.')
+
+
+def verify_item(kind, tx):
+    """Verify the signature of a single transaction or chipsaction (malformed keys or signatures count as invalid).
+
+    Arguments:
+        :kind: Either 'transaction' or 'chipsaction'.
+        :tx: The transaction or chipsaction that should be verified.
+    """
+    try:
+        if kind == 'transaction':
+            return Wallet.verify_transaction(tx)
+        return Wallet.verify_chipsaction(tx)
+    except (ValueError, TypeError, IndexError):
+        return False
+
+
+def _verify_chunk(items):
+    return [verify_item(kind, tx) for kind, tx in items]
+
+
+_stop_event = None
+
+
+def _init_worker(stop_event):
+    global _stop_event
+    _stop_event = stop_event
+
+
+def verify_range(previous, blocks, check_signatures=True, stop_event=None):
+    """Verify consecutive blocks and return the height of the first invalid one (None if all are valid or the check was stopped).
+
+    Every block has to follow the one before it (index, previous_hash and version) and meet its proof of work.
+
+    Arguments:
+        :previous: The block before the first block of the range (it's trusted).
+        :blocks: The blocks that should be verified.
+        :check_signatures: Whether the signatures of the transactions and chipsactions are verified as well.
+        :stop_event: An optional event which aborts the check once it is set (because another range failed).
+    """
+    for block in blocks:
+        if stop_event is not None and stop_event.is_set():
+            return None
+        if block.index != previous.index + 1 or block.previous_hash != previous.hash:
+            return block.index
+        if not Verification.valid_version(block, previous.version) or not Verification.valid_proof(block):
+            return block.index
+        # The last transaction is the mining reward which isn't signed
+        if check_signatures and not (all(verify_item('transaction', tx) for tx in block.transactions[:-1]) and
+                                     all(verify_item('chipsaction', tx) for tx in block.chipsactions)):
+            return block.index
+        previous = block
+    return None
+
+
+def _verify_range_worker(task):
+    chunk, previous, blocks, check_signatures = task
+    invalid_height = verify_range(previous, blocks, check_signatures, _stop_event)
+    # A stopped range wasn't checked completely
+    return chunk, invalid_height, _stop_event.is_set()
+
+
+def cache_key(kind, tx):
+    """Return the (payload digest, signature) key of a transaction or chipsaction in Wallet.signature_cache."""
+    h = Wallet.transaction_digest(tx) if kind == 'transaction' else Wallet.chipsaction_digest(tx)
+    return (h.digest(), tx.signature)
+
+
+class BatchVerifier:
+    """Verifies the signatures of batches of transactions and chipsactions.
+
+    Small batches are verified in the calling process, larger ones are split into chunks which are
+    verified in a pool of worker processes. Every process keeps its own cache of parsed public keys
+    (see Wallet.import_public_key), only signatures which aren't in Wallet.signature_cache are sent to the pool.
+
+    Attributes:
+        :workers: The number of worker processes.
+        :parallel_threshold: The batch size from which on the worker pool is used.
+        :chunk_size: The number of signatures a worker verifies per task.
+        :chain_chunk_size: The number of blocks a worker verifies per task (see verify_chain).
+    """
+
+    def __init__(self, workers=None, parallel_threshold=32, chunk_size=16, chain_chunk_size=CHAIN_CHUNK_SIZE):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.parallel_threshold = parallel_threshold
+        self.chunk_size = chunk_size
+        self.chain_chunk_size = chain_chunk_size
+        # Forked workers could inherit the lock of Wallet.signature_cache while another thread holds it (see worker_context)
+        self.__context = worker_context()
+        self.__stop_event = self.__context.Event()
+        self.__pool = None
+
+    def _get_pool(self):
+        if self.__pool is None:
+            self.__pool = self.__context.Pool(self.workers, initializer=_init_worker, initargs=(self.__stop_event,))
+        return self.__pool
+
+    def close(self):
+        """Shut down the worker processes."""
+        if self.__pool is not None:
+            self.__pool.terminate()
+            self.__pool = None
+
+    def verify(self, transactions, chipsactions):
+        """Verify a batch and return the per-item results as (transaction results, chipsaction results).
+
+        Arguments:
+            :transactions: The transactions that should be verified.
+            :chipsactions: The chipsactions that should be verified.
+        """
+        items = [('transaction', tx) for tx in transactions] + [('chipsaction', tx) for tx in chipsactions]
+        parallel = self.workers > 1 and len(items) >= self.parallel_threshold
+        with BATCH_VERIFICATION_SECONDS.time(mode='parallel' if parallel else 'serial'):
+            results = self._verify_parallel(items) if parallel else _verify_chunk(items)
+        BATCH_SIGNATURES.inc(len(items))
+        return results[:len(transactions)], results[len(transactions):]
+
+    def _verify_parallel(self, items):
+        keys = [cache_key(kind, tx) for kind, tx in items]
+        results = [Wallet.signature_cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        missing_items = [items[i] for i in missing]
+        chunks = [missing_items[i:i + self.chunk_size] for i in range(0, len(missing_items), self.chunk_size)]
+        checked = [result for chunk in self._get_pool().map(_verify_chunk, chunks) for result in chunk]
+        for i, result in zip(missing, checked):
+            results[i] = result
+            Wallet.signature_cache.put(keys[i], result)
+        return results
+
+    def verify_all(self, transactions, chipsactions):
+        """Return True if every transaction and chipsaction of the batch has a valid signature."""
+        transaction_results, chipsaction_results = self.verify(transactions, chipsactions)
+        return all(transaction_results) and all(chipsaction_results)
+
+    def verify_blocks(self, blocks):
+        """Return True if all signatures of the given blocks are valid (the mining reward is skipped)."""
+        transactions = []
+        chipsactions = []
+        for block in blocks:
+            transactions.extend(block.transactions[:-1])
+            chipsactions.extend(block.chipsactions)
+        return self.verify_all(transactions, chipsactions)
+
+    def _range_tasks(self, blockchain, start, retarget_interval, target_block_time, check_signatures, failed, max_transactions,
+                     max_chipsactions):
+        """Yield the ranges of the chain as worker tasks, the sizes, difficulties and timestamps are checked here while the ranges are cut.
+
+        An invalid block is recorded in failed and ends the tasks, so is a stop.
+        """
+        for chunk_start in range(start, len(blockchain), self.chain_chunk_size):
+            if self.__stop_event.is_set():
+                return
+            blocks = [blockchain[index] for index in range(chunk_start, min(chunk_start + self.chain_chunk_size, len(blockchain)))]
+            for height, block in enumerate(blocks, chunk_start):
+                if not Verification.valid_size(block, max_transactions, max_chipsactions):
+                    print('Block is too large')
+                    failed.append(block.index)
+                    self.__stop_event.set()
+                    return
+                # The claimed index is only checked by the worker, the difficulty depends on the position
+                if block.difficulty != expected_difficulty(blockchain, height, retarget_interval, target_block_time):
+                    print('Difficulty is invalid')
+                    failed.append(block.index)
+                    self.__stop_event.set()
+                    return
+                if not Verification.valid_timestamp(block, blockchain, height):
+                    print('Timestamp is invalid')
+                    failed.append(block.index)
+                    self.__stop_event.set()
+                    return
+            yield chunk_start, blockchain[chunk_start - 1], blocks, check_signatures
+
+    def verify_chain(self, blockchain, start=1, retarget_interval=RETARGET_INTERVAL, target_block_time=TARGET_BLOCK_TIME,
+                     check_signatures=True, progress=None, max_transactions=MAX_BLOCK_TRANSACTIONS, max_chipsactions=MAX_BLOCK_CHIPSACTIONS):
+        """Verify a chain by splitting it into ranges which are checked in the worker processes and return True if it's valid.
+
+        Every range is checked independently (hash linkage, versions, proofs of work and optionally signatures), because
+        the block before a range is sent along with it. The first invalid block stops all ranges which are still checked.
+
+        Arguments:
+            :blockchain: The blocks that should be verified.
+            :start: The height of the first block that is checked (the blocks before are trusted).
+            :retarget_interval: The number of blocks after which the difficulty is adjusted.
+            :target_block_time: The number of seconds we want to pass between two blocks.
+            :check_signatures: Whether the signatures of the transactions and chipsactions are verified as well.
+            :progress: An optional function which is called with the height up to which the chain was validated.
+            :max_transactions: The maximum number of transactions (without the reward) a block may contain.
+            :max_chipsactions: The maximum number of chipsactions a block may contain.
+        """
+        start = max(start, 1)
+        if start >= len(blockchain):
+            return True
+        self.__stop_event.clear()
+        failed = []
+        tasks = self._range_tasks(blockchain, start, retarget_interval, target_block_time, check_signatures, failed, max_transactions,
+                                  max_chipsactions)
+        # The ranges finish in any order, the progress only moves over the ranges which all finished
+        finished = set()
+        validated = start - 1
+        with BATCH_VERIFICATION_SECONDS.time(mode='chain'):
+            for chunk, invalid_height, stopped in self._get_pool().imap_unordered(_verify_range_worker, tasks):
+                if invalid_height is not None:
+                    print('Block {} is invalid'.format(invalid_height))
+                    self.__stop_event.set()
+                    return False
+                if stopped:
+                    continue
+                finished.add(chunk)
+                while validated + 1 in finished:
+                    finished.remove(validated + 1)
+                    validated = min(validated + self.chain_chunk_size, len(blockchain) - 1)
+                    if progress is not None:
+                        progress(validated)
+        return len(failed) == 0
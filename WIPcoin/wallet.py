@@ -3,11 +3,25 @@ from Crypto.Signature import PKCS1_v1_5
 from Crypto.Hash import SHA256
 import Crypto.Random
 import binascii
+from functools import lru_cache
+
+from utility.signature_cache import SignatureCache
+from utility.metrics import metrics
+
+# The number of parsed public keys which are kept in memory
+PUBLIC_KEY_CACHE_SIZE = 1024
+# The number of signature check results which are kept in memory
+SIGNATURE_CACHE_SIZE = 10000
+
+SIGNATURE_CHECK_SECONDS = metrics.histogram('wipcoin_signature_check_seconds', 'Duration of signature checks which missed the cache.')
 
 
 class Wallet:
     """Creates, loads and holds private and public keys. Manages transaction signing and verification."""
 
+    # Results of signature checks, so the same transaction isn't checked over and over again
+    signature_cache = SignatureCache(SIGNATURE_CACHE_SIZE)
+
     def __init__(self, node_id):
         self.private_key = None
         self.public_key = None
@@ -80,6 +94,44 @@ class Wallet:
         signature = signer.sign(h)
         return binascii.hexlify(signature).decode('ascii')
 
+    @staticmethod
+    @lru_cache(maxsize=PUBLIC_KEY_CACHE_SIZE)
+    def import_public_key(public_key):
+        """Parse a hex encoded public key (parsed keys are cached, senders usually send more than once).
+
+        Arguments:
+            :public_key: The hex encoded public key.
+        """
+        return RSA.importKey(binascii.unhexlify(public_key))
+
+    @staticmethod
+    def transaction_digest(transaction):
+        """Return the sha256 digest of the signed payload of a transaction."""
+        return SHA256.new((str(transaction.sender) + str(transaction.recipient) + str(transaction.amount)).encode('utf8'))
+
+    @staticmethod
+    def chipsaction_digest(chipsaction):
+        """Return the sha256 digest of the signed payload of a chipsaction."""
+        return SHA256.new((str(chipsaction.sender) + str(chipsaction.recipient) + str(chipsaction.placeID) + str(chipsaction.message) + str(chipsaction.amount)).encode('utf8'))
+
+    @staticmethod
+    def verify_signature(sender, h, signature):
+        """Verify a signature of a payload digest, results are looked up in and stored to the signature cache.
+
+        Arguments:
+            :sender: The hex encoded public key of the signer.
+            :h: The sha256 digest of the signed payload.
+            :signature: The hex encoded signature.
+        """
+        key = (h.digest(), signature)
+        result = Wallet.signature_cache.get(key)
+        if result is None:
+            with SIGNATURE_CHECK_SECONDS.time():
+                verifier = PKCS1_v1_5.new(Wallet.import_public_key(sender))
+                result = verifier.verify(h, binascii.unhexlify(signature))
+            Wallet.signature_cache.put(key, result)
+        return result
+
     @staticmethod
     def verify_transaction(transaction):
         """Verify the signature of a transaction.
@@ -87,10 +139,7 @@ class Wallet:
         Arguments:
             :transaction: The transaction that should be verified.
         """
-        public_key = RSA.importKey(binascii.unhexlify(transaction.sender))
-        verifier = PKCS1_v1_5.new(public_key)
-        h = SHA256.new((str(transaction.sender) + str(transaction.recipient) + str(transaction.amount)).encode('utf8'))
-        return verifier.verify(h, binascii.unhexlify(transaction.signature))
+        return Wallet.verify_signature(transaction.sender, Wallet.transaction_digest(transaction), transaction.signature)
 
     @staticmethod
     def verify_chipsaction(chipsaction):
@@ -99,7 +148,4 @@ class Wallet:
         Arguments:
             :chipsaction: The chipnsaction that should be verified.
         """
-        public_key = RSA.importKey(binascii.unhexlify(chipsaction.sender))
-        verifier = PKCS1_v1_5.new(public_key)
-        h = SHA256.new((str(chipsaction.sender) + str(chipsaction.recipient) + str(chipsaction.placeID) + str(chipsaction.message) + str(chipsaction.amount)).encode('utf8'))
-        return verifier.verify(h, binascii.unhexlify(chipsaction.signature))
\ No newline at end of file
+        return Wallet.verify_signature(chipsaction.sender, Wallet.chipsaction_digest(chipsaction), chipsaction.signature)